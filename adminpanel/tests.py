@@ -9,12 +9,26 @@ os.environ["ENVIRONMENT"] = "test"
 from config import app
 from flask_sqlalchemy import SQLAlchemy
 from cluster_analysis import ClusterAnalysis, mark_of_question
-from sqlalchemy import create_engine, select
+from sqlalchemy import Computed, create_engine, select
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Session
 from models import *
 from datetime import datetime, timedelta
 
 
+# в тестовой БД SQLite нет полнотекстового поиска Postgres,
+# поэтому chunk.text_search создаётся в ней обычным текстовым столбцом
+@compiles(TSVECTOR, "sqlite")
+def compile_tsvector_sqlite(element, compiler, **kw):
+    return "TEXT"
+
+
+@compiles(Computed, "sqlite")
+def compile_computed_sqlite(element, compiler, **kw):
+    return ""
+
+
 class TestClusterAnalysis:
     """Класс с функцией тестирования анализа вопросов"""
 
@@ -11,6 +11,8 @@ class Config:
     VK_ACCESS_GROUP_TOKEN = environ.get("VK_ACCESS_GROUP_TOKEN")
     TG_ACCESS_TOKEN = environ.get("TG_ACCESS_TOKEN")
     QA_HOST = environ.get("QA_HOST")
+    QA_STREAMING = environ.get("QA_STREAMING", "true").lower() == "true"
+    STREAM_EDIT_INTERVAL = float(environ.get("STREAM_EDIT_INTERVAL", 1.5))
     CONFLUENCE_TOKEN = environ.get("CONFLUENCE_TOKEN")
     CONFLUENCE_HOST = environ.get("CONFLUENCE_HOST")
     CONFLUENCE_SPACES = (
@@ -3,6 +3,8 @@ import json
 import logging
 import math
 from multiprocessing import Process
+import time
+from typing import Awaitable, Callable
 import aiogram as tg
 from aiohttp import web
 from sqlalchemy import create_engine
@@ -282,17 +284,26 @@ async def tg_subscribe(message: tg.types.Message):
         )
 
 
-async def get_answer(question: str) -> tuple[str, str | None]:
+async def get_answer(
+    question: str, on_progress: Callable[[str], Awaitable[None]] | None = None
+) -> tuple[str, str | None]:
     """Получение ответа на вопрос с использованием микросервиса
 
+    Если задан `on_progress` и включён `Config.QA_STREAMING`, ответ запрашивается
+    по мере генерации, а `on_progress` вызывается с уже полученной частью ответа
+    не чаще, чем раз в `Config.STREAM_EDIT_INTERVAL` секунд
+
     Args:
         question (str): вопрос пользователя
+        on_progress (Callable[[str], Awaitable[None]] | None): обработчик полученной части ответа
 
     Returns:
         tuple[str, str | None]: ответ на вопрос и ссылка на страницу в вики-системе
     """
 
     question = question.strip().lower()
+    if on_progress is not None and Config.QA_STREAMING:
+        return await get_answer_streaming(question, on_progress)
     async with aiohttp.ClientSession() as session:
         async with session.post(
             f"http://{Config.QA_HOST}/qa/", json={"question": question}
@@ -304,6 +315,43 @@ async def get_answer(question: str) -> tuple[str, str | None]:
                 return ("", None)
 
 
+async def get_answer_streaming(
+    question: str, on_progress: Callable[[str], Awaitable[None]]
+) -> tuple[str, str | None]:
+    """Получение ответа на вопрос с использованием микросервиса по мере его генерации
+
+    Args:
+        question (str): вопрос пользователя
+        on_progress (Callable[[str], Awaitable[None]]): обработчик полученной части ответа
+
+    Returns:
+        tuple[str, str | None]: ответ на вопрос и ссылка на страницу в вики-системе
+    """
+
+    partial_answer = ""
+    last_progress = time.monotonic()
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            f"http://{Config.QA_HOST}/qa/stream/", json={"question": question}
+        ) as response:
+            if response.status != 200:
+                return ("", None)
+            async for line in response.content:
+                if len(line.strip()) == 0:
+                    continue
+                event = json.loads(line)
+                if "delta" not in event:
+                    return event["answer"], event["confluence_url"]
+                partial_answer += event["delta"]
+                if time.monotonic() - last_progress >= Config.STREAM_EDIT_INTERVAL:
+                    last_progress = time.monotonic()
+                    try:
+                        await on_progress(partial_answer.strip())
+                    except Exception as e:
+                        logging.warning(e)
+    return ("", None)
+
+
 @vk_bot.on.message()
 async def vk_answer(message: VKMessage):
     """Обработчик события (для чат-бота ВКонтакте), при котором пользователь задаёт
@@ -338,7 +386,18 @@ async def vk_answer(message: VKMessage):
         await message.answer(message=Strings.SpamWarning, random_id=0)
         return
     processing = await message.answer(message=Strings.TryFindAnswer, random_id=0)
-    answer, confluence_url = await get_answer(message.text)
+
+    async def show_progress(partial_answer: str):
+        await vk_bot.api.messages.edit(
+            peer_id=message.peer_id,
+            message_id=processing.message_id,
+            message=f"{partial_answer}...",
+        )
+
+    answer, confluence_url = await get_answer(
+        message.text,
+        show_progress if processing.message_id is not None else None,
+    )
     question_answer_id = add_question_answer(
         engine, message.text, answer, confluence_url, user_id
     )
@@ -423,7 +482,15 @@ async def tg_answer(message: tg.types.Message):
         await message.answer(text=Strings.SpamWarning)
         return
     processing = await message.answer(Strings.TryFindAnswer)
-    answer, confluence_url = await get_answer(message.text)
+
+    async def show_progress(partial_answer: str):
+        await tg_bot.edit_message_text(
+            text=f"{partial_answer}...",
+            chat_id=message["chat"]["id"],
+            message_id=processing["message_id"],
+        )
+
+    answer, confluence_url = await get_answer(message.text, show_progress)
     question_answer_id = add_question_answer(
         engine, message.text, answer, confluence_url, user_id
     )
@@ -1,6 +1,14 @@
-﻿import pytest
+﻿import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable
+from unittest.mock import AsyncMock, MagicMock, patch
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+import pytest
 from sqlalchemy import create_engine, select
 from sqlalchemy.orm import Session
+from config import Config
 from database import (
     Base,
     QuestionAnswer,
@@ -13,6 +21,7 @@ from database import (
     add_question_answer,
     rate_answer,
 )
+import main
 
 
 class TestDBFunctions:
@@ -140,3 +149,165 @@ class TestDBFunctions:
                 qa.created_at = qa.created_at.replace(year=2020)
             session.commit()
         assert check_spam(self.engine, user_id) is False
+
+
+class TestAnswerStreaming:
+    """Класс с функциями тестирования получения ответа от микросервиса QA
+    по мере его генерации"""
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+
+    deltas = [{"delta": "Отв"}, {"delta": "ет "}, {"delta": "на вопрос"}]
+    final = {"answer": "Ответ на вопрос", "confluence_url": "confluence.com"}
+
+    def ask(
+        self,
+        events: list[dict],
+        client: Callable[[], Awaitable],
+        status: int = 200,
+        pause: float = 0,
+    ) -> tuple[Any, list[str]]:
+        """Запускает `client` при заменителе микросервиса QA, который отвечает на
+        `/qa/stream/` строками `events` в формате NDJSON с паузой `pause` секунд
+        перед каждой строкой
+
+        Args:
+            events (list[dict]): отправляемые строки ответа
+            client (Callable[[], Awaitable]): запрашивающая ответ корутинная функция
+            status (int): код ответа
+            pause (float): пауза перед каждой строкой в секундах
+
+        Returns:
+            tuple[Any, list[str]]: результат `client` и полученные заменителем вопросы
+        """
+
+        questions = []
+
+        async def stream(request: web.Request) -> web.StreamResponse:
+            questions.append((await request.json())["question"])
+            if status != 200:
+                return web.Response(status=status)
+            response = web.StreamResponse()
+            response.content_type = "application/x-ndjson"
+            await response.prepare(request)
+            for event in events:
+                await asyncio.sleep(pause)
+                await response.write(json.dumps(event).encode() + b"\n\n")
+            await response.write_eof()
+            return response
+
+        async def run():
+            app = web.Application()
+            app.router.add_post("/qa/stream/", stream)
+            async with TestServer(app) as server:
+                with patch.object(Config, "QA_HOST", f"{server.host}:{server.port}"):
+                    return await client()
+
+        with patch.object(Config, "QA_STREAMING", True):
+            return asyncio.run(run()), questions
+
+    def test_get_answer_streaming(self):
+        """Тест получения частей и итоговой строки ответа"""
+
+        progress = []
+
+        async def on_progress(partial_answer: str):
+            progress.append(partial_answer)
+
+        with patch.object(Config, "STREAM_EDIT_INTERVAL", 0):
+            answer, questions = self.ask(
+                self.deltas + [self.final],
+                lambda: main.get_answer(" Вопрос? ", on_progress),
+            )
+        assert answer == (self.final["answer"], self.final["confluence_url"])
+        assert questions == ["вопрос?"]
+        assert progress == ["Отв", "Ответ", "Ответ на вопрос"]
+
+    def test_stream_without_final(self):
+        """Тест ответа, оборвавшегося без итоговой строки, и ответа с ошибкой"""
+
+        progress = []
+
+        async def on_progress(partial_answer: str):
+            progress.append(partial_answer)
+
+        with patch.object(Config, "STREAM_EDIT_INTERVAL", 0):
+            answer, _ = self.ask(
+                self.deltas, lambda: main.get_answer_streaming("вопрос", on_progress)
+            )
+            assert answer == ("", None)
+            assert len(progress) == len(self.deltas)
+            answer, _ = self.ask(
+                [self.final],
+                lambda: main.get_answer_streaming("вопрос", on_progress),
+                status=500,
+            )
+            assert answer == ("", None)
+
+    def test_stream_edit_interval(self):
+        """Тест отображения части ответа не чаще, чем раз в
+        `Config.STREAM_EDIT_INTERVAL` секунд, в том числе при ошибке отображения"""
+
+        progress = []
+
+        async def on_progress(partial_answer: str):
+            progress.append((time.monotonic(), partial_answer))
+            if len(progress) == 1:
+                raise Exception("сообщение не изменено")
+
+        start = time.monotonic()
+        with patch.object(Config, "STREAM_EDIT_INTERVAL", 0.25):
+            answer, _ = self.ask(
+                self.deltas + [self.final],
+                lambda: main.get_answer_streaming("вопрос", on_progress),
+                pause=0.1,
+            )
+        assert answer == (self.final["answer"], self.final["confluence_url"])
+        assert [partial_answer for _, partial_answer in progress] == ["Ответ на вопрос"]
+        assert progress[0][0] - start >= 0.25
+
+    def test_progress_edits(self):
+        """Тест изменения сообщения о поиске ответа частями ответа в чат-ботах
+        ВКонтакте и Telegram и его удаления после получения ответа"""
+
+        class TGMessage(dict):
+            pass
+
+        add_user(self.engine, 1, None)
+        add_user(self.engine, None, 1)
+        edits = [
+            f"{partial_answer}..."
+            for partial_answer in ["Отв", "Ответ", "Ответ на вопрос"]
+        ]
+        vk_message = MagicMock(from_id=1, peer_id=2, text="Как оформить отпуск?")
+        vk_message.answer = AsyncMock(return_value=MagicMock(message_id=3))
+        tg_message = TGMessage(
+            {"from": {"id": 1}, "chat": {"id": 5}, "text": vk_message.text}
+        )
+        tg_message.text = vk_message.text
+        tg_message.answer = AsyncMock(return_value={"message_id": 4})
+        with (
+            patch.object(main, "engine", self.engine),
+            patch.object(main, "vk_bot") as vk_bot,
+            patch.object(main, "tg_bot") as tg_bot,
+            patch.object(Config, "STREAM_EDIT_INTERVAL", 0),
+        ):
+            vk_bot.api.messages.edit = AsyncMock()
+            vk_bot.api.messages.delete = AsyncMock()
+            tg_bot.edit_message_text = AsyncMock()
+            tg_bot.delete_message = AsyncMock()
+            self.ask(self.deltas + [self.final], lambda: main.vk_answer(vk_message))
+            self.ask(self.deltas + [self.final], lambda: main.tg_answer(tg_message))
+        assert [call.kwargs for call in vk_bot.api.messages.edit.mock_calls] == [
+            {"peer_id": 2, "message_id": 3, "message": edit} for edit in edits
+        ]
+        vk_bot.api.messages.delete.assert_awaited_once()
+        answer = vk_message.answer.mock_calls[-1].kwargs["message"]
+        assert answer.startswith(self.final["answer"])
+        assert [call.kwargs for call in tg_bot.edit_message_text.mock_calls] == [
+            {"text": edit, "chat_id": 5, "message_id": 4} for edit in edits
+        ]
+        tg_bot.delete_message.assert_awaited_once_with(5, 4)
+        answer = tg_message.answer.mock_calls[-1].kwargs["text"]
+        assert answer.startswith(self.final["answer"])
@@ -34,6 +34,18 @@ except ImportError as e:
     BaseDBModel = None
     target_metadata = None
 
+# HNSW-индексы режимов поиска VECTOR_SEARCH_MODE создаются и удаляются
+# микросервисом qa, поэтому autogenerate не должен их удалять
+VECTOR_SEARCH_INDEXES = (
+    "ix_chunk_embedding_halfvec_hnsw",
+    "ix_chunk_embedding_binary_hnsw",
+)
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    return not (type_ == "index" and name in VECTOR_SEARCH_INDEXES)
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -58,6 +70,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=database_url,
         target_metadata=target_metadata,
+        include_object=include_object,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -80,7 +93,11 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         connection.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
-        context.configure(connection=connection, target_metadata=target_metadata)
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,34 @@
+"""add halfvec hnsw index on chunk embedding
+
+Revision ID: 3c8f0d6a1e27
+Revises: 9e4f1c7a2b68
+Create Date: 2026-10-18 14:05:22.184530
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c8f0d6a1e27"
+down_revision: Union[str, None] = "9e4f1c7a2b68"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_chunk_embedding_halfvec_hnsw",
+        "chunk",
+        [sa.text("(embedding::halfvec(1024)) halfvec_cosine_ops")],
+        unique=False,
+        postgresql_using="hnsw",
+        postgresql_with={"m": 16, "ef_construction": 64},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chunk_embedding_halfvec_hnsw", table_name="chunk")
@@ -0,0 +1,34 @@
+"""add hnsw index on chunk embedding
+
+Revision ID: 5b7d2e91c4a3
+Revises: 22dcc1a837cc
+Create Date: 2026-10-18 10:12:40.318406
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5b7d2e91c4a3"
+down_revision: Union[str, None] = "22dcc1a837cc"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_chunk_embedding_hnsw",
+        "chunk",
+        ["embedding"],
+        unique=False,
+        postgresql_using="hnsw",
+        postgresql_with={"m": 16, "ef_construction": 64},
+        postgresql_ops={"embedding": "vector_cosine_ops"},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chunk_embedding_hnsw", table_name="chunk")
@@ -0,0 +1,34 @@
+"""add binary quantized hnsw index on chunk embedding
+
+Revision ID: 7d1a4b9e0c52
+Revises: 3c8f0d6a1e27
+Create Date: 2026-10-18 15:27:48.902117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7d1a4b9e0c52"
+down_revision: Union[str, None] = "3c8f0d6a1e27"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_chunk_embedding_binary_hnsw",
+        "chunk",
+        [sa.text("(binary_quantize(embedding)::bit(1024)) bit_hamming_ops")],
+        unique=False,
+        postgresql_using="hnsw",
+        postgresql_with={"m": 16, "ef_construction": 64},
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chunk_embedding_binary_hnsw", table_name="chunk")
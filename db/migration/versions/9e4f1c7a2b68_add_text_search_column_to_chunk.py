@@ -0,0 +1,44 @@
+"""add text_search column with gin index to chunk
+
+Revision ID: 9e4f1c7a2b68
+Revises: 5b7d2e91c4a3
+Create Date: 2026-10-18 12:41:05.731902
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9e4f1c7a2b68"
+down_revision: Union[str, None] = "5b7d2e91c4a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "chunk",
+        sa.Column(
+            "text_search",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('russian', text)", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        "ix_chunk_text_search",
+        "chunk",
+        ["text_search"],
+        unique=False,
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_chunk_text_search", table_name="chunk")
+    op.drop_column("chunk", "text_search")
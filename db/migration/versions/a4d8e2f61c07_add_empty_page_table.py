@@ -0,0 +1,39 @@
+"""add empty_page table
+
+Revision ID: a4d8e2f61c07
+Revises: f3c9a1d27e85
+Create Date: 2026-10-18 21:52:37.180446
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "a4d8e2f61c07"
+down_revision: Union[str, None] = "f3c9a1d27e85"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "empty_page",
+        sa.Column("page_id", sa.Text(), nullable=False),
+        sa.Column("page_version", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("page_id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("empty_page")
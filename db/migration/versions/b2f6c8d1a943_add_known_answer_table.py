@@ -0,0 +1,57 @@
+"""add known_answer table
+
+Revision ID: b2f6c8d1a943
+Revises: 7d1a4b9e0c52
+Create Date: 2026-10-18 16:02:11.418305
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from pgvector.sqlalchemy import Vector
+
+# revision identifiers, used by Alembic.
+revision: str = "b2f6c8d1a943"
+down_revision: Union[str, None] = "7d1a4b9e0c52"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "known_answer",
+        sa.Column("id", sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column("question_answer_id", sa.Integer(), nullable=False),
+        sa.Column("question", sa.Text(), nullable=False),
+        sa.Column("answer", sa.Text(), nullable=False),
+        sa.Column("confluence_url", sa.Text(), nullable=False),
+        sa.Column("embedding", Vector(dim=1024), nullable=False),
+        sa.Column("content_hash", sa.Text(), nullable=False),
+        sa.Column("invalidated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("now()"),
+            nullable=True,
+        ),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(
+            ["question_answer_id"], ["question_answer.id"], ondelete="CASCADE"
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("question_answer_id"),
+    )
+    op.create_index(
+        op.f("ix_known_answer_confluence_url"),
+        "known_answer",
+        ["confluence_url"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_known_answer_confluence_url"), table_name="known_answer")
+    op.drop_table("known_answer")
@@ -0,0 +1,45 @@
+"""drop halfvec and binary hnsw indexes, built by qa for the active search mode
+
+Revision ID: c6e2a9d4f371
+Revises: a4d8e2f61c07
+Create Date: 2026-10-18 22:40:13.552019
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c6e2a9d4f371"
+down_revision: Union[str, None] = "a4d8e2f61c07"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_index("ix_chunk_embedding_binary_hnsw", table_name="chunk", if_exists=True)
+    op.drop_index("ix_chunk_embedding_halfvec_hnsw", table_name="chunk", if_exists=True)
+
+
+def downgrade() -> None:
+    op.create_index(
+        "ix_chunk_embedding_halfvec_hnsw",
+        "chunk",
+        [sa.text("(embedding::halfvec(1024)) halfvec_cosine_ops")],
+        unique=False,
+        postgresql_using="hnsw",
+        postgresql_with={"m": 16, "ef_construction": 64},
+        if_not_exists=True,
+    )
+    op.create_index(
+        "ix_chunk_embedding_binary_hnsw",
+        "chunk",
+        [sa.text("(binary_quantize(embedding)::bit(1024)) bit_hamming_ops")],
+        unique=False,
+        postgresql_using="hnsw",
+        postgresql_with={"m": 16, "ef_construction": 64},
+        if_not_exists=True,
+    )
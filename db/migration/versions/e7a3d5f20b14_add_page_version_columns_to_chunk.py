@@ -0,0 +1,33 @@
+"""add page_id, page_version and content_hash columns to chunk
+
+Revision ID: e7a3d5f20b14
+Revises: b2f6c8d1a943
+Create Date: 2026-10-18 19:07:42.318254
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "e7a3d5f20b14"
+down_revision: Union[str, None] = "b2f6c8d1a943"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("chunk", sa.Column("page_id", sa.Text(), nullable=True))
+    op.add_column("chunk", sa.Column("page_version", sa.Integer(), nullable=True))
+    op.add_column("chunk", sa.Column("content_hash", sa.Text(), nullable=True))
+    op.create_index(op.f("ix_chunk_page_id"), "chunk", ["page_id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_chunk_page_id"), table_name="chunk")
+    op.drop_column("chunk", "content_hash")
+    op.drop_column("chunk", "page_version")
+    op.drop_column("chunk", "page_id")
@@ -0,0 +1,32 @@
+"""add is_duplicate column to known_answer
+
+Revision ID: f3c9a1d27e85
+Revises: e7a3d5f20b14
+Create Date: 2026-10-18 21:14:05.602917
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "f3c9a1d27e85"
+down_revision: Union[str, None] = "e7a3d5f20b14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "known_answer",
+        sa.Column(
+            "is_duplicate", sa.Boolean(), server_default=sa.false(), nullable=False
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("known_answer", "is_duplicate")
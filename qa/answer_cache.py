@@ -0,0 +1,106 @@
+import threading
+import time
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Кеш ответов LLM, ключом которого является векторное представление вопроса:
+    ответ на новый вопрос берётся из кеша, если косинусное сходство вопроса
+    с одним из сохранённых вопросов не меньше порога `threshold`.
+    Записи хранятся не дольше `ttl` секунд, при заполнении кеша вытесняется
+    давно не использованная запись
+
+    Args:
+        threshold (float): минимальное косинусное сходство вопросов
+        max_size (int): максимальное количество записей
+        ttl (float): время жизни записи в секундах
+        dimension (int): размерность векторных представлений
+    """
+
+    def __init__(
+        self, threshold: float, max_size: int, ttl: float, dimension: int = 1024
+    ):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._embeddings = np.zeros((max_size, dimension), dtype=np.float32)
+        self._expires_at = np.zeros(max_size)
+        self._used_at = np.zeros(max_size)
+        self._answers: list[tuple[str, str] | None] = [None] * max_size
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    def get(self, embedding: np.ndarray) -> tuple[str, str] | None:
+        """Возвращает сохранённый ответ на ближайший похожий вопрос
+
+        Args:
+            embedding (np.ndarray): векторное представление вопроса
+
+        Returns:
+            tuple[str, str] | None: ответ и ссылка на источник или None, если похожего вопроса нет
+        """
+
+        query = self._normalize(embedding)
+        with self._lock:
+            now = time.monotonic()
+            if self.max_size > 0:
+                scores = self._embeddings @ query
+                scores[self._expires_at <= now] = -np.inf
+                i = int(np.argmax(scores))
+                if scores[i] >= self.threshold:
+                    self._used_at[i] = now
+                    self.hits += 1
+                    return self._answers[i]
+            self.misses += 1
+            return None
+
+    def put(self, embedding: np.ndarray, answer: str, confluence_url: str):
+        """Сохраняет ответ на вопрос, при необходимости вытесняя
+        устаревшую или давно не использованную запись
+
+        Args:
+            embedding (np.ndarray): векторное представление вопроса
+            answer (str): ответ на вопрос
+            confluence_url (str): ссылка на источник
+        """
+
+        if self.max_size == 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            i = int(np.argmin(np.where(self._expires_at > now, self._used_at, -np.inf)))
+            self._embeddings[i] = self._normalize(embedding)
+            self._expires_at[i] = now + self.ttl
+            self._used_at[i] = now
+            self._answers[i] = (answer, confluence_url)
+
+    def clear(self):
+        """Удаляет все записи, например, после переиндексации документов"""
+
+        with self._lock:
+            self._expires_at[:] = 0
+            self._answers = [None] * self.max_size
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        """Возвращает статистику использования кеша
+
+        Returns:
+            dict: количество попаданий, промахов, сбросов и действующих записей
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "entries": int((self._expires_at > time.monotonic()).sum()),
+                "max_size": self.max_size,
+            }
@@ -0,0 +1,1434 @@
+"""Бенчмарки вопросно-ответного модуля
+
+Запуск из каталога qa: `python benchmarks.py <команда> [параметры]`,
+список команд и параметров: `python benchmarks.py --help`
+"""
+
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timezone
+from functools import partial
+import json
+import multiprocessing
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Iterator
+from unittest.mock import patch
+import zlib
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    Engine,
+    MetaData,
+    Table,
+    cast,
+    create_engine,
+    delete,
+    func,
+    insert,
+    inspect,
+    select,
+    text,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, DropIndex
+from config import Config
+import llm_prompting
+import main
+from answer_cache import SemanticAnswerCache
+from confluence_retrieving import COPY_COLUMNS, copy_chunks, get_chunk_by_embedding
+from database import VECTOR_SEARCH_INDEXES, Chunk
+from embedding_snapshot import EmbeddingSnapshot, write_embedding_snapshot
+from encoding import BatchingEncoder, CachedEncoder, load_encoder_model
+from known_answers import KnownAnswers
+from llm_gateway import CircuitBreaker, LLMGateway
+from llm_prompting import LLMAnswer
+from metrics import VECTOR_SEARCH_SECONDS
+from startup import StartupProgress
+
+SAMPLE_QUESTIONS = [
+    "как поменять занятия по физической культуре на фитнес",
+    "где находится единый деканат",
+    "сколько готовится справка с оценками",
+    "как получить академический отпуск",
+    "когда начинается летняя сессия",
+    "как восстановить студенческий билет",
+    "можно ли пересдать экзамен досрочно",
+    "как оформить социальную стипендию",
+]
+
+
+def sample_questions(count: int) -> list[str]:
+    """Возвращает список различных вопросов для бенчмарков, не требующий доступа к БД
+
+    Args:
+        count (int): количество вопросов
+
+    Returns:
+        list[str]: вопросы
+    """
+
+    return [f"{SAMPLE_QUESTIONS[i % len(SAMPLE_QUESTIONS)]} {i}" for i in range(count)]
+
+
+def print_table(header: list[str], rows: list[list]):
+    """Выводит результаты бенчмарка в виде таблицы
+
+    Args:
+        header (list[str]): заголовки столбцов
+        rows (list[list]): строки таблицы
+    """
+
+    cells = [header] + [
+        [f"{value:.3f}" if isinstance(value, float) else str(value) for value in row]
+        for row in rows
+    ]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(header))]
+    for row in cells:
+        print("  ".join(value.rjust(width) for value, width in zip(row, widths)))
+
+
+def nearest_chunk_ids(
+    session: Session, embedding: np.ndarray, k: int, ef_search: int | None
+) -> tuple[list[int], float]:
+    """Возвращает ID k ближайших фрагментов документов и время поиска
+
+    Args:
+        session (Session): сессия подключения к БД
+        embedding (np.ndarray): векторное представление вопроса
+        k (int): количество ближайших фрагментов
+        ef_search (int | None): значение hnsw.ef_search, None — точный поиск полным перебором
+
+    Returns:
+        tuple[list[int], float]: ID фрагментов, время поиска в миллисекундах
+    """
+
+    if ef_search is None:
+        session.execute(select(func.set_config("enable_indexscan", "off", True)))
+    else:
+        session.execute(select(func.set_config("hnsw.ef_search", str(ef_search), True)))
+    start = time.perf_counter()
+    ids = session.scalars(
+        select(Chunk.id).order_by(Chunk.embedding.cosine_distance(embedding)).limit(k)
+    ).all()
+    elapsed = (time.perf_counter() - start) * 1000
+    session.commit()
+    return list(ids), elapsed
+
+
+def index_recall(
+    engine: Engine,
+    encoder_model: SentenceTransformer,
+    questions_count: int,
+    k: int,
+    ef_search_values: list[int],
+):
+    """Сравнивает полноту recall@k и время поиска по HNSW-индексу
+    при разных значениях hnsw.ef_search с точным поиском полным перебором.
+    В качестве запросов используются вопросы пользователей из таблицы question_answer
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        questions_count (int): количество случайных вопросов
+        k (int): количество ближайших фрагментов
+        ef_search_values (list[int]): проверяемые значения hnsw.ef_search
+    """
+
+    with Session(engine) as session:
+        questions = session.scalars(
+            text("SELECT question FROM question_answer ORDER BY random() LIMIT :limit"),
+            {"limit": questions_count},
+        ).all()
+        chunks_count = session.scalar(select(func.count(Chunk.id)))
+    if len(questions) == 0:
+        print("В таблице question_answer нет вопросов")
+        return
+    embeddings = encoder_model.encode(questions)
+    with Session(engine) as session:
+        exact = [nearest_chunk_ids(session, e, k, None) for e in embeddings]
+        rows = [
+            [
+                "exact",
+                1.0,
+                np.percentile([ms for _, ms in exact], 50),
+                np.percentile([ms for _, ms in exact], 99),
+            ]
+        ]
+        for ef_search in ef_search_values:
+            approximate = [
+                nearest_chunk_ids(session, e, k, ef_search) for e in embeddings
+            ]
+            recall = np.mean(
+                [
+                    len(set(ids) & set(exact_ids)) / max(len(exact_ids), 1)
+                    for (ids, _), (exact_ids, _) in zip(approximate, exact)
+                ]
+            )
+            rows.append(
+                [
+                    ef_search,
+                    float(recall),
+                    np.percentile([ms for _, ms in approximate], 50),
+                    np.percentile([ms for _, ms in approximate], 99),
+                ]
+            )
+    print(f"Фрагментов: {chunks_count}, вопросов: {len(questions)}, k = {k}")
+    print_table(["ef_search", f"recall@{k}", "p50, мс", "p99, мс"], rows)
+
+
+def encoder_batching(
+    encoder_model: SentenceTransformer,
+    questions_count: int,
+    concurrency: int,
+    windows: list[float],
+    max_batch_size: int,
+):
+    """Сравнивает пропускную способность вычисления векторных представлений вопросов,
+    поступающих из `concurrency` потоков одновременно, без объединения в пакеты
+    и с объединением при разной длительности окна сбора пакета
+
+    Args:
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        questions_count (int): количество вопросов
+        concurrency (int): количество одновременно отправляющих вопросы потоков
+        windows (list[float]): проверяемые длительности окна сбора пакета в секундах
+        max_batch_size (int): максимальный размер пакета
+    """
+
+    questions = sample_questions(questions_count)
+    encoder_model.encode(questions[:max_batch_size])
+
+    def measure(encoder) -> list:
+        latencies = []
+
+        def encode(question: str):
+            start = time.perf_counter()
+            encoder.encode(question)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(encode, questions))
+        elapsed = time.perf_counter() - start
+        return [
+            len(questions) / elapsed,
+            np.percentile(latencies, 50),
+            np.percentile(latencies, 99),
+        ]
+
+    rows = [["без пакетов"] + measure(encoder_model)]
+    for window in windows:
+        batching_encoder = BatchingEncoder(encoder_model, window, max_batch_size)
+        rows.append([window] + measure(batching_encoder))
+        batching_encoder.close()
+    print(
+        f"Вопросов: {len(questions)}, потоков: {concurrency}, "
+        f"максимальный размер пакета: {max_batch_size}"
+    )
+    print_table(["окно, с", "вопросов/с", "p50, мс", "p99, мс"], rows)
+
+
+def measure_encoder_backend(
+    backend: str, questions: list[str], texts: list[str]
+) -> dict:
+    """Измеряет задержку вычисления векторного представления одного вопроса
+    и находит ближайший к каждому вопросу текст. Выполняется в отдельном процессе,
+    чтобы пиковое потребление памяти относилось только к одному способу выполнения модели
+
+    Args:
+        backend (str): способ выполнения модели (см. `encoding.load_encoder_model`)
+        questions (list[str]): вопросы
+        texts (list[str]): тексты фрагментов документов
+
+    Returns:
+        dict: время загрузки модели, задержки в миллисекундах, пиковое потребление
+            памяти процессом в МБ и номера ближайших к вопросам текстов
+    """
+
+    start = time.perf_counter()
+    encoder_model = load_encoder_model(backend)
+    load_time = time.perf_counter() - start
+    encoder_model.encode(questions[:1])
+    latencies = []
+    for question in questions:
+        start = time.perf_counter()
+        encoder_model.encode(question)
+        latencies.append((time.perf_counter() - start) * 1000)
+    question_embeddings = encoder_model.encode(questions, normalize_embeddings=True)
+    text_embeddings = encoder_model.encode(texts, normalize_embeddings=True)
+    return {
+        "load_time": load_time,
+        "latencies": latencies,
+        "max_rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "nearest": np.argmax(question_embeddings @ text_embeddings.T, axis=1),
+    }
+
+
+def encoder_backends(
+    engine: Engine, backends: list[str], questions_count: int, texts_count: int
+):
+    """Сравнивает способы выполнения модели получения векторных представлений на CPU:
+    задержку вычисления для одного вопроса, пиковое потребление памяти
+    и совпадение ближайшего фрагмента документа (top-1) с первым способом в списке.
+    Каждый способ измеряется в отдельном процессе
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        backends (list[str]): способы выполнения модели, первый считается эталонным
+        questions_count (int): количество вопросов
+        texts_count (int): количество случайных фрагментов документов из БД
+    """
+
+    with Session(engine) as session:
+        questions = session.scalars(
+            text("SELECT question FROM question_answer ORDER BY random() LIMIT :limit"),
+            {"limit": questions_count},
+        ).all()
+        texts = session.scalars(
+            select(Chunk.text).order_by(func.random()).limit(texts_count)
+        ).all()
+    if len(questions) < questions_count:
+        questions = list(questions) + sample_questions(questions_count - len(questions))
+    if len(texts) == 0:
+        print("В таблице chunk нет фрагментов документов")
+        return
+    results = {}
+    for backend in backends:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            results[backend] = executor.submit(
+                measure_encoder_backend, backend, questions, list(texts)
+            ).result()
+    reference = results[backends[0]]["nearest"]
+    rows = [
+        [
+            backend,
+            result["load_time"],
+            np.percentile(result["latencies"], 50),
+            np.percentile(result["latencies"], 99),
+            result["max_rss"],
+            float(np.mean(result["nearest"] == reference)),
+        ]
+        for backend, result in results.items()
+    ]
+    print(f"Вопросов: {len(questions)}, фрагментов: {len(texts)}")
+    print_table(
+        [
+            "backend",
+            "загрузка, с",
+            "p50, мс",
+            "p99, мс",
+            "пик RSS, МБ",
+            f"top-1 = {backends[0]}",
+        ],
+        rows,
+    )
+
+
+def index_footprint(session: Session, index_name: str) -> tuple[float, float | None]:
+    """Возвращает размер индекса и занимаемую им часть общего буферного кеша Postgres
+
+    Args:
+        session (Session): сессия подключения к БД
+        index_name (str): название индекса
+
+    Returns:
+        tuple[float, float | None]: размер индекса и объём его страниц в shared_buffers в МБ,
+            None вместо объёма, если расширение pg_buffercache не установлено
+    """
+
+    size = session.scalar(
+        text("SELECT pg_relation_size(to_regclass(:name))"), {"name": index_name}
+    )
+    cached = None
+    if session.scalar(
+        text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_buffercache'")
+    ):
+        cached = session.scalar(
+            text(
+                "SELECT count(*) * current_setting('block_size')::bigint "
+                "FROM pg_buffercache b JOIN pg_class c "
+                "ON b.relfilenode = pg_relation_filenode(c.oid) "
+                "WHERE c.oid = to_regclass(:name)"
+            ),
+            {"name": index_name},
+        )
+    return (size or 0) / 2**20, None if cached is None else cached / 2**20
+
+
+def vector_storage(
+    engine: Engine,
+    encoder_model: SentenceTransformer,
+    questions_count: int,
+    dimensions: list[int],
+):
+    """Сравнивает представления векторов фрагментов документов: размер HNSW-индекса,
+    его долю в shared_buffers, время поиска и совпадение ближайшего фрагмента (top-1)
+    с точным поиском по полным векторам fp32. Для векторов, усечённых до первых
+    `dimensions` компонент, совпадение вычисляется в numpy без изменения схемы БД.
+    HNSW-индекс halfvec, если его нет в БД, строится на время замера
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        questions_count (int): количество вопросов
+        dimensions (list[int]): проверяемые размерности усечённых векторов
+    """
+
+    with Session(engine) as session:
+        questions = session.scalars(
+            text("SELECT question FROM question_answer ORDER BY random() LIMIT :limit"),
+            {"limit": questions_count},
+        ).all()
+        rows = session.execute(select(Chunk.id, Chunk.embedding)).all()
+    if len(questions) < questions_count:
+        questions = list(questions) + sample_questions(questions_count - len(questions))
+    if len(rows) == 0:
+        print("В таблице chunk нет фрагментов документов")
+        return
+    ids = np.array([row.id for row in rows])
+    chunk_embeddings = np.array([row.embedding for row in rows], dtype=np.float32)
+    chunk_embeddings /= np.linalg.norm(chunk_embeddings, axis=1, keepdims=True)
+    embeddings = encoder_model.encode(questions, normalize_embeddings=True)
+    exact = ids[np.argmax(chunk_embeddings @ embeddings.T, axis=0)]
+
+    def search(session: Session, distance) -> tuple[list[int], list[float]]:
+        nearest, latencies = [], []
+        for embedding in embeddings:
+            session.execute(
+                select(
+                    func.set_config("hnsw.ef_search", str(Config.HNSW_EF_SEARCH), True)
+                )
+            )
+            start = time.perf_counter()
+            nearest.append(
+                session.scalar(select(Chunk.id).order_by(distance(embedding)).limit(1))
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            session.commit()
+        return nearest, latencies
+
+    half_index = VECTOR_SEARCH_INDEXES["half"]
+    # индекс halfvec есть в БД, только если микросервис запущен
+    # с VECTOR_SEARCH_MODE=half, поэтому для замера он строится и затем удаляется
+    with engine.begin() as connection:
+        built = not inspect(connection).has_index("chunk", half_index.name)
+        if built:
+            connection.execute(CreateIndex(half_index))
+    try:
+        table = []
+        with Session(engine) as session:
+            for name, index_name, distance in [
+                (
+                    "vector fp32",
+                    "ix_chunk_embedding_hnsw",
+                    lambda e: Chunk.embedding.cosine_distance(e),
+                ),
+                (
+                    "halfvec fp16",
+                    "ix_chunk_embedding_halfvec_hnsw",
+                    lambda e: cast(Chunk.embedding, HALFVEC(1024)).cosine_distance(
+                        cast(e, HALFVEC(1024))
+                    ),
+                ),
+            ]:
+                size, cached = index_footprint(session, index_name)
+                nearest, latencies = search(session, distance)
+                table.append(
+                    [
+                        name,
+                        size,
+                        "-" if cached is None else cached,
+                        np.percentile(latencies, 50),
+                        float(np.mean(np.array(nearest) == exact)),
+                    ]
+                )
+    finally:
+        if built:
+            with engine.begin() as connection:
+                connection.execute(DropIndex(half_index))
+    for dimension in dimensions:
+        truncated = chunk_embeddings[:, :dimension]
+        truncated = truncated / np.linalg.norm(truncated, axis=1, keepdims=True)
+        nearest = ids[np.argmax(truncated @ embeddings[:, :dimension].T, axis=0)]
+        table.append(
+            [
+                f"усечение до {dimension}",
+                len(ids) * dimension * 4 / 2**20,
+                "-",
+                "-",
+                float(np.mean(nearest == exact)),
+            ]
+        )
+    print(f"Фрагментов: {len(ids)}, вопросов: {len(questions)}")
+    print_table(
+        ["представление", "индекс, МБ", "в shared_buffers, МБ", "p50, мс", "top-1"],
+        table,
+    )
+
+
+def synthetic_embeddings(
+    rng: np.random.Generator, centers: np.ndarray, count: int
+) -> np.ndarray:
+    """Возвращает нормализованные синтетические векторные представления,
+    сгруппированные вокруг заданных центров подобно фрагментам документов на близкие темы
+
+    Args:
+        rng (np.random.Generator): генератор случайных чисел
+        centers (np.ndarray): центры групп, по строке на центр
+        count (int): количество векторов
+
+    Returns:
+        np.ndarray: векторные представления, по строке на вектор
+    """
+
+    embeddings = centers[rng.integers(len(centers), size=count)] + rng.normal(
+        scale=0.5 / np.sqrt(centers.shape[1]), size=(count, centers.shape[1])
+    ).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def binary_rescore(
+    engine: Engine,
+    sizes: list[int],
+    queries_count: int,
+    candidates_values: list[int],
+    batch_size: int = 1000,
+):
+    """Сравнивает двухэтапный поиск (отбор кандидатов по бинарно квантизованным
+    векторам и их точное упорядочивание по векторам fp32) с точным поиском полным
+    перебором по косинусному расстоянию на синтетических наборах фрагментов разного размера.
+    Наборы записываются во вспомогательную таблицу benchmark_chunk, удаляемую после замеров
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        sizes (list[int]): размеры синтетических наборов фрагментов
+        queries_count (int): количество запросов
+        candidates_values (list[int]): проверяемые количества кандидатов
+        batch_size (int): размер пакета при записи набора в БД
+    """
+
+    table = Table(
+        "benchmark_chunk",
+        MetaData(),
+        Column("id", BigInteger, primary_key=True),
+        Column("embedding", Vector(1024)),
+    )
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(1024, 1024)).astype(np.float32)
+    rows = []
+    for size in sizes:
+        table.drop(engine, checkfirst=True)
+        table.create(engine)
+        with Session(engine) as session:
+            for start in range(0, size, batch_size):
+                embeddings = synthetic_embeddings(
+                    rng, centers, min(batch_size, size - start)
+                )
+                session.execute(
+                    insert(table),
+                    [
+                        {"id": start + i, "embedding": embedding}
+                        for i, embedding in enumerate(embeddings)
+                    ],
+                )
+            session.execute(
+                text(
+                    "CREATE INDEX benchmark_chunk_binary_hnsw ON benchmark_chunk "
+                    "USING hnsw ((binary_quantize(embedding)::bit(1024)) bit_hamming_ops)"
+                )
+            )
+            session.execute(text("ANALYZE benchmark_chunk"))
+            session.commit()
+            index_size = session.scalar(
+                text("SELECT pg_relation_size('benchmark_chunk_binary_hnsw')")
+            )
+        queries = synthetic_embeddings(rng, centers, queries_count)
+
+        def measure(query_builder, ef_search: int | None) -> tuple[list, list]:
+            nearest, latencies = [], []
+            with Session(engine) as session:
+                for query in queries:
+                    if ef_search is not None:
+                        session.execute(
+                            select(
+                                func.set_config("hnsw.ef_search", str(ef_search), True)
+                            )
+                        )
+                    start = time.perf_counter()
+                    nearest.append(session.scalar(query_builder(query)))
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    session.commit()
+            return nearest, latencies
+
+        exact, latencies = measure(
+            lambda query: select(table.c.id)
+            .order_by(table.c.embedding.cosine_distance(query))
+            .limit(1),
+            None,
+        )
+        rows.append(
+            [
+                size,
+                "полный перебор",
+                "-",
+                np.percentile(latencies, 50),
+                np.percentile(latencies, 99),
+                1.0,
+            ]
+        )
+        for candidates_count in candidates_values:
+
+            def two_stage(query: np.ndarray):
+                candidates = (
+                    select(table.c.id, table.c.embedding)
+                    .order_by(
+                        cast(
+                            func.binary_quantize(table.c.embedding), BIT(1024)
+                        ).hamming_distance(
+                            func.binary_quantize(cast(query, Vector(1024)))
+                        )
+                    )
+                    .limit(candidates_count)
+                    .subquery()
+                )
+                return (
+                    select(candidates.c.id)
+                    .order_by(candidates.c.embedding.cosine_distance(query))
+                    .limit(1)
+                )
+
+            nearest, latencies = measure(two_stage, candidates_count)
+            rows.append(
+                [
+                    size,
+                    f"bit + rescore, N = {candidates_count}",
+                    (index_size or 0) / 2**20,
+                    np.percentile(latencies, 50),
+                    np.percentile(latencies, 99),
+                    float(np.mean(np.array(nearest) == np.array(exact))),
+                ]
+            )
+    table.drop(engine, checkfirst=True)
+    print(f"Запросов: {queries_count}")
+    print_table(
+        ["фрагментов", "поиск", "индекс, МБ", "p50, мс", "p99, мс", "top-1"], rows
+    )
+
+
+SYNTHETIC_WORDS = (
+    "студент",
+    "деканат",
+    "стипендия",
+    "справка",
+    "экзамен",
+    "сессия",
+    "заявление",
+    "общежитие",
+    "расписание",
+    "пропуск",
+    "кафедра",
+    "отпуск",
+    "перевод",
+    "пересдача",
+    "практика",
+    "договор",
+    "оплата",
+    "библиотека",
+    "аудитория",
+    "корпус",
+)
+
+
+def synthetic_chunk_text(rng: np.random.Generator, sentences: int) -> str:
+    """Возвращает синтетический текст фрагмента документа из случайных слов
+    предметной области, в котором, как на страницах вики-системы, встречаются
+    предложения с телефонами и номерами кабинетов
+
+    Args:
+        rng (np.random.Generator): генератор случайных чисел
+        sentences (int): количество предложений
+
+    Returns:
+        str: текст фрагмента
+    """
+
+    parts = []
+    for _ in range(sentences):
+        sentence = " ".join(rng.choice(SYNTHETIC_WORDS, size=rng.integers(6, 16)))
+        parts.append(f"{sentence.capitalize()}.")
+        if rng.random() < 0.2:
+            parts.append(
+                f"Тел. +7 (3452) {rng.integers(10, 100)}-{rng.integers(10, 100)}-"
+                f"{rng.integers(10, 100)}, каб. {rng.integers(100, 1000)}."
+            )
+    return " ".join(parts)
+
+
+class StubEncoder:
+    """Заменитель модели получения векторных представлений для бенчмарков
+    без загрузки модели: сопоставляет каждому тексту детерминированный
+    нормализованный случайный вектор и имитирует время вычисления
+
+    Args:
+        latency (float): время вычисления пакета текстов в секундах
+        dimension (int): размерность векторных представлений
+    """
+
+    def __init__(self, latency: float, dimension: int = 1024):
+        self.latency = latency
+        self.dimension = dimension
+
+    def encode(self, sentences: str | list[str], **kwargs) -> np.ndarray:
+        """Возвращает векторные представления текстов
+
+        Args:
+            sentences (str | list[str]): текст или список текстов
+
+        Returns:
+            np.ndarray: векторное представление текста или матрица, по строке на текст
+        """
+
+        time.sleep(self.latency)
+        texts = [sentences] if isinstance(sentences, str) else sentences
+        embeddings = np.stack(
+            [
+                np.random.default_rng(zlib.crc32(text.encode()))
+                .normal(size=self.dimension)
+                .astype(np.float32)
+                for text in texts
+            ]
+        )
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings[0] if isinstance(sentences, str) else embeddings
+
+
+def stub_llm_gateway(latency: float, jitter: float) -> LLMGateway:
+    """Возвращает обёртку над вызовами LLM с ограничениями из конфигурации,
+    в которой вместо GigaChat используется заглушка, отвечающая
+    на любой вопрос через случайное время
+
+    Args:
+        latency (float): медианное время ответа заглушки в секундах
+        jitter (float): стандартное отклонение логарифма времени ответа,
+            0 — время ответа постоянно
+
+    Returns:
+        LLMGateway: обёртка над вызовами заглушки LLM
+    """
+
+    def generate(query: dict) -> LLMAnswer:
+        time.sleep(latency * random.lognormvariate(0, jitter))
+        return LLMAnswer(
+            text=f"Синтетический ответ на вопрос «{query['question']}»",
+            finish_reason="stop",
+        )
+
+    return LLMGateway(
+        generate,
+        max_concurrency=Config.LLM_MAX_CONCURRENCY,
+        timeout=Config.LLM_TIMEOUT,
+        retries=Config.LLM_RETRIES,
+        backoff=Config.LLM_RETRY_BACKOFF,
+        hedging=Config.LLM_HEDGING,
+        hedge_min_samples=Config.LLM_HEDGE_MIN_SAMPLES,
+        breaker=CircuitBreaker(
+            Config.LLM_BREAKER_FAILURES, Config.LLM_BREAKER_RESET_TIMEOUT
+        ),
+    )
+
+
+class InMemoryChunks:
+    """Заменитель таблицы chunk в памяти: фрагменты документов хранятся в словаре,
+    а ближайший фрагмент ищется по снимку векторных представлений `EmbeddingSnapshot`,
+    записанному в каталог `path`, без обращения к БД
+
+    Args:
+        chunks (list[Chunk]): фрагменты документов с заданными ID
+        embeddings (np.ndarray): векторные представления фрагментов, по строке на фрагмент
+        path (str): каталог снимка
+    """
+
+    def __init__(self, chunks: list[Chunk], embeddings: np.ndarray, path: str):
+        self.chunks = {chunk.id: chunk for chunk in chunks}
+        write_embedding_snapshot(
+            path, np.array([chunk.id for chunk in chunks], dtype=np.int64), embeddings
+        )
+        self.snapshot = EmbeddingSnapshot(path)
+
+    def get_chunk_by_embedding(self, embedding: np.ndarray) -> Chunk | None:
+        """Возвращает ближайший к векторному представлению вопроса фрагмент документа
+
+        Args:
+            embedding (np.ndarray): векторное представление вопроса
+
+        Returns:
+            Chunk | None: экземпляр класса Chunk — фрагмент документа
+        """
+
+        ids = self.snapshot.search(embedding)
+        return self.chunks.get(ids[0]) if len(ids) > 0 else None
+
+
+def load_synthetic_chunks(
+    engine: Engine, chunks: list[Chunk], embeddings: np.ndarray, batch_size: int
+) -> bool:
+    """Записывает синтетические фрагменты документов в таблицу chunk,
+    создавая её при необходимости. Чтобы не испортить индекс документов,
+    фрагменты записываются только в пустую таблицу
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        chunks (list[Chunk]): фрагменты документов с заданными ID
+        embeddings (np.ndarray): векторные представления фрагментов, по строке на фрагмент
+        batch_size (int): размер пакета при записи в БД
+
+    Returns:
+        bool: True, если фрагменты записаны, False — если таблица не пуста
+    """
+
+    with Session(engine) as session:
+        session.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        session.commit()
+    Chunk.__table__.create(engine, checkfirst=True)
+    with Session(engine) as session:
+        if session.scalar(select(func.count(Chunk.id))) > 0:
+            return False
+        for start in range(0, len(chunks), batch_size):
+            session.execute(
+                insert(Chunk),
+                [
+                    {
+                        "id": chunk.id,
+                        "confluence_url": chunk.confluence_url,
+                        "text": chunk.text,
+                        "embedding": embedding,
+                    }
+                    for chunk, embedding in zip(
+                        chunks[start : start + batch_size],
+                        embeddings[start : start + batch_size],
+                    )
+                ],
+            )
+        session.commit()
+        session.execute(text("ANALYZE chunk"))
+        session.commit()
+    return True
+
+
+def latency_summary(latencies: list[float], elapsed: float) -> dict:
+    """Возвращает сводку замеров операции
+
+    Args:
+        latencies (list[float]): длительности успешно выполненных операций в секундах
+        elapsed (float): общее время замеров в секундах
+
+    Returns:
+        dict: количество операций, пропускная способность (операций в секунду),
+            50-й и 99-й процентили длительности в миллисекундах
+    """
+
+    if len(latencies) == 0:
+        return {"count": 0, "throughput": 0.0, "p50_ms": None, "p99_ms": None}
+    return {
+        "count": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+    }
+
+
+def measure_calls(
+    function: Callable[[Any], Any], arguments: list, concurrency: int
+) -> dict:
+    """Вызывает функцию для каждого аргумента в `concurrency` потоках
+    и измеряет длительность вызовов
+
+    Args:
+        function (Callable[[Any], Any]): измеряемая функция
+        arguments (list): аргументы вызовов
+        concurrency (int): количество одновременных вызовов
+
+    Returns:
+        dict: сводка замеров (см. `latency_summary`)
+    """
+
+    def timed(argument: Any) -> float:
+        start = time.perf_counter()
+        function(argument)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = list(executor.map(timed, arguments))
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+@contextmanager
+def pipeline_app(
+    encoder_model: SentenceTransformer,
+    gateway: LLMGateway,
+    chunks: InMemoryChunks | None = None,
+    engine: Engine | None = None,
+) -> Iterator[web.Application]:
+    """Подготавливает обработчики микросервиса к замерам и возвращает приложение aiohttp:
+    кеш и известные ответы отключаются, LLM заменяется заглушкой, а фрагменты документов
+    ищутся в таблице chunk БД `engine` или, если задан `chunks`, в памяти
+    (полнотекстовый поиск при этом не выполняется). Глобальные объекты модулей
+    микросервиса подменяются только внутри блока with и восстанавливаются при выходе,
+    а фоновый поток пакетного кодировщика вопросов останавливается
+
+    Args:
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        gateway (LLMGateway): обёртка над вызовами заглушки LLM
+        chunks (InMemoryChunks | None): фрагменты документов в памяти
+        engine (Engine | None): экземпляр подключения к БД с фрагментами документов
+
+    Yields:
+        web.Application: приложение aiohttp с маршрутами микросервиса
+    """
+
+    batching_encoder = BatchingEncoder(
+        encoder_model, Config.ENCODER_BATCH_WINDOW, Config.ENCODER_MAX_BATCH_SIZE
+    )
+    startup_progress = StartupProgress()
+    startup_progress.finish()
+
+    async def sync_known_answers():
+        pass
+
+    replacements = {
+        "encoder_model": encoder_model,
+        "question_encoder": CachedEncoder(
+            batching_encoder, Config.QUESTION_CACHE_MAX_BYTES, Config.QUESTION_CACHE_TTL
+        ),
+        "answer_cache": SemanticAnswerCache(1.0, 0, 0),
+        "known_answers": KnownAnswers(1.0),
+        "sync_known_answers": sync_known_answers,
+        "get_gateway": lambda: gateway,
+        "startup_progress": startup_progress,
+    }
+    if chunks is not None:
+
+        async def find_chunk(embedding: np.ndarray) -> Chunk | None:
+            with VECTOR_SEARCH_SECONDS.time():
+                return await asyncio.get_running_loop().run_in_executor(
+                    main.io_executor, chunks.get_chunk_by_embedding, embedding
+                )
+
+        async def find_chunks(embeddings: np.ndarray) -> list[Chunk | None]:
+            return [chunks.get_chunk_by_embedding(e) for e in embeddings]
+
+        async def find_lexical_chunk(question: str) -> Chunk | None:
+            return None
+
+        async def find_lexical_chunks(questions: list[str]) -> list[Chunk | None]:
+            return [None] * len(questions)
+
+        replacements |= {
+            "find_chunk": find_chunk,
+            "find_chunks": find_chunks,
+            "find_lexical_chunk": find_lexical_chunk,
+            "find_lexical_chunks": find_lexical_chunks,
+        }
+    else:
+        replacements |= {
+            "engine": engine,
+            "async_engine": None,
+            "embedding_snapshot": None,
+        }
+    with ExitStack() as stack:
+        stack.callback(batching_encoder.close)
+        for name, value in replacements.items():
+            stack.enter_context(patch.object(main, name, value))
+        stack.enter_context(patch.object(llm_prompting, "get_gateway", lambda: gateway))
+        app = web.Application(
+            middlewares=[
+                main.request_metrics,
+                main.readiness_gate,
+                main.admission_control,
+            ]
+        )
+        app.add_routes(main.routes)
+        yield app
+
+
+async def measure_qa_handler(
+    app: web.Application, questions: list[str], concurrency: int
+) -> dict:
+    """Отправляет вопросы в обработчик `/qa/` по HTTP, поддерживая
+    `concurrency` одновременных запросов, и измеряет длительность ответов
+
+    Args:
+        app (web.Application): приложение aiohttp
+        questions (list[str]): вопросы
+        concurrency (int): количество одновременных запросов
+
+    Returns:
+        dict: сводка замеров успешных ответов (см. `latency_summary`)
+            и количество ответов по статусам
+    """
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: list[float] = []
+    statuses: dict[str, int] = {}
+    async with TestClient(TestServer(app)) as client:
+
+        async def ask(question: str):
+            async with semaphore:
+                start = time.perf_counter()
+                async with client.post("/qa/", json={"question": question}) as response:
+                    await response.read()
+                if response.status == 200:
+                    latencies.append(time.perf_counter() - start)
+                status = str(response.status)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[ask(question) for question in questions])
+        elapsed = time.perf_counter() - start
+    return latency_summary(latencies, elapsed) | {"statuses": statuses}
+
+
+def git_commit() -> str | None:
+    """Возвращает хеш текущего коммита репозитория
+
+    Returns:
+        str | None: хеш коммита или None, если git недоступен
+    """
+
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+        )
+    except FileNotFoundError:
+        return None
+    return result.stdout.strip() or None
+
+
+def compare_results(baseline: dict, current: dict, max_regression: float) -> list[list]:
+    """Сравнивает результаты замеров с результатами предыдущей версии
+
+    Args:
+        baseline (dict): результаты предыдущей версии, по сводке на этап
+        current (dict): результаты текущей версии, по сводке на этап
+        max_regression (float): допустимое относительное ухудшение показателя
+
+    Returns:
+        list[list]: строки сравнения: этап, показатель, прежнее и текущее значения,
+            относительное изменение и признак регрессии
+    """
+
+    rows = []
+    for stage, summary in current.items():
+        for metric, higher_is_better in (
+            ("throughput", True),
+            ("p50_ms", False),
+            ("p99_ms", False),
+        ):
+            before = baseline.get(stage, {}).get(metric)
+            after = summary.get(metric)
+            if not before or after is None:
+                continue
+            change = after / before - 1
+            regression = (-change if higher_is_better else change) > max_regression
+            rows.append([stage, metric, before, after, f"{change:+.1%}", regression])
+    return rows
+
+
+def pipeline(
+    encoder_model: SentenceTransformer,
+    engine: Engine | None,
+    chunks_count: int,
+    requests_count: int,
+    concurrency: int,
+    llm_latency: float,
+    llm_jitter: float,
+    output_path: str | None = None,
+    baseline_path: str | None = None,
+    max_regression: float = 0.2,
+    batch_size: int = 1000,
+) -> bool:
+    """Измеряет пропускную способность и задержки этапов ответа на вопрос
+    на синтетическом наборе фрагментов документов без доступа к Confluence и GigaChat:
+    вычисления векторного представления вопроса, поиска ближайшего фрагмента
+    и обработки запроса `/qa/` целиком с заглушкой LLM. Фрагменты хранятся в памяти
+    или, если задан `engine`, записываются в пустую таблицу chunk и удаляются после замеров.
+    Результаты с параметрами и хешем коммита записываются в JSON и сравниваются
+    с результатами предыдущей версии
+
+    Args:
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        engine (Engine | None): экземпляр подключения к БД, None — фрагменты хранятся в памяти
+        chunks_count (int): количество синтетических фрагментов
+        requests_count (int): количество вопросов
+        concurrency (int): количество одновременных запросов
+        llm_latency (float): медианное время ответа заглушки LLM в секундах
+        llm_jitter (float): стандартное отклонение логарифма времени ответа заглушки LLM
+        output_path (str | None): путь к файлу результатов JSON
+        baseline_path (str | None): путь к файлу результатов предыдущей версии
+        max_regression (float): допустимое относительное ухудшение показателя
+        batch_size (int): размер пакета при записи фрагментов в БД
+
+    Returns:
+        bool: True, если по сравнению с предыдущей версией нет регрессий
+    """
+
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(64, 1024)).astype(np.float32)
+    embeddings = synthetic_embeddings(rng, centers, chunks_count)
+    chunks = [
+        Chunk(
+            id=i,
+            confluence_url=f"https://confluence.example.com/pages/{i}",
+            text=synthetic_chunk_text(rng, int(rng.integers(20, 50))),
+        )
+        for i in range(chunks_count)
+    ]
+    questions = sample_questions(requests_count)
+    queries = list(synthetic_embeddings(rng, centers, requests_count))
+    gateway = stub_llm_gateway(llm_latency, llm_jitter)
+    with tempfile.TemporaryDirectory() as snapshot_path:
+        if engine is None:
+            store = InMemoryChunks(chunks, embeddings, snapshot_path)
+            find_chunk = store.get_chunk_by_embedding
+            app_context = pipeline_app(encoder_model, gateway, chunks=store)
+        elif load_synthetic_chunks(engine, chunks, embeddings, batch_size):
+            find_chunk = partial(get_chunk_by_embedding, engine)
+            app_context = pipeline_app(encoder_model, gateway, engine=engine)
+        else:
+            print("Таблица chunk не пуста, укажите пустую БД")
+            return False
+        try:
+            encoder_model.encode(questions[0])
+            with app_context as app:
+                results = {
+                    "encode": measure_calls(encoder_model.encode, questions, 1),
+                    "get_chunk": measure_calls(find_chunk, queries, concurrency),
+                    "qa_handler": asyncio.run(
+                        measure_qa_handler(app, questions, concurrency)
+                    ),
+                }
+        finally:
+            if engine is not None:
+                with Session(engine) as session:
+                    session.execute(delete(Chunk))
+                    session.commit()
+    print(
+        f"Фрагментов: {chunks_count}, вопросов: {requests_count}, "
+        f"одновременных запросов: {concurrency}, статусы /qa/: "
+        f"{results['qa_handler']['statuses']}"
+    )
+    print_table(
+        ["этап", "операций", "операций/с", "p50, мс", "p99, мс"],
+        [
+            [
+                stage,
+                summary["count"],
+                summary["throughput"],
+                summary["p50_ms"],
+                summary["p99_ms"],
+            ]
+            for stage, summary in results.items()
+        ],
+    )
+    if output_path is not None:
+        with open(output_path, "w") as file:
+            json.dump(
+                {
+                    "created_at": datetime.now(timezone.utc).isoformat(),
+                    "commit": git_commit(),
+                    "parameters": {
+                        "storage": "memory" if engine is None else "postgres",
+                        "encoder_backend": (
+                            "stub"
+                            if isinstance(encoder_model, StubEncoder)
+                            else Config.ENCODER_BACKEND
+                        ),
+                        "chunks": chunks_count,
+                        "requests": requests_count,
+                        "concurrency": concurrency,
+                        "llm_latency": llm_latency,
+                        "llm_jitter": llm_jitter,
+                    },
+                    "results": results,
+                },
+                file,
+                ensure_ascii=False,
+                indent=2,
+            )
+    if baseline_path is None:
+        return True
+    with open(baseline_path) as file:
+        baseline = json.load(file)
+    rows = compare_results(baseline["results"], results, max_regression)
+    print(f"Сравнение с коммитом {baseline.get('commit')}:")
+    print_table(
+        ["этап", "показатель", "было", "стало", "изменение", "регрессия"],
+        [row[:-1] + ["да" if row[-1] else ""] for row in rows],
+    )
+    return not any(row[-1] for row in rows)
+
+
+def synthetic_chunk_rows(count: int, seed: int = 0) -> Iterator[tuple]:
+    """Возвращает синтетические строки таблицы chunk по одной, не создавая
+    весь набор в памяти
+
+    Args:
+        count (int): количество строк
+        seed (int): начальное значение генератора случайных чисел
+
+    Returns:
+        Iterator[tuple]: значения столбцов `COPY_COLUMNS` по строке на фрагмент
+    """
+
+    rng = np.random.default_rng(seed)
+    for i in range(count):
+        embedding = rng.normal(size=1024).astype(np.float32)
+        yield (
+            f"https://confluence.example/pages/{i // 8}",
+            str(i // 8),
+            1,
+            f"{i // 8:064x}",
+            synthetic_chunk_text(rng, 30),
+            embedding / np.linalg.norm(embedding),
+        )
+
+
+def measure_chunk_writes(
+    database_url: str, method: str, count: int, batch_size: int
+) -> dict:
+    """Записывает синтетические фрагменты документов в таблицу chunk
+    и удаляет их. Выполняется в отдельном процессе, чтобы пиковое потребление
+    памяти относилось только к одному способу записи
+
+    Args:
+        database_url (str): адрес БД с пустой таблицей chunk
+        method (str): orm — объекты Chunk через `session.add` с одной фиксацией
+            в конце, copy — `confluence_retrieving.copy_chunks`
+        count (int): количество фрагментов
+        batch_size (int): количество строк в одной команде COPY
+
+    Returns:
+        dict: время записи в секундах и пиковое потребление памяти процессом в МБ
+    """
+
+    engine = create_engine(database_url)
+    start = time.perf_counter()
+    with Session(engine) as session:
+        if method == "copy":
+            copy_chunks(session, synthetic_chunk_rows(count), batch_size)
+        else:
+            for row in synthetic_chunk_rows(count):
+                session.add(Chunk(**dict(zip(COPY_COLUMNS, row))))
+        session.commit()
+    elapsed = time.perf_counter() - start
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    with Session(engine) as session:
+        session.execute(delete(Chunk))
+        session.commit()
+    return {"elapsed": elapsed, "max_rss": max_rss}
+
+
+def chunk_writes(
+    engine: Engine, count: int, batch_size: int, methods: list[str]
+) -> bool:
+    """Сравнивает запись фрагментов документов при переиндексации объектами ORM
+    и командой COPY в двоичном формате: скорость записи и пиковое потребление
+    памяти. Каждый способ измеряется в отдельном процессе. Чтобы не испортить
+    индекс документов, замеры выполняются только на пустой таблице chunk
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        count (int): количество фрагментов
+        batch_size (int): количество строк в одной команде COPY
+        methods (list[str]): способы записи (см. `measure_chunk_writes`)
+
+    Returns:
+        bool: True, если замеры выполнены, False — если таблица не пуста
+    """
+
+    with Session(engine) as session:
+        session.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        session.commit()
+    Chunk.__table__.create(engine, checkfirst=True)
+    with Session(engine) as session:
+        if session.scalar(select(func.count(Chunk.id))) > 0:
+            print("Таблица chunk не пуста")
+            return False
+    database_url = engine.url.render_as_string(hide_password=False)
+    rows = []
+    for method in methods:
+        with ProcessPoolExecutor(
+            max_workers=1, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            result = executor.submit(
+                measure_chunk_writes, database_url, method, count, batch_size
+            ).result()
+        rows.append(
+            [method, result["elapsed"], count / result["elapsed"], result["max_rss"]]
+        )
+    print(f"Фрагментов: {count}, строк в команде COPY: {batch_size}")
+    print_table(["способ", "время, с", "строк/с", "пик RSS, МБ"], rows)
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    index_recall_parser = commands.add_parser(
+        "index-recall", help="полнота и время поиска по HNSW-индексу"
+    )
+    index_recall_parser.add_argument("--questions", type=int, default=200)
+    index_recall_parser.add_argument("--k", type=int, default=5)
+    index_recall_parser.add_argument(
+        "--ef-search", type=int, nargs="+", default=[10, 20, 40, 80, 160]
+    )
+    encoder_batching_parser = commands.add_parser(
+        "encoder-batching",
+        help="пропускная способность модели при объединении вопросов в пакеты",
+    )
+    encoder_batching_parser.add_argument("--questions", type=int, default=256)
+    encoder_batching_parser.add_argument("--concurrency", type=int, default=16)
+    encoder_batching_parser.add_argument(
+        "--window", type=float, nargs="+", default=[0, 0.005, 0.01, 0.02, 0.05]
+    )
+    encoder_batching_parser.add_argument("--max-batch-size", type=int, default=16)
+    encoder_backends_parser = commands.add_parser(
+        "encoder-backends",
+        help="задержка, память и точность модели при разных способах выполнения",
+    )
+    encoder_backends_parser.add_argument(
+        "--backends", nargs="+", default=["torch", "onnx", "onnx-int8"]
+    )
+    encoder_backends_parser.add_argument("--questions", type=int, default=100)
+    encoder_backends_parser.add_argument("--texts", type=int, default=500)
+    vector_storage_parser = commands.add_parser(
+        "vector-storage",
+        help="размер индекса и точность поиска при разных представлениях векторов",
+    )
+    vector_storage_parser.add_argument("--questions", type=int, default=200)
+    vector_storage_parser.add_argument(
+        "--dimensions", type=int, nargs="+", default=[256, 512, 768]
+    )
+    binary_rescore_parser = commands.add_parser(
+        "binary-rescore",
+        help="двухэтапный поиск по бинарно квантизованным векторам и полный перебор",
+    )
+    binary_rescore_parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    binary_rescore_parser.add_argument("--queries", type=int, default=100)
+    binary_rescore_parser.add_argument(
+        "--candidates", type=int, nargs="+", default=[10, 40, 100]
+    )
+    pipeline_parser = commands.add_parser(
+        "pipeline",
+        help="пропускная способность и задержки этапов ответа на вопрос "
+        "на синтетических фрагментах с заглушкой LLM",
+    )
+    pipeline_parser.add_argument(
+        "--storage", choices=["memory", "postgres"], default="memory"
+    )
+    pipeline_parser.add_argument(
+        "--database-url", help="пустая БД с pgvector для --storage postgres"
+    )
+    pipeline_parser.add_argument(
+        "--encoder", choices=["model", "stub"], default="model"
+    )
+    pipeline_parser.add_argument("--encoder-latency", type=float, default=0.02)
+    pipeline_parser.add_argument("--chunks", type=int, default=10_000)
+    pipeline_parser.add_argument("--requests", type=int, default=200)
+    pipeline_parser.add_argument("--concurrency", type=int, default=8)
+    pipeline_parser.add_argument("--llm-latency", type=float, default=1.0)
+    pipeline_parser.add_argument("--llm-jitter", type=float, default=0.3)
+    pipeline_parser.add_argument("--output", help="файл результатов JSON")
+    pipeline_parser.add_argument(
+        "--baseline", help="файл результатов предыдущей версии для сравнения"
+    )
+    pipeline_parser.add_argument("--max-regression", type=float, default=0.2)
+    chunk_writes_parser = commands.add_parser(
+        "chunk-writes",
+        help="скорость записи фрагментов и потребление памяти при ORM и COPY",
+    )
+    chunk_writes_parser.add_argument(
+        "--database-url", help="БД с пустой таблицей chunk вместо основной"
+    )
+    chunk_writes_parser.add_argument("--chunks", type=int, default=20_000)
+    chunk_writes_parser.add_argument(
+        "--batch-size", type=int, default=Config.REINDEX_COPY_BATCH_SIZE
+    )
+    chunk_writes_parser.add_argument(
+        "--methods", nargs="+", choices=["orm", "copy"], default=["orm", "copy"]
+    )
+    args = parser.parse_args()
+
+    engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+    if args.command == "index-recall":
+        index_recall(
+            engine,
+            load_encoder_model(Config.ENCODER_BACKEND),
+            args.questions,
+            args.k,
+            args.ef_search,
+        )
+    elif args.command == "encoder-batching":
+        encoder_batching(
+            load_encoder_model(Config.ENCODER_BACKEND),
+            args.questions,
+            args.concurrency,
+            args.window,
+            args.max_batch_size,
+        )
+    elif args.command == "encoder-backends":
+        encoder_backends(engine, args.backends, args.questions, args.texts)
+    elif args.command == "vector-storage":
+        vector_storage(
+            engine,
+            load_encoder_model(Config.ENCODER_BACKEND),
+            args.questions,
+            args.dimensions,
+        )
+    elif args.command == "binary-rescore":
+        binary_rescore(engine, args.sizes, args.queries, args.candidates)
+    elif args.command == "pipeline":
+        if args.storage == "postgres" and args.database_url is None:
+            parser.error("--storage postgres требует --database-url")
+        passed = pipeline(
+            (
+                StubEncoder(args.encoder_latency)
+                if args.encoder == "stub"
+                else load_encoder_model(Config.ENCODER_BACKEND)
+            ),
+            (create_engine(args.database_url) if args.storage == "postgres" else None),
+            args.chunks,
+            args.requests,
+            args.concurrency,
+            args.llm_latency,
+            args.llm_jitter,
+            args.output,
+            args.baseline,
+            args.max_regression,
+        )
+        sys.exit(0 if passed else 1)
+    elif args.command == "chunk-writes":
+        passed = chunk_writes(
+            (create_engine(args.database_url) if args.database_url else engine),
+            args.chunks,
+            args.batch_size,
+            args.methods,
+        )
+        sys.exit(0 if passed else 1)
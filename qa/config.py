@@ -13,4 +13,56 @@ class Config:
     CONFLUENCE_TOKEN = environ.get("CONFLUENCE_TOKEN")
     CONFLUENCE_HOST = environ.get("CONFLUENCE_HOST")
     CONFLUENCE_SPACES = environ.get("CONFLUENCE_SPACES").split()
+    CONFLUENCE_CONCURRENCY = int(environ.get("CONFLUENCE_CONCURRENCY", 8))
+    CONFLUENCE_RATE_LIMIT = float(environ.get("CONFLUENCE_RATE_LIMIT", 20))
+    CONFLUENCE_RETRIES = int(environ.get("CONFLUENCE_RETRIES", 3))
+    CONFLUENCE_RETRY_BACKOFF = float(environ.get("CONFLUENCE_RETRY_BACKOFF", 1.0))
+    REINDEX_MODE = environ.get("REINDEX_MODE", "incremental")
+    REINDEX_BATCH_SIZE = int(environ.get("REINDEX_BATCH_SIZE", 16))
+    REINDEX_ENCODE_PROCESSES = int(environ.get("REINDEX_ENCODE_PROCESSES", 1))
+    REINDEX_COPY_BATCH_SIZE = int(environ.get("REINDEX_COPY_BATCH_SIZE", 1000))
     SQLALCHEMY_DATABASE_URI = f"postgresql://{environ.get('POSTGRES_USER')}:{environ.get('POSTGRES_PASSWORD')}@{environ.get('POSTGRES_HOST')}/{environ.get('POSTGRES_DB')}"
+    HNSW_EF_SEARCH = int(environ.get("HNSW_EF_SEARCH", 40))
+    VECTOR_SEARCH_MODE = environ.get("VECTOR_SEARCH_MODE", "full")
+    BINARY_CANDIDATES = int(environ.get("BINARY_CANDIDATES", 40))
+    RETRIEVAL_ENGINE = environ.get("RETRIEVAL_ENGINE", "postgres")
+    EMBEDDING_SNAPSHOT_PATH = environ.get("EMBEDDING_SNAPSHOT_PATH", "saved_index")
+    EMBEDDING_SNAPSHOT_DTYPE = environ.get("EMBEDDING_SNAPSHOT_DTYPE", "float32")
+    ENCODER_BACKEND = environ.get("ENCODER_BACKEND", "torch")
+    QUESTION_CACHE_MAX_BYTES = int(environ.get("QUESTION_CACHE_MAX_BYTES", 64 * 2**20))
+    QUESTION_CACHE_TTL = float(environ.get("QUESTION_CACHE_TTL", 24 * 60 * 60))
+    ENCODER_BATCH_WINDOW = float(environ.get("ENCODER_BATCH_WINDOW", 0.01))
+    ENCODER_MAX_BATCH_SIZE = int(environ.get("ENCODER_MAX_BATCH_SIZE", 16))
+    CONTEXT_TOKEN_BUDGET = int(environ.get("CONTEXT_TOKEN_BUDGET", 512))
+    SENTENCE_CACHE_MAX_CHUNKS = int(environ.get("SENTENCE_CACHE_MAX_CHUNKS", 512))
+    LLM_MAX_CONCURRENCY = int(environ.get("LLM_MAX_CONCURRENCY", 8))
+    LLM_TIMEOUT = float(environ.get("LLM_TIMEOUT", 30))
+    LLM_RETRIES = int(environ.get("LLM_RETRIES", 2))
+    LLM_RETRY_BACKOFF = float(environ.get("LLM_RETRY_BACKOFF", 0.5))
+    LLM_HEDGING = environ.get("LLM_HEDGING", "false").lower() == "true"
+    LLM_HEDGE_MIN_SAMPLES = int(environ.get("LLM_HEDGE_MIN_SAMPLES", 20))
+    LLM_BREAKER_FAILURES = int(environ.get("LLM_BREAKER_FAILURES", 5))
+    LLM_BREAKER_RESET_TIMEOUT = float(environ.get("LLM_BREAKER_RESET_TIMEOUT", 30))
+    QA_WORKERS = int(environ.get("QA_WORKERS", 1))
+    QA_WORKER_RESTART_DELAY = float(environ.get("QA_WORKER_RESTART_DELAY", 1))
+    QA_WORKER_MAX_RESTARTS = int(environ.get("QA_WORKER_MAX_RESTARTS", 5))
+    TORCH_NUM_THREADS = int(environ.get("TORCH_NUM_THREADS", 0))
+    INDEX_GENERATION_PATH = environ.get("INDEX_GENERATION_PATH", "index_generation")
+    QA_CPU_WORKERS = int(environ.get("QA_CPU_WORKERS", 16))
+    QA_IO_WORKERS = int(environ.get("QA_IO_WORKERS", 32))
+    QA_MAX_PENDING_REQUESTS = int(environ.get("QA_MAX_PENDING_REQUESTS", 64))
+    QA_BATCH_MAX_SIZE = int(environ.get("QA_BATCH_MAX_SIZE", 256))
+    QA_BATCH_LLM_CONCURRENCY = int(environ.get("QA_BATCH_LLM_CONCURRENCY", 4))
+    LEXICAL_SEARCH = environ.get("LEXICAL_SEARCH", "true").lower() == "true"
+    LEXICAL_MIN_RANK = float(environ.get("LEXICAL_MIN_RANK", 0.1))
+    LEXICAL_RANK_MARGIN = float(environ.get("LEXICAL_RANK_MARGIN", 2.0))
+    ANSWER_CACHE_THRESHOLD = float(environ.get("ANSWER_CACHE_THRESHOLD", 0.95))
+    ANSWER_CACHE_MAX_SIZE = int(environ.get("ANSWER_CACHE_MAX_SIZE", 2048))
+    ANSWER_CACHE_TTL = float(environ.get("ANSWER_CACHE_TTL", 24 * 60 * 60))
+    KNOWN_ANSWERS = environ.get("KNOWN_ANSWERS", "true").lower() == "true"
+    KNOWN_ANSWERS_THRESHOLD = float(environ.get("KNOWN_ANSWERS_THRESHOLD", 0.95))
+    ASYNC_RETRIEVAL = environ.get("ASYNC_RETRIEVAL", "false").lower() == "true"
+    ASYNC_POOL_SIZE = int(environ.get("ASYNC_POOL_SIZE", 10))
+    STARTUP_RETRIES = int(environ.get("STARTUP_RETRIES", 3))
+    STARTUP_RETRY_BACKOFF = float(environ.get("STARTUP_RETRY_BACKOFF", 5))
+    SQLALCHEMY_ASYNC_DATABASE_URI = f"postgresql+asyncpg://{environ.get('POSTGRES_USER')}:{environ.get('POSTGRES_PASSWORD')}@{environ.get('POSTGRES_HOST')}/{environ.get('POSTGRES_DB')}"
@@ -0,0 +1,145 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import logging
+import random
+import threading
+import time
+from typing import Any, Callable, Iterable
+import requests
+
+
+class RateLimiter:
+    """Ограничитель частоты запросов: запросы всех потоков распределяются
+    во времени равномерно, не чаще `rate` запросов в секунду
+
+    Args:
+        rate (float): максимальное количество запросов в секунду, 0 — без ограничения
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Ожидает, пока можно будет отправить следующий запрос"""
+
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + 1 / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def is_retryable_error(e: Exception) -> bool:
+    """Проверяет, может ли повторный запрос к Confluence завершиться успешно:
+    таймауты, сетевые ошибки и ответы со статусом 429 или 5xx
+
+    Args:
+        e (Exception): исключение, возникшее при запросе
+
+    Returns:
+        bool: True, если ошибка временная
+    """
+
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(e, "response", None)
+    if isinstance(e, requests.HTTPError) and response is not None:
+        return response.status_code == 429 or response.status_code >= 500
+    return False
+
+
+def retry_after(e: Exception) -> float | None:
+    """Возвращает задержку перед повторным запросом из заголовка Retry-After
+    ответа Confluence
+
+    Args:
+        e (Exception): исключение, возникшее при запросе
+
+    Returns:
+        float | None: задержка в секундах или None, если заголовка нет
+    """
+
+    response = getattr(e, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class ConfluenceCrawler:
+    """Выполняет запросы к Confluence при обходе страниц: не больше `concurrency`
+    запросов одновременно и не чаще `rate` в секунду, с повторными попытками
+    при временных ошибках. Задержка перед повторной попыткой берётся
+    из заголовка Retry-After или выбирается случайно от 0 до `backoff * 2^попытка`
+
+    Args:
+        concurrency (int): максимальное количество одновременных запросов
+        rate (float): максимальное количество запросов в секунду, 0 — без ограничения
+        retries (int): количество повторных попыток
+        backoff (float): базовая задержка перед повторной попыткой в секундах
+    """
+
+    def __init__(self, concurrency: int, rate: float, retries: int, backoff: float):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.requests = 0
+        self.retried = 0
+        self._limiter = RateLimiter(rate)
+        self._lock = threading.Lock()
+
+    def call(self, function: Callable, *args, **kwargs) -> Any:
+        """Выполняет запрос к Confluence с ограничением частоты и повторными попытками
+
+        Args:
+            function (Callable): функция, выполняющая запрос
+
+        Returns:
+            Any: результат функции
+        """
+
+        for attempt in range(self.retries + 1):
+            self._limiter.acquire()
+            with self._lock:
+                self.requests += 1
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                if attempt == self.retries or not is_retryable_error(e):
+                    raise
+                pause = retry_after(e)
+                if pause is None:
+                    pause = random.uniform(0, self.backoff * 2**attempt)
+                logging.warning(
+                    f"CONFLUENCE REQUEST FAILED ({e}), RETRYING IN {pause:.2f}s"
+                )
+                with self._lock:
+                    self.retried += 1
+                time.sleep(pause)
+
+    def map(self, function: Callable, items: Iterable) -> list:
+        """Выполняет запросы к Confluence для каждого элемента параллельно
+        в `concurrency` потоках. Если запрос не удался после всех попыток,
+        исключение передаётся вызывающему
+
+        Args:
+            function (Callable): функция, выполняющая запрос, принимает элемент
+            items (Iterable): элементы, например ID страниц
+
+        Returns:
+            list: результаты функции в порядке элементов
+        """
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                return list(executor.map(partial(self.call, function), items))
+            except BaseException:
+                executor.shutdown(cancel_futures=True)
+                raise
@@ -1,28 +1,63 @@
+import asyncio
+from functools import partial
+import hashlib
+import io
+import itertools
 import logging
+import struct
+import time
+from typing import Iterable
 from atlassian import Confluence
 from bs4 import BeautifulSoup
-from langchain_community.document_loaders import PyPDFLoader
 from langchain_core.documents import Document
 from langchain_text_splitters import TextSplitter
+import numpy as np
+from pypdf import PdfReader
 from sentence_transformers import SentenceTransformer
-from sqlalchemy import Engine, select
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import (
+    ColumnElement,
+    Engine,
+    Integer,
+    Row,
+    Select,
+    Text,
+    cast,
+    column,
+    delete,
+    func,
+    select,
+    true,
+    update,
+    values,
+)
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
 from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex, DropIndex
 from config import Config
-from database import Chunk
+from database import VECTOR_SEARCH_INDEXES, Chunk, EmptyPage
+from confluence_crawling import ConfluenceCrawler
+from embedding_snapshot import EmbeddingSnapshot, export_embedding_snapshot
+from encoding import encode_documents
 
 
 def get_document_content_by_id(
-    confluence: Confluence, page_id: str
+    confluence: Confluence, crawler: ConfluenceCrawler, page_id: str
 ) -> tuple[str | None, str | None]:
     """Возвращает содержимое страницы на Confluence
-    после предобработки с помощью PyPDF или BS4 и ссылку на страницу
+    после предобработки с помощью PyPDF или BS4 и ссылку на страницу.
+    PDF-файл страницы загружается через `crawler` с теми же ограничением
+    частоты и повторными попытками, что и остальные запросы к Confluence
 
     Args:
         confluence (Confluence): экземпляр Confluence
+        crawler (ConfluenceCrawler): исполнитель запросов к Confluence
         page_id (str): ID страницы
 
     Returns:
-        tuple[str | None, str | None]: содержимое страницы, ссылка на страницу
+        tuple[str | None, str | None]: содержимое страницы (пустая строка, если
+            на странице нет текста и PDF-файла), ссылка на страницу; при ошибке
+            предобработки — None, None
     """
 
     page = confluence.get_page_by_id(page_id, expand="space,body.export_view")
@@ -40,77 +75,381 @@ def get_document_content_by_id(
             page_body_text = soup.get_text(separator=" ")
             page_content = page_body_text.replace(" \n ", "")
         elif ".pdf" in page_download.lower():
-            loader = PyPDFLoader(page_download.split("?")[0])
+            pdf = crawler.call(
+                confluence.get, page_download, not_json_response=True, absolute=True
+            )
             page_content = " ".join(
-                [page.page_content for page in loader.load_and_split()]
+                [page.extract_text() for page in PdfReader(io.BytesIO(pdf)).pages]
             )
         else:
-            return None, None
+            return "", page_link
     except Exception as e:
         logging.error(e)
         return None, None
     return page_content, page_link
 
 
-def reindex_confluence(
-    engine: Engine, text_splitter: TextSplitter, encoder_model: SentenceTransformer
-):
-    """Пересоздаёт векторный индекс текстов для ответов на вопросы.
-    При этом обрабатываются страницы, не имеющие вложенных страниц.
+def get_leaf_page_versions(
+    confluence: Confluence, crawler: ConfluenceCrawler
+) -> dict[str, int]:
+    """Возвращает номера версий страниц из пространств `Config.CONFLUENCE_SPACES`,
+    не имеющих вложенных страниц. Версии и предки страниц загружаются вместе
+    со списком страниц постраничными запросами CQL, поэтому для каждой страницы
+    не требуется отдельных запросов
 
     Args:
-        engine (Engine): экземпляр подключения к БД
-        text_splitter (TextSplitter): разделитель текста на фрагменты
-        encoder_model (SentenceTransformer): модель получения векторных представлений Sentence Transformer
+        confluence (Confluence): экземпляр Confluence
+        crawler (ConfluenceCrawler): исполнитель запросов к Confluence
+
+    Returns:
+        dict[str, int]: номера версий страниц по их ID
     """
 
-    logging.warning("START CREATE INDEX")
-    confluence = Confluence(url=Config.CONFLUENCE_HOST, token=Config.CONFLUENCE_TOKEN)
     spaces = (
         "("
         + " or ".join([f"space = {space}" for space in Config.CONFLUENCE_SPACES])
         + ")"
     )
-    page_ids = []
+    versions = {}
+    parent_ids = set()
     count_start = 0
     limit = 100
     while True:
         query = f"{spaces} order by id"
-        pages = confluence.cql(query, start=count_start, limit=limit)["results"]
+        pages = crawler.call(
+            confluence.cql,
+            query,
+            start=count_start,
+            limit=limit,
+            expand="content.version,content.ancestors",
+        )["results"]
         if len(pages) == 0:
             break
-        page_ids += [
-            page["content"]["id"] for page in pages if "content" in page.keys()
-        ]
-        count_start += limit
+        for page in pages:
+            if "content" not in page.keys():
+                continue
+            content = page["content"]
+            versions[content["id"]] = content.get("version", {}).get("number", 0)
+            parent_ids.update(
+                ancestor["id"] for ancestor in content.get("ancestors", [])
+            )
+        # Confluence может вернуть меньше `limit` результатов, если ограничивает размер страницы
+        count_start += len(pages)
+    return {
+        page_id: version
+        for page_id, version in versions.items()
+        if page_id not in parent_ids
+    }
+
+
+def get_indexed_page_versions(
+    session: Session,
+) -> dict[str, tuple[int, str | None]]:
+    """Возвращает номера версий и хеши текстов страниц в векторном индексе,
+    а также номера версий страниц без текста `EmptyPage`
+
+    Args:
+        session (Session): сессия подключения к БД
+
+    Returns:
+        dict[str, tuple[int, str | None]]: номера версий и хеши текстов страниц
+            по их ID, для страниц без текста хеш равен None
+    """
+
+    indexed = {
+        row.page_id: (row.page_version, None)
+        for row in session.execute(select(EmptyPage.page_id, EmptyPage.page_version))
+    }
+    indexed |= {
+        row.page_id: (row.page_version, row.content_hash)
+        for row in session.execute(
+            select(Chunk.page_id, Chunk.page_version, Chunk.content_hash)
+            .where(Chunk.page_id.is_not(None))
+            .distinct()
+        )
+    }
+    return indexed
+
+
+def plan_reindex(
+    versions: dict[str, int], indexed: dict[str, tuple[int, str | None]]
+) -> tuple[list[str], list[str]]:
+    """Сравнивает номера версий страниц в вики-системе и в векторном индексе
+
+    Args:
+        versions (dict[str, int]): номера версий страниц в вики-системе по их ID
+        indexed (dict[str, tuple[int, str | None]]): номера версий и хеши текстов
+            страниц в векторном индексе и страниц без текста по их ID
+
+    Returns:
+        tuple[list[str], list[str]]: ID новых и изменившихся страниц,
+            ID страниц, удалённых из вики-системы
+    """
+
+    changed = [
+        page_id
+        for page_id, version in versions.items()
+        if page_id not in indexed or indexed[page_id][0] != version
+    ]
+    removed = [page_id for page_id in indexed if page_id not in versions]
+    return changed, removed
+
+
+COPY_COLUMNS = (
+    "confluence_url",
+    "page_id",
+    "page_version",
+    "content_hash",
+    "text",
+    "embedding",
+)
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+COPY_TRAILER = struct.pack(">h", -1)
+
+
+def copy_field(value: str | int | np.ndarray | None) -> bytes:
+    """Возвращает значение столбца фрагмента документа в двоичном формате COPY:
+    длину и содержимое — текст в UTF-8, int4 или vector в формате pgvector
+    (размерность, зарезервированное поле, компоненты float4 в сетевом порядке байт)
+
+    Args:
+        value (str | int | np.ndarray | None): значение столбца
+
+    Returns:
+        bytes: значение столбца в двоичном формате COPY
+    """
+
+    if value is None:
+        return struct.pack(">i", -1)
+    if isinstance(value, str):
+        data = value.encode()
+    elif isinstance(value, int):
+        data = struct.pack(">i", value)
+    else:
+        vector = np.asarray(value, dtype=">f4")
+        data = struct.pack(">HH", len(vector), 0) + vector.tobytes()
+    return struct.pack(">i", len(data)) + data
+
+
+def copy_payload(rows: list[tuple]) -> bytes:
+    """Возвращает строки таблицы chunk в двоичном формате COPY
+
+    Args:
+        rows (list[tuple]): значения столбцов `COPY_COLUMNS` по строке на фрагмент
+
+    Returns:
+        bytes: содержимое для COPY ... FROM STDIN WITH (FORMAT binary)
+    """
+
+    buffer = io.BytesIO()
+    buffer.write(COPY_HEADER)
+    for row in rows:
+        buffer.write(struct.pack(">h", len(row)))
+        for value in row:
+            buffer.write(copy_field(value))
+    buffer.write(COPY_TRAILER)
+    return buffer.getvalue()
+
+
+def copy_chunks(session: Session, rows: Iterable[tuple], batch_size: int) -> int:
+    """Записывает фрагменты документов в таблицу chunk командой COPY в двоичном
+    формате пакетами по `batch_size` строк в транзакции сессии, не создавая
+    объектов ORM, поэтому в памяти одновременно находится только один пакет
+
+    Args:
+        session (Session): сессия подключения к БД через psycopg2 или psycopg
+        rows (Iterable[tuple]): значения столбцов `COPY_COLUMNS` по строке на фрагмент
+        batch_size (int): количество строк в одной команде COPY
+
+    Returns:
+        int: количество записанных строк
+    """
+
+    query = f"COPY chunk ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT binary)"
+    connection = session.connection().connection.driver_connection
+    count = 0
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if len(batch) == 0:
+            break
+        payload = copy_payload(batch)
+        with connection.cursor() as cursor:
+            if hasattr(cursor, "copy_expert"):
+                cursor.copy_expert(query, io.BytesIO(payload))
+            else:
+                with cursor.copy(query) as copy:
+                    copy.write(payload)
+        count += len(batch)
+    return count
+
+
+def reindex_confluence(
+    engine: Engine,
+    text_splitter: TextSplitter,
+    encoder_model: SentenceTransformer,
+    incremental: bool = False,
+) -> dict:
+    """Обновляет векторный индекс текстов для ответов на вопросы.
+    При этом обрабатываются страницы, не имеющие вложенных страниц,
+    содержимое страниц загружается параллельно `ConfluenceCrawler`.
+    В инкрементальном режиме загружаются только новые страницы и страницы,
+    номер версии которых изменился, а фрагменты удалённых страниц удаляются;
+    если текст страницы не изменился, у её фрагментов обновляется только
+    номер версии. Номера версий страниц без текста сохраняются в `EmptyPage`,
+    чтобы они не загружались повторно, пока не изменятся. Фрагменты,
+    проиндексированные без ID страницы, пересоздаются.
+    Векторные представления фрагментов вычисляются пакетами `encode_documents`,
+    фрагменты записываются в БД командой COPY `copy_chunks`
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        text_splitter (TextSplitter): разделитель текста на фрагменты
+        encoder_model (SentenceTransformer): модель получения векторных представлений Sentence Transformer
+        incremental (bool): обновить только изменившиеся страницы вместо пересоздания индекса
+
+    Returns:
+        dict: количество загруженных `fetched`, переиндексированных `updated`,
+            удалённых `removed` страниц, страниц без текста `empty`
+            и созданных фрагментов `chunks`
+    """
+
+    logging.warning("START CREATE INDEX")
+    confluence = Confluence(url=Config.CONFLUENCE_HOST, token=Config.CONFLUENCE_TOKEN)
+    crawler = ConfluenceCrawler(
+        Config.CONFLUENCE_CONCURRENCY,
+        Config.CONFLUENCE_RATE_LIMIT,
+        Config.CONFLUENCE_RETRIES,
+        Config.CONFLUENCE_RETRY_BACKOFF,
+    )
+    versions = get_leaf_page_versions(confluence, crawler)
+    with Session(engine) as session:
+        indexed = get_indexed_page_versions(session) if incremental else {}
+    changed, removed = plan_reindex(versions, indexed)
     documents = []
-    for page_id in page_ids:
-        children = confluence.cql(f"parent={page_id}")["results"]
-        if len(children) > 0:
-            continue
-        page_content, page_link = get_document_content_by_id(confluence, page_id)
+    unchanged = []
+    empty = []
+    start = time.monotonic()
+    contents = crawler.map(
+        partial(get_document_content_by_id, confluence, crawler), changed
+    )
+    logging.warning(
+        f"FETCHED {len(changed)} PAGES IN {time.monotonic() - start:.1f}s, "
+        f"{crawler.requests} REQUESTS, {crawler.retried} RETRIED"
+    )
+    for page_id, (page_content, page_link) in zip(changed, contents):
         if page_content is None:
+            if page_id in indexed:
+                removed.append(page_id)
+            continue
+        if len(page_content.strip()) == 0:
+            empty.append(page_id)
+            continue
+        content_hash = hashlib.sha256(page_content.encode()).hexdigest()
+        if page_id in indexed and indexed[page_id][1] == content_hash:
+            unchanged.append(page_id)
             continue
         documents.append(
-            Document(page_content=page_content, metadata={"page_link": page_link})
+            Document(
+                page_content=page_content,
+                metadata={
+                    "page_link": page_link,
+                    "page_id": page_id,
+                    "page_version": versions[page_id],
+                    "content_hash": content_hash,
+                },
+            )
         )
     all_splits = text_splitter.split_documents(documents)
+    embeddings = encode_documents(
+        encoder_model,
+        [chunk.page_content for chunk in all_splits],
+        Config.REINDEX_BATCH_SIZE,
+        Config.REINDEX_ENCODE_PROCESSES,
+    )
     with Session(engine) as session:
-        session.query(Chunk).delete()
-        for chunk in all_splits:
-            session.add(
-                Chunk(
-                    confluence_url=chunk.metadata["page_link"],
-                    text=chunk.page_content,
-                    embedding=encoder_model.encode(chunk.page_content),
+        if incremental:
+            replaced = (
+                removed
+                + empty
+                + [document.metadata["page_id"] for document in documents]
+            )
+            session.execute(
+                delete(Chunk).where(
+                    Chunk.page_id.is_(None) | Chunk.page_id.in_(replaced)
                 )
             )
+            session.execute(delete(EmptyPage).where(EmptyPage.page_id.in_(replaced)))
+            for page_id in unchanged:
+                session.execute(
+                    update(Chunk)
+                    .where(Chunk.page_id == page_id)
+                    .values(page_version=versions[page_id])
+                )
+        else:
+            session.query(Chunk).delete()
+            session.query(EmptyPage).delete()
+        session.add_all(
+            [
+                EmptyPage(page_id=page_id, page_version=versions[page_id])
+                for page_id in empty
+            ]
+        )
+        copy_chunks(
+            session,
+            (
+                (
+                    chunk.metadata["page_link"],
+                    chunk.metadata["page_id"],
+                    chunk.metadata["page_version"],
+                    chunk.metadata["content_hash"],
+                    chunk.page_content,
+                    embedding,
+                )
+                for chunk, embedding in zip(all_splits, embeddings)
+            ),
+            Config.REINDEX_COPY_BATCH_SIZE,
+        )
         session.commit()
-    logging.warning("INDEX CREATED")
+    if Config.RETRIEVAL_ENGINE == "numpy":
+        export_embedding_snapshot(
+            engine, Config.EMBEDDING_SNAPSHOT_PATH, Config.EMBEDDING_SNAPSHOT_DTYPE
+        )
+    result = {
+        "fetched": len(changed),
+        "updated": len(documents),
+        "removed": len(removed),
+        "empty": len(empty),
+        "chunks": len(all_splits),
+    }
+    logging.warning(f"INDEX CREATED: {result}")
+    return result
+
+
+def prepare_vector_search_index(engine: Engine):
+    """Создаёт дополнительный HNSW-индекс режима поиска `Config.VECTOR_SEARCH_MODE`,
+    если его нет, и удаляет индексы других режимов, чтобы они не обновлялись
+    при переиндексации и не занимали место на диске. Для режима full
+    дополнительные индексы не нужны
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+    """
+
+    with engine.begin() as connection:
+        for mode, index in VECTOR_SEARCH_INDEXES.items():
+            if mode == Config.VECTOR_SEARCH_MODE:
+                logging.warning(f"CREATE INDEX {index.name} IF NOT EXISTS")
+                connection.execute(CreateIndex(index, if_not_exists=True))
+            else:
+                connection.execute(DropIndex(index, if_exists=True))
 
 
 def get_chunk(
-    engine: Engine, encoder_model: SentenceTransformer, question: str
+    engine: Engine,
+    encoder_model: SentenceTransformer,
+    question: str,
+    snapshot: EmbeddingSnapshot | None = None,
 ) -> Chunk | None:
     """Возвращает ближайший к вопросу фрагмент документа Chunk из векторной базы данных
 
@@ -118,14 +457,465 @@ def get_chunk(
         engine (Engine): экземпляр подключения к БД
         encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
         question (str): вопрос пользователя
+        snapshot (EmbeddingSnapshot | None): снимок векторных представлений фрагментов,
+            если задан, ближайший фрагмент ищется в нём, а из БД загружается только по ID
 
     Returns:
         Chunk | None: экземпляр класса Chunk — фрагмент документа
     """
 
-    with Session(engine) as session:
-        return session.scalars(
+    return get_chunk_by_embedding(engine, encoder_model.encode(question), snapshot)
+
+
+def embedding_distance(
+    embedding: np.ndarray | ColumnElement,
+) -> ColumnElement[float]:
+    """Возвращает выражение косинусного расстояния от фрагмента документа
+    до векторного представления вопроса: по полным векторам fp32 или, если
+    Config.VECTOR_SEARCH_MODE = half, по их копиям в половинной точности,
+    для которых построен отдельный HNSW-индекс вдвое меньшего размера
+
+    Args:
+        embedding (np.ndarray | ColumnElement): векторное представление вопроса
+            или выражение, его содержащее
+
+    Returns:
+        ColumnElement[float]: выражение косинусного расстояния
+    """
+
+    if Config.VECTOR_SEARCH_MODE == "half":
+        return cast(Chunk.embedding, HALFVEC(1024)).cosine_distance(
+            cast(embedding, HALFVEC(1024))
+        )
+    return Chunk.embedding.cosine_distance(embedding)
+
+
+def nearest_chunks_query(
+    embedding: np.ndarray | ColumnElement, limit: int = 1
+) -> Select:
+    """Возвращает запрос ближайших к векторному представлению вопроса
+    фрагментов документов. Если Config.VECTOR_SEARCH_MODE = binary, поиск
+    двухэтапный: Config.BINARY_CANDIDATES кандидатов отбираются по расстоянию
+    Хэмминга между бинарно квантизованными векторами с помощью их HNSW-индекса,
+    затем кандидаты упорядочиваются по точному косинусному расстоянию fp32
+
+    Args:
+        embedding (np.ndarray | ColumnElement): векторное представление вопроса
+            или выражение, его содержащее
+        limit (int): количество фрагментов
+
+    Returns:
+        Select: запрос фрагментов документов
+    """
+
+    if Config.VECTOR_SEARCH_MODE == "binary":
+        candidates = (
+            select(Chunk.id, Chunk.embedding)
+            .order_by(
+                cast(func.binary_quantize(Chunk.embedding), BIT(1024)).hamming_distance(
+                    func.binary_quantize(cast(embedding, Vector(1024)))
+                )
+            )
+            .limit(max(Config.BINARY_CANDIDATES, limit))
+            .subquery()
+        )
+        return (
             select(Chunk)
-            .order_by(Chunk.embedding.cosine_distance(encoder_model.encode(question)))
-            .limit(1)
-        ).first()
+            .join(candidates, Chunk.id == candidates.c.id)
+            .order_by(candidates.c.embedding.cosine_distance(embedding))
+            .limit(limit)
+        )
+    return select(Chunk).order_by(embedding_distance(embedding)).limit(limit)
+
+
+def nearest_chunks_batch_query(embeddings: np.ndarray) -> Select:
+    """Возвращает запрос ближайших фрагментов документов сразу для нескольких
+    векторных представлений вопросов: векторы передаются списком VALUES,
+    и для каждого из них подзапрос LATERAL находит ближайший фрагмент
+    так же, как `nearest_chunks_query`, с помощью векторного индекса
+
+    Args:
+        embeddings (np.ndarray): векторные представления вопросов, по строке на вопрос
+
+    Returns:
+        Select: запрос номеров вопросов `position` и ближайших к ним фрагментов
+            документов (None, если фрагментов нет) в порядке вопросов
+    """
+
+    queries = values(
+        column("position", Integer), column("embedding", Vector(1024)), name="queries"
+    ).data([(i, embedding) for i, embedding in enumerate(embeddings)])
+    nearest = (
+        nearest_chunks_query(cast(queries.c.embedding, Vector(1024)))
+        .with_only_columns(Chunk.id)
+        .lateral("nearest")
+    )
+    return (
+        select(queries.c.position, Chunk)
+        .select_from(queries)
+        .outerjoin(nearest, true())
+        .outerjoin(Chunk, Chunk.id == nearest.c.id)
+        .order_by(queries.c.position)
+    )
+
+
+def search_settings_query() -> Select:
+    """Возвращает запрос, устанавливающий до конца транзакции параметры
+    поиска по векторному индексу. При двухэтапном поиске hnsw.ef_search
+    не меньше количества кандидатов, так как индекс возвращает не больше
+    ef_search строк
+
+    Returns:
+        Select: запрос установки параметров
+    """
+
+    ef_search = Config.HNSW_EF_SEARCH
+    if Config.VECTOR_SEARCH_MODE == "binary":
+        ef_search = max(ef_search, Config.BINARY_CANDIDATES)
+    return select(func.set_config("hnsw.ef_search", str(ef_search), True))
+
+
+def lexical_chunks_query(question: str) -> Select:
+    """Возвращает запрос двух фрагментов документов, содержащих все значимые
+    слова вопроса, с наибольшей оценкой полнотекстового соответствия вопросу
+
+    Args:
+        question (str): вопрос пользователя
+
+    Returns:
+        Select: запрос фрагментов документов и их оценок `rank`
+    """
+
+    query = func.plainto_tsquery("russian", question)
+    rank = func.ts_rank_cd(Chunk.text_search, query)
+    return (
+        select(Chunk, rank.label("rank"))
+        .where(Chunk.text_search.op("@@")(query))
+        .order_by(rank.desc())
+        .limit(2)
+    )
+
+
+def lexical_chunks_batch_query(questions: list[str]) -> Select:
+    """Возвращает запрос фрагментов документов полнотекстовым поиском сразу
+    для нескольких вопросов: вопросы передаются списком VALUES, и для каждого
+    из них подзапрос LATERAL находит два фрагмента так же, как `lexical_chunks_query`
+
+    Args:
+        questions (list[str]): вопросы пользователей
+
+    Returns:
+        Select: запрос номеров вопросов `position`, фрагментов документов и их
+            оценок `rank` в порядке вопросов и убывания оценок; вопросы без
+            найденных фрагментов отсутствуют в результате
+    """
+
+    queries = values(
+        column("position", Integer), column("question", Text), name="queries"
+    ).data(list(enumerate(questions)))
+    query = func.plainto_tsquery("russian", queries.c.question)
+    rank = func.ts_rank_cd(Chunk.text_search, query)
+    matches = (
+        select(Chunk.id, rank.label("rank"))
+        .where(Chunk.text_search.op("@@")(query))
+        .order_by(rank.desc())
+        .limit(2)
+        .correlate_except(Chunk)
+        .lateral("matches")
+    )
+    return (
+        select(queries.c.position, Chunk, matches.c.rank)
+        .select_from(queries)
+        .join(matches, true())
+        .join(Chunk, Chunk.id == matches.c.id)
+        .order_by(queries.c.position, matches.c.rank.desc())
+    )
+
+
+def decisive_lexical_chunk(rows: list[Row]) -> Chunk | None:
+    """Возвращает найденный полнотекстовым поиском фрагмент документа,
+    если его оценка не меньше `Config.LEXICAL_MIN_RANK` и хотя бы
+    в `Config.LEXICAL_RANK_MARGIN` раз выше оценки следующего фрагмента
+
+    Args:
+        rows (list[Row]): результат запроса `lexical_chunks_query`
+
+    Returns:
+        Chunk | None: экземпляр класса Chunk — фрагмент документа или None,
+            если результат полнотекстового поиска неоднозначен
+    """
+
+    if len(rows) == 0 or rows[0].rank < Config.LEXICAL_MIN_RANK:
+        return None
+    if len(rows) > 1 and rows[0].rank < rows[1].rank * Config.LEXICAL_RANK_MARGIN:
+        return None
+    return rows[0].Chunk
+
+
+def decisive_lexical_chunks(rows: list[Row], size: int) -> list[Chunk | None]:
+    """Возвращает найденные полнотекстовым поиском фрагменты документов
+    для нескольких вопросов, отбирая их так же, как `decisive_lexical_chunk`
+
+    Args:
+        rows (list[Row]): результат запроса `lexical_chunks_batch_query`
+        size (int): количество вопросов
+
+    Returns:
+        list[Chunk | None]: экземпляры класса Chunk — фрагменты документов в порядке
+            вопросов или None, если результат полнотекстового поиска неоднозначен
+    """
+
+    grouped = {
+        position: list(group)
+        for position, group in itertools.groupby(rows, key=lambda row: row.position)
+    }
+    return [decisive_lexical_chunk(grouped.get(i, [])) for i in range(size)]
+
+
+def get_chunk_lexical(engine: Engine, question: str) -> Chunk | None:
+    """Возвращает фрагмент документа Chunk, однозначно найденный по словам вопроса
+    полнотекстовым поиском, что позволяет не вычислять векторное представление вопроса
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        question (str): вопрос пользователя
+
+    Returns:
+        Chunk | None: экземпляр класса Chunk — фрагмент документа или None,
+            если результат полнотекстового поиска неоднозначен
+    """
+
+    with Session(engine) as session:
+        return decisive_lexical_chunk(
+            session.execute(lexical_chunks_query(question)).all()
+        )
+
+
+async def aget_chunk_lexical(async_engine: AsyncEngine, question: str) -> Chunk | None:
+    """Асинхронно возвращает фрагмент документа Chunk, однозначно найденный
+    по словам вопроса полнотекстовым поиском
+
+    Args:
+        async_engine (AsyncEngine): экземпляр асинхронного подключения к БД
+        question (str): вопрос пользователя
+
+    Returns:
+        Chunk | None: экземпляр класса Chunk — фрагмент документа или None,
+            если результат полнотекстового поиска неоднозначен
+    """
+
+    async with AsyncSession(async_engine) as session:
+        return decisive_lexical_chunk(
+            (await session.execute(lexical_chunks_query(question))).all()
+        )
+
+
+def get_chunks_lexical(engine: Engine, questions: list[str]) -> list[Chunk | None]:
+    """Возвращает фрагменты документов Chunk, однозначно найденные по словам
+    нескольких вопросов полнотекстовым поиском одним запросом к БД
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        questions (list[str]): вопросы пользователей
+
+    Returns:
+        list[Chunk | None]: экземпляры класса Chunk — фрагменты документов в порядке
+            вопросов или None, если результат полнотекстового поиска неоднозначен
+    """
+
+    with Session(engine) as session:
+        return decisive_lexical_chunks(
+            session.execute(lexical_chunks_batch_query(questions)).all(),
+            len(questions),
+        )
+
+
+async def aget_chunks_lexical(
+    async_engine: AsyncEngine, questions: list[str]
+) -> list[Chunk | None]:
+    """Асинхронно возвращает фрагменты документов Chunk, однозначно найденные
+    по словам нескольких вопросов полнотекстовым поиском одним запросом к БД
+
+    Args:
+        async_engine (AsyncEngine): экземпляр асинхронного подключения к БД
+        questions (list[str]): вопросы пользователей
+
+    Returns:
+        list[Chunk | None]: экземпляры класса Chunk — фрагменты документов в порядке
+            вопросов или None, если результат полнотекстового поиска неоднозначен
+    """
+
+    async with AsyncSession(async_engine) as session:
+        return decisive_lexical_chunks(
+            (await session.execute(lexical_chunks_batch_query(questions))).all(),
+            len(questions),
+        )
+
+
+def get_chunk_by_embedding(
+    engine: Engine, embedding: np.ndarray, snapshot: EmbeddingSnapshot | None = None
+) -> Chunk | None:
+    """Возвращает ближайший к векторному представлению вопроса фрагмент документа Chunk
+    из векторной базы данных
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        embedding (np.ndarray): векторное представление вопроса
+        snapshot (EmbeddingSnapshot | None): снимок векторных представлений фрагментов,
+            если задан, ближайший фрагмент ищется в нём, а из БД загружается только по ID
+
+    Returns:
+        Chunk | None: экземпляр класса Chunk — фрагмент документа
+    """
+
+    with Session(engine) as session:
+        if snapshot is not None:
+            ids = snapshot.search(embedding)
+            chunk = session.get(Chunk, ids[0]) if len(ids) > 0 else None
+            if chunk is not None:
+                return chunk
+        session.execute(search_settings_query())
+        return session.scalars(nearest_chunks_query(embedding)).first()
+
+
+async def aget_chunk_by_embedding(
+    async_engine: AsyncEngine,
+    embedding: np.ndarray,
+    snapshot: EmbeddingSnapshot | None = None,
+) -> Chunk | None:
+    """Асинхронно возвращает ближайший к векторному представлению вопроса
+    фрагмент документа Chunk из векторной базы данных, не блокируя цикл событий
+    на время ожидания ответа БД
+
+    Args:
+        async_engine (AsyncEngine): экземпляр асинхронного подключения к БД
+        embedding (np.ndarray): векторное представление вопроса
+        snapshot (EmbeddingSnapshot | None): снимок векторных представлений фрагментов,
+            если задан, ближайший фрагмент ищется в нём, а из БД загружается только по ID
+
+    Returns:
+        Chunk | None: экземпляр класса Chunk — фрагмент документа
+    """
+
+    async with AsyncSession(async_engine) as session:
+        if snapshot is not None:
+            ids = snapshot.search(embedding)
+            chunk = await session.get(Chunk, ids[0]) if len(ids) > 0 else None
+            if chunk is not None:
+                return chunk
+        await session.execute(search_settings_query())
+        return (await session.scalars(nearest_chunks_query(embedding))).first()
+
+
+def snapshot_chunk_ids(
+    embeddings: np.ndarray, snapshot: EmbeddingSnapshot | None
+) -> list[int] | None:
+    """Возвращает ID ближайших к векторным представлениям вопросов фрагментов
+    документов, найденных по снимку векторных представлений
+
+    Args:
+        embeddings (np.ndarray): векторные представления вопросов, по строке на вопрос
+        snapshot (EmbeddingSnapshot | None): снимок векторных представлений фрагментов
+
+    Returns:
+        list[int] | None: ID фрагментов в порядке вопросов или None,
+            если снимок не задан или пуст
+    """
+
+    if snapshot is None:
+        return None
+    ids = [snapshot.search(embedding) for embedding in embeddings]
+    if any(len(nearest) == 0 for nearest in ids):
+        return None
+    return [nearest[0] for nearest in ids]
+
+
+def get_chunks_by_embeddings(
+    engine: Engine, embeddings: np.ndarray, snapshot: EmbeddingSnapshot | None = None
+) -> list[Chunk | None]:
+    """Возвращает ближайшие к векторным представлениям нескольких вопросов
+    фрагменты документов Chunk одним запросом к векторной базе данных
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        embeddings (np.ndarray): векторные представления вопросов, по строке на вопрос
+        snapshot (EmbeddingSnapshot | None): снимок векторных представлений фрагментов,
+            если задан, ближайшие фрагменты ищутся в нём, а из БД загружаются только по ID
+
+    Returns:
+        list[Chunk | None]: экземпляры класса Chunk — фрагменты документов в порядке вопросов
+    """
+
+    with Session(engine) as session:
+        ids = snapshot_chunk_ids(embeddings, snapshot)
+        if ids is not None:
+            chunks = {
+                chunk.id: chunk
+                for chunk in session.scalars(select(Chunk).where(Chunk.id.in_(ids)))
+            }
+            if all(i in chunks for i in ids):
+                return [chunks[i] for i in ids]
+        session.execute(search_settings_query())
+        return [
+            row.Chunk
+            for row in session.execute(nearest_chunks_batch_query(embeddings)).all()
+        ]
+
+
+async def aget_chunks_by_embeddings(
+    async_engine: AsyncEngine,
+    embeddings: np.ndarray,
+    snapshot: EmbeddingSnapshot | None = None,
+) -> list[Chunk | None]:
+    """Асинхронно возвращает ближайшие к векторным представлениям нескольких
+    вопросов фрагменты документов Chunk одним запросом к векторной базе данных
+
+    Args:
+        async_engine (AsyncEngine): экземпляр асинхронного подключения к БД
+        embeddings (np.ndarray): векторные представления вопросов, по строке на вопрос
+        snapshot (EmbeddingSnapshot | None): снимок векторных представлений фрагментов,
+            если задан, ближайшие фрагменты ищутся в нём, а из БД загружаются только по ID
+
+    Returns:
+        list[Chunk | None]: экземпляры класса Chunk — фрагменты документов в порядке вопросов
+    """
+
+    async with AsyncSession(async_engine) as session:
+        ids = snapshot_chunk_ids(embeddings, snapshot)
+        if ids is not None:
+            chunks = {
+                chunk.id: chunk
+                for chunk in await session.scalars(
+                    select(Chunk).where(Chunk.id.in_(ids))
+                )
+            }
+            if all(i in chunks for i in ids):
+                return [chunks[i] for i in ids]
+        await session.execute(search_settings_query())
+        return [
+            row.Chunk
+            for row in (
+                await session.execute(nearest_chunks_batch_query(embeddings))
+            ).all()
+        ]
+
+
+async def warm_up_async_engine(async_engine: AsyncEngine, pool_size: int):
+    """Заранее открывает `pool_size` соединений пула асинхронного подключения к БД
+    и подготавливает в каждом из них запрос ближайшего фрагмента документа,
+    чтобы первые вопросы не тратили время на установку соединений и разбор запроса
+
+    Args:
+        async_engine (AsyncEngine): экземпляр асинхронного подключения к БД
+        pool_size (int): количество соединений
+    """
+
+    embedding = np.zeros(1024, dtype=np.float32)
+    embedding[0] = 1
+
+    async def warm_up_connection():
+        async with AsyncSession(async_engine) as session:
+            await session.execute(search_settings_query())
+            await session.scalars(nearest_chunks_query(embedding))
+
+    await asyncio.gather(*[warm_up_connection() for _ in range(pool_size)])
@@ -0,0 +1,251 @@
+from collections import OrderedDict
+import math
+import re
+import threading
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+CHARS_PER_TOKEN = 3
+ABBREVIATIONS = {
+    "г",
+    "гг",
+    "д",
+    "ул",
+    "пр",
+    "пр-т",
+    "пер",
+    "корп",
+    "стр",
+    "каб",
+    "ауд",
+    "оф",
+    "эт",
+    "тел",
+    "им",
+    "т",
+    "т.е",
+    "т.д",
+    "т.п",
+    "др",
+    "см",
+    "рис",
+    "с",
+    "п",
+    "пп",
+    "ч",
+    "ст",
+    "пн",
+    "вт",
+    "ср",
+    "чт",
+    "пт",
+    "сб",
+    "вс",
+}
+STEM_LENGTH = 5
+WORD = re.compile(r"\w+")
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+(?=[«\"(\[]?[А-ЯЁA-Z0-9])|\s*\n+\s*")
+CONTACT = re.compile(
+    r"(\+7|8)[\s(-]*\d{3,4}[\s)-]*\d{1,3}[\s-]?\d{2}[\s-]?\d{2}"
+    r"|[\w.+-]+@[\w-]+\.[\w.]+"
+    r"|\b(ул|пр-т|пер|корп|каб|ауд)\.\s*\S+",
+    re.IGNORECASE,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Оценивает количество токенов LLM в тексте по его длине
+
+    Args:
+        text (str): текст
+
+    Returns:
+        int: приблизительное количество токенов
+    """
+
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def split_sentences(text: str) -> list[str]:
+    """Разбивает текст на предложения и строки, не разрывая сокращения
+    в адресах (г., ул., д., каб.), дни недели в часах работы (пн.-пт.)
+    и номера телефонов
+
+    Args:
+        text (str): текст фрагмента документа
+
+    Returns:
+        list[str]: непустые предложения в порядке следования в тексте
+    """
+
+    sentences = []
+    for part in SENTENCE_BOUNDARY.split(text):
+        part = part.strip()
+        if len(part) == 0:
+            continue
+        last_word = sentences[-1].rsplit(maxsplit=1)[-1] if sentences else ""
+        # в диапазонах вида «пн.-пт.» проверяется последнее сокращение
+        last_abbreviation = re.split(r"[-–]", last_word[:-1])[-1].lower()
+        if last_word.endswith(".") and last_abbreviation in ABBREVIATIONS:
+            sentences[-1] = f"{sentences[-1]} {part}"
+        else:
+            sentences.append(part)
+    return sentences
+
+
+def lexical_scores(sentences: list[str], question: str) -> np.ndarray:
+    """Оценивает близость предложений к вопросу долей слов вопроса, встречающихся
+    в предложении; слова сравниваются по первым `STEM_LENGTH` буквам, чтобы
+    не зависеть от окончаний
+
+    Args:
+        sentences (list[str]): предложения фрагмента документа
+        question (str): вопрос пользователя
+
+    Returns:
+        np.ndarray: оценки предложений от 0 до 1
+    """
+
+    stems = {word[:STEM_LENGTH] for word in WORD.findall(question.lower())}
+    if len(stems) == 0:
+        return np.zeros(len(sentences), dtype=np.float32)
+    return np.array(
+        [
+            len(stems & {word[:STEM_LENGTH] for word in WORD.findall(s.lower())})
+            / len(stems)
+            for s in sentences
+        ],
+        dtype=np.float32,
+    )
+
+
+class SentenceEmbeddingCache:
+    """Кеш векторных представлений предложений фрагментов документов по ID фрагмента
+    с вытеснением давно не использованных фрагментов (LRU): предложения фрагмента
+    кодируются моделью только при первом отборе контекста из него. Запись
+    действительна, пока предложения фрагмента не изменились
+
+    Args:
+        max_chunks (int): максимальное количество фрагментов в кеше, 0 — кеш отключён
+    """
+
+    def __init__(self, max_chunks: int):
+        self.max_chunks = max_chunks
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, tuple[int, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def encode(
+        self,
+        chunk_id: int,
+        sentences: list[str],
+        encoder_model: SentenceTransformer,
+    ) -> np.ndarray:
+        """Возвращает векторные представления предложений фрагмента из кеша,
+        при отсутствии в кеше вычисляет их с помощью модели и сохраняет в кеш
+
+        Args:
+            chunk_id (int): ID фрагмента документа
+            sentences (list[str]): предложения фрагмента
+            encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+
+        Returns:
+            np.ndarray: векторные представления предложений (только для чтения)
+        """
+
+        digest = hash(tuple(sentences))
+        with self._lock:
+            entry = self._entries.get(chunk_id)
+            if entry is not None and entry[0] == digest:
+                self._entries.move_to_end(chunk_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        embeddings = np.asarray(encoder_model.encode(sentences), dtype=np.float32)
+        embeddings.flags.writeable = False
+        if self.max_chunks > 0:
+            with self._lock:
+                self._entries[chunk_id] = (digest, embeddings)
+                self._entries.move_to_end(chunk_id)
+                while len(self._entries) > self.max_chunks:
+                    self._entries.popitem(last=False)
+        return embeddings
+
+    def stats(self) -> dict:
+        """Возвращает статистику использования кеша
+
+        Returns:
+            dict: количество попаданий, промахов и фрагментов в кеше
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "max_chunks": self.max_chunks,
+            }
+
+
+def build_context(
+    text: str,
+    question: str,
+    question_embedding: np.ndarray | None,
+    encoder_model: SentenceTransformer,
+    token_budget: int,
+    sentence_cache: SentenceEmbeddingCache | None = None,
+    chunk_id: int | None = None,
+) -> str:
+    """Отбирает из фрагмента документа наиболее близкие к вопросу предложения
+    в пределах бюджета токенов промта. Предложения включаются целиком в порядке
+    убывания косинусного сходства с вопросом (или доли общих с вопросом слов,
+    если векторное представление вопроса не вычислялось), а следующее за отобранным
+    предложение с телефоном, адресом или электронной почтой добавляется вне очереди,
+    так как обычно дополняет его. Отобранные предложения выводятся в исходном порядке
+
+    Args:
+        text (str): текст фрагмента документа
+        question (str): вопрос пользователя
+        question_embedding (np.ndarray | None): векторное представление вопроса,
+            None — если оно не вычислялось при поиске фрагмента
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        token_budget (int): бюджет токенов контекста
+        sentence_cache (SentenceEmbeddingCache | None): кеш векторных представлений
+            предложений, None — без кеширования
+        chunk_id (int | None): ID фрагмента документа, ключ кеша
+
+    Returns:
+        str: контекст для промта
+    """
+
+    if estimate_tokens(text) <= token_budget:
+        return text
+    sentences = split_sentences(text)
+    if question_embedding is None:
+        scores = lexical_scores(sentences, question)
+    else:
+        if sentence_cache is not None and chunk_id is not None:
+            embeddings = sentence_cache.encode(chunk_id, sentences, encoder_model)
+        else:
+            embeddings = np.asarray(encoder_model.encode(sentences), dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1) * np.linalg.norm(question_embedding)
+        norms[norms == 0] = 1
+        scores = embeddings @ np.asarray(question_embedding, dtype=np.float32) / norms
+    selected: set[int] = set()
+    used = 0
+
+    def take(i: int) -> bool:
+        nonlocal used
+        tokens = estimate_tokens(sentences[i])
+        if i in selected or used + tokens > token_budget:
+            return False
+        selected.add(i)
+        used += tokens
+        return True
+
+    for i in map(int, np.argsort(-scores, kind="stable")):
+        if take(i) and i + 1 < len(sentences):
+            if CONTACT.search(sentences[i + 1]) is not None:
+                take(i + 1)
+    return "\n".join(sentences[i] for i in sorted(selected))
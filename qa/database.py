@@ -1,5 +1,6 @@
-from pgvector.sqlalchemy import Vector
-from sqlalchemy import Text, Column, DateTime, func
+from pgvector.sqlalchemy import BIT, HALFVEC, Vector
+from sqlalchemy import Text, Column, Computed, DateTime, Index, cast, false, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, declarative_base, mapped_column
 
 Base = declarative_base()
@@ -10,18 +11,124 @@ class Chunk(Base):
 
     Args:
         confluence_url (str): ссылка на источник
+        page_id (str | None): ID страницы-источника в вики-системе
+        page_version (int | None): номер версии страницы-источника на момент индексации
+        content_hash (str | None): хеш текста страницы-источника на момент индексации
         text (str): текст фрагмента
         embedding (Vector): векторное представление текста фрагмента размерностью 1024
+        text_search (TSVECTOR): вычисляемое СУБД лексическое представление текста фрагмента
         created_at (datetime): время создания модели
         updated_at (datetime): время обновления модели
     """
 
     __tablename__ = "chunk"
+    __table_args__ = (
+        Index(
+            "ix_chunk_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+        Index("ix_chunk_text_search", "text_search", postgresql_using="gin"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     confluence_url: Mapped[str] = mapped_column(Text(), index=True)
+    page_id: Mapped[str | None] = mapped_column(Text(), index=True)
+    page_version: Mapped[int | None]
+    content_hash: Mapped[str | None] = mapped_column(Text())
     text: Mapped[str] = mapped_column(Text())
     embedding: Mapped[Vector] = mapped_column(Vector(1024))
+    text_search: Mapped[str] = mapped_column(
+        TSVECTOR,
+        Computed("to_tsvector('russian', text)", persisted=True),
+        deferred=True,
+    )
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+# дополнительные HNSW-индексы режимов поиска Config.VECTOR_SEARCH_MODE. Каждый
+# HNSW-индекс обновляется при записи фрагментов, что увеличивает время
+# переиндексации, и занимает место на диске и в памяти, поэтому эти индексы
+# не входят в схему миграций, а создаются микросервисом при запуске только
+# для используемого режима (см. `prepare_vector_search_index`)
+VECTOR_SEARCH_INDEXES = {
+    # индекс по копиям векторных представлений в половинной точности (halfvec)
+    "half": Index(
+        "ix_chunk_embedding_halfvec_hnsw",
+        cast(Chunk.embedding, HALFVEC(1024)).label("embedding_halfvec"),
+        postgresql_using="hnsw",
+        postgresql_with={"m": 16, "ef_construction": 64},
+        postgresql_ops={"embedding_halfvec": "halfvec_cosine_ops"},
+    ),
+    # индекс по бинарно квантизованным векторным представлениям (bit)
+    # для отбора кандидатов
+    "binary": Index(
+        "ix_chunk_embedding_binary_hnsw",
+        cast(func.binary_quantize(Chunk.embedding), BIT(1024)).label(
+            "embedding_binary"
+        ),
+        postgresql_using="hnsw",
+        postgresql_with={"m": 16, "ef_construction": 64},
+        postgresql_ops={"embedding_binary": "bit_hamming_ops"},
+    ),
+}
+
+
+class EmptyPage(Base):
+    """Страница вики-системы без текста, которая не попала в векторный индекс.
+    Номер её версии хранится, чтобы при инкрементальной переиндексации
+    страница не загружалась повторно, пока не изменится
+
+    Args:
+        page_id (str): ID страницы в вики-системе
+        page_version (int): номер версии страницы на момент индексации
+        created_at (datetime): время создания модели
+        updated_at (datetime): время обновления модели
+    """
+
+    __tablename__ = "empty_page"
+
+    page_id: Mapped[str] = mapped_column(Text(), primary_key=True)
+    page_version: Mapped[int]
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class KnownAnswer(Base):
+    """Ответ из истории вопросов, подтверждённый оценкой пользователя 5,
+    который выдаётся на похожие вопросы без поиска фрагментов документов
+    и обращения к LLM
+
+    Args:
+        question_answer_id (int): id вопроса с ответом, из которого получен ответ
+        question (str): вопрос пользователя
+        answer (str): ответ на вопрос
+        confluence_url (str): ссылка на источник
+        embedding (Vector): векторное представление вопроса размерностью 1024
+        content_hash (str): хеш текста страницы-источника на момент добавления ответа
+        invalidated_at (datetime | None): время, с которого ответ не выдаётся,
+            так как при переиндексации страница-источник изменилась
+        is_duplicate (bool): ответ не выдаётся, так как на похожий вопрос уже есть
+            известный ответ; хранится, чтобы вопрос повторно не рассматривался
+        created_at (datetime): время создания модели
+        updated_at (datetime): время обновления модели
+    """
+
+    __tablename__ = "known_answer"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    question_answer_id: Mapped[int] = mapped_column(unique=True)
+    question: Mapped[str] = mapped_column(Text())
+    answer: Mapped[str] = mapped_column(Text())
+    confluence_url: Mapped[str] = mapped_column(Text(), index=True)
+    embedding: Mapped[Vector] = mapped_column(Vector(1024))
+    content_hash: Mapped[str] = mapped_column(Text())
+    invalidated_at = Column(DateTime(timezone=True))
+    is_duplicate: Mapped[bool] = mapped_column(server_default=false())
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -0,0 +1,142 @@
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from sqlalchemy import Engine, select
+from sqlalchemy.orm import Session
+from database import Chunk
+
+
+class EmbeddingSnapshot:
+    """Снимок векторных представлений фрагментов документов в виде матрицы,
+    отображаемой в память (memory-mapped) из файла, для точного поиска ближайших
+    фрагментов без обращения к БД
+
+    Снимок хранится в каталоге `path`: каждое поколение — подкаталог с файлами
+    `ids.npy` и `embeddings.npy`, а файл `CURRENT` содержит название актуального
+    поколения. Запись нового поколения завершается атомарной заменой `CURRENT`,
+    поэтому процессы, читающие снимок, подхватывают его при следующем поиске,
+    а отображение файлов в память позволяет им разделять общий страничный кеш ОС
+
+    Args:
+        path (str): каталог снимка
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._key = None
+        self._ids = np.empty(0, dtype=np.int64)
+        self._embeddings = np.empty((0, 0), dtype=np.float32)
+
+    def _refresh(self):
+        """Отображает в память актуальное поколение снимка, если оно изменилось"""
+
+        try:
+            stat = os.stat(os.path.join(self.path, "CURRENT"))
+        except FileNotFoundError:
+            return
+        key = (stat.st_ino, stat.st_mtime_ns)
+        if key == self._key:
+            return
+        with self._lock:
+            if key == self._key:
+                return
+            try:
+                with open(os.path.join(self.path, "CURRENT")) as file:
+                    generation = os.path.join(self.path, file.read().strip())
+                ids = np.load(os.path.join(generation, "ids.npy"), mmap_mode="r")
+                embeddings = np.load(
+                    os.path.join(generation, "embeddings.npy"), mmap_mode="r"
+                )
+            except FileNotFoundError:
+                # поколение заменено следующей записью, оно будет подхвачено позже
+                return
+            self._ids, self._embeddings, self._key = ids, embeddings, key
+
+    def exists(self) -> bool:
+        """Проверяет, записан ли снимок
+
+        Returns:
+            bool: True, если в каталоге есть актуальное поколение снимка
+        """
+
+        return os.path.exists(os.path.join(self.path, "CURRENT"))
+
+    def search(self, embedding: np.ndarray, k: int = 1) -> list[int]:
+        """Возвращает ID k ближайших по косинусному расстоянию фрагментов документов
+
+        Args:
+            embedding (np.ndarray): векторное представление вопроса
+            k (int): количество ближайших фрагментов
+
+        Returns:
+            list[int]: ID фрагментов в порядке убывания близости
+        """
+
+        self._refresh()
+        ids, embeddings = self._ids, self._embeddings
+        if len(ids) == 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query = (query / np.linalg.norm(query)).astype(embeddings.dtype)
+        scores = embeddings @ query
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return ids[top].tolist()
+
+
+def write_embedding_snapshot(
+    path: str, ids: np.ndarray, embeddings: np.ndarray, dtype: str = "float32"
+):
+    """Записывает новое поколение снимка векторных представлений
+    и атомарно делает его актуальным, предыдущие поколения удаляются
+
+    Args:
+        path (str): каталог снимка
+        ids (np.ndarray): ID фрагментов документов
+        embeddings (np.ndarray): векторные представления фрагментов, по строке на фрагмент
+        dtype (str): тип элементов матрицы в снимке (float32 или float16)
+    """
+
+    os.makedirs(path, exist_ok=True)
+    generation = str(time.time_ns())
+    os.makedirs(os.path.join(path, generation))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    np.save(os.path.join(path, generation, "ids.npy"), ids.astype(np.int64))
+    np.save(
+        os.path.join(path, generation, "embeddings.npy"),
+        np.ascontiguousarray(embeddings / norms, dtype=dtype),
+    )
+    with open(os.path.join(path, "CURRENT.tmp"), "w") as file:
+        file.write(generation)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(os.path.join(path, "CURRENT.tmp"), os.path.join(path, "CURRENT"))
+    for name in os.listdir(path):
+        if name != generation and os.path.isdir(os.path.join(path, name)):
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+
+
+def export_embedding_snapshot(engine: Engine, path: str, dtype: str = "float32"):
+    """Выгружает векторные представления всех фрагментов документов из БД
+    в новое поколение снимка
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        path (str): каталог снимка
+        dtype (str): тип элементов матрицы в снимке (float32 или float16)
+    """
+
+    with Session(engine) as session:
+        rows = session.execute(
+            select(Chunk.id, Chunk.embedding).order_by(Chunk.id)
+        ).all()
+    ids = np.array([row.id for row in rows], dtype=np.int64)
+    embeddings = np.array([row.embedding for row in rows], dtype=np.float32).reshape(
+        len(rows), -1
+    )
+    write_embedding_snapshot(path, ids, embeddings, dtype)
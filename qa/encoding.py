@@ -0,0 +1,284 @@
+from collections import OrderedDict
+from concurrent.futures import Future
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+ENCODER_MODEL_PATH = "saved_models/multilingual-e5-large-wikiutmn"
+
+
+def load_encoder_model(backend: str = "torch") -> SentenceTransformer:
+    """Загружает модель получения векторных представлений для вычислений на CPU
+
+    Args:
+        backend (str): torch — исходная модель PyTorch fp32, onnx — модель,
+            экспортированная в ONNX, onnx-int8 — модель ONNX с весами,
+            динамически квантизованными в int8 (экспортируются `save_models.py`)
+
+    Returns:
+        SentenceTransformer: модель получения векторных представлений SentenceTransformer
+    """
+
+    if backend == "onnx":
+        return SentenceTransformer(ENCODER_MODEL_PATH, device="cpu", backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(
+            ENCODER_MODEL_PATH,
+            device="cpu",
+            backend="onnx",
+            model_kwargs={"file_name": "onnx/model_qint8_avx2.onnx"},
+        )
+    return SentenceTransformer(ENCODER_MODEL_PATH, device="cpu")
+
+
+def encode_documents(
+    encoder_model: SentenceTransformer,
+    texts: list[str],
+    batch_size: int,
+    processes: int = 1,
+    log_interval: float = 10,
+) -> np.ndarray:
+    """Вычисляет векторные представления фрагментов документов при индексации.
+    Тексты упорядочиваются по убыванию длины, чтобы пакеты состояли из текстов
+    близкой длины и меньше дополнялись паддингом, и кодируются пакетами
+    по `batch_size` текстов. Если `processes` больше 1, пакеты распределяются
+    между процессами пула SentenceTransformer. Скорость кодирования выводится
+    в журнал не реже, чем раз в `log_interval` секунд
+
+    Args:
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        texts (list[str]): тексты фрагментов документов
+        batch_size (int): размер пакета текстов
+        processes (int): количество процессов, 0 — по количеству ядер CPU
+        log_interval (float): интервал вывода скорости кодирования в секундах
+
+    Returns:
+        np.ndarray: векторные представления fp32 в порядке текстов, по строке на текст
+    """
+
+    if len(texts) == 0:
+        return np.zeros((0, 0), dtype=np.float32)
+    if processes == 0:
+        processes = os.cpu_count() or 1
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+    sorted_texts = [texts[i] for i in order]
+    pool = None
+    step = batch_size
+    if processes > 1:
+        pool = encoder_model.start_multi_process_pool(["cpu"] * processes)
+        step = batch_size * processes * 4
+    parts = []
+    encoded = 0
+    start = last_log = time.monotonic()
+    try:
+        for i in range(0, len(sorted_texts), step):
+            part = sorted_texts[i : i + step]
+            if pool is not None:
+                embeddings = encoder_model.encode_multi_process(
+                    part, pool, batch_size=batch_size
+                )
+            else:
+                embeddings = encoder_model.encode(part, batch_size=batch_size)
+            parts.append(np.asarray(embeddings, dtype=np.float32))
+            encoded += len(part)
+            now = time.monotonic()
+            if now - last_log >= log_interval or encoded == len(texts):
+                last_log = now
+                logging.warning(
+                    f"ENCODED {encoded}/{len(texts)} CHUNKS, "
+                    f"{encoded / max(now - start, 1e-9):.1f} CHUNKS/S"
+                )
+    finally:
+        if pool is not None:
+            encoder_model.stop_multi_process_pool(pool)
+    sorted_embeddings = np.concatenate(parts)
+    embeddings = np.empty_like(sorted_embeddings)
+    embeddings[order] = sorted_embeddings
+    return embeddings
+
+
+class CachedEncoder:
+    """Кеш векторных представлений вопросов пользователей с вытеснением давно
+    не использованных записей (LRU) при превышении лимита памяти и по истечении
+    времени жизни (TTL). Ключ кеша — нормализованный текст вопроса
+
+    Args:
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        max_bytes (int): лимит памяти, занимаемой записями кеша, в байтах
+        ttl (float): время жизни записи в секундах
+    """
+
+    def __init__(self, encoder_model: SentenceTransformer, max_bytes: int, ttl: float):
+        self.encoder_model = encoder_model
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._entries: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        """Возвращает нормализованный текст вопроса: в нижнем регистре,
+        без повторяющихся пробельных символов по краям и внутри текста
+
+        Args:
+            question (str): вопрос пользователя
+
+        Returns:
+            str: нормализованный вопрос
+        """
+
+        return " ".join(question.lower().split())
+
+    @staticmethod
+    def _entry_size(key: str, embedding: np.ndarray) -> int:
+        return sys.getsizeof(key) + embedding.nbytes
+
+    def _pop(self, key: str):
+        _, embedding = self._entries.pop(key)
+        self._bytes -= self._entry_size(key, embedding)
+
+    def encode(self, question: str) -> np.ndarray:
+        """Возвращает векторное представление вопроса из кеша,
+        при отсутствии в кеше вычисляет его с помощью модели и сохраняет в кеш
+
+        Args:
+            question (str): вопрос пользователя
+
+        Returns:
+            np.ndarray: векторное представление вопроса (только для чтения)
+        """
+
+        key = self.normalize(question)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._pop(key)
+                self.evictions += 1
+            self.misses += 1
+        embedding = self.encoder_model.encode(key)
+        embedding.flags.writeable = False
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (time.monotonic(), embedding)
+            self._bytes += self._entry_size(key, embedding)
+            while self._bytes > self.max_bytes and len(self._entries) > 0:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+        return embedding
+
+    def stats(self) -> dict:
+        """Возвращает статистику использования кеша
+
+        Returns:
+            dict: количество попаданий, промахов, вытеснений, записей и занятых байт
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+class BatchingEncoder:
+    """Объединяет одновременные вызовы `encode` из разных потоков в пакеты
+    и вычисляет векторные представления пакета за один прямой проход модели.
+    Пакет собирается фоновым потоком в течение окна `window` секунд
+    с момента поступления первого вопроса или до достижения `max_batch_size`
+
+    Args:
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        window (float): длительность окна сбора пакета в секундах
+        max_batch_size (int): максимальный размер пакета
+    """
+
+    def __init__(
+        self, encoder_model: SentenceTransformer, window: float, max_batch_size: int
+    ):
+        self.encoder_model = encoder_model
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue: queue.Queue[tuple[str, Future] | None] = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="batching-encoder", daemon=True
+        )
+        self._thread.start()
+
+    def _collect_batch(self) -> list[tuple[str, Future]] | None:
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = (
+                    self._queue.get(timeout=timeout)
+                    if timeout > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                return
+            try:
+                embeddings = self.encoder_model.encode(
+                    [question for question, _ in batch], batch_size=len(batch)
+                )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            # строка массива пакета удерживала бы в памяти весь пакет,
+            # пока векторное представление хранится в кеше
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding.copy())
+
+    def encode(self, question: str) -> np.ndarray:
+        """Возвращает векторное представление вопроса, вычисленное
+        в составе пакета одновременно поступивших вопросов
+
+        Args:
+            question (str): вопрос пользователя
+
+        Returns:
+            np.ndarray: векторное представление вопроса
+        """
+
+        future = Future()
+        self._queue.put((question, future))
+        return future.result()
+
+    def close(self):
+        """Останавливает фоновый поток после обработки поступивших вопросов"""
+
+        self._queue.put(None)
+        self._thread.join()
@@ -0,0 +1,275 @@
+import threading
+import numpy as np
+from sentence_transformers import SentenceTransformer
+from sqlalchemy import Engine, Select, func, literal_column, select, text, update
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.orm import Session
+from database import Chunk, KnownAnswer
+from encoding import CachedEncoder
+
+
+def normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """Нормализует векторные представления для вычисления косинусного сходства
+    скалярным произведением
+
+    Args:
+        embeddings (np.ndarray): векторные представления, по строке на вектор
+
+    Returns:
+        np.ndarray: нормализованные векторные представления fp32
+    """
+
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return embeddings / norms
+
+
+def deduplicate(
+    existing: np.ndarray, candidates: np.ndarray, threshold: float
+) -> list[int]:
+    """Отбирает вопросы, не похожие ни на уже отобранные, ни друг на друга:
+    кандидаты рассматриваются по порядку, и кандидат пропускается, если
+    его косинусное сходство с одним из отобранных вопросов не меньше `threshold`
+
+    Args:
+        existing (np.ndarray): нормализованные векторные представления уже отобранных вопросов
+        candidates (np.ndarray): нормализованные векторные представления кандидатов
+        threshold (float): косинусное сходство, начиная с которого вопросы считаются одинаковыми
+
+    Returns:
+        list[int]: номера отобранных кандидатов
+    """
+
+    kept = np.zeros((len(existing) + len(candidates), candidates.shape[1]), np.float32)
+    kept[: len(existing)] = existing
+    count = len(existing)
+    selected = []
+    for i, candidate in enumerate(candidates):
+        if count > 0 and float(np.max(kept[:count] @ candidate)) >= threshold:
+            continue
+        kept[count] = candidate
+        count += 1
+        selected.append(i)
+    return selected
+
+
+def page_hashes_query() -> Select:
+    """Возвращает запрос хешей текстов страниц вики-системы в векторном индексе:
+    md5 от склеенных по порядку текстов фрагментов каждой страницы
+
+    Returns:
+        Select: запрос ссылок на страницы `confluence_url` и хешей их текстов `content_hash`
+    """
+
+    return select(
+        Chunk.confluence_url,
+        func.md5(
+            func.string_agg(
+                Chunk.text, aggregate_order_by(literal_column("''"), Chunk.id)
+            )
+        ).label("content_hash"),
+    ).group_by(Chunk.confluence_url)
+
+
+def invalidate_known_answers(engine: Engine) -> int:
+    """Отмечает недействительными известные ответы, страница-источник которых
+    при переиндексации изменилась или исчезла из векторного индекса
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+
+    Returns:
+        int: количество отмеченных ответов
+    """
+
+    with Session(engine) as session:
+        hashes = dict(session.execute(page_hashes_query()).all())
+        stale = [
+            row.id
+            for row in session.execute(
+                select(
+                    KnownAnswer.id, KnownAnswer.confluence_url, KnownAnswer.content_hash
+                ).where(
+                    KnownAnswer.invalidated_at.is_(None),
+                    KnownAnswer.is_duplicate.is_(False),
+                )
+            )
+            if hashes.get(row.confluence_url) != row.content_hash
+        ]
+        if len(stale) > 0:
+            session.execute(
+                update(KnownAnswer)
+                .where(KnownAnswer.id.in_(stale))
+                .values(invalidated_at=func.now())
+            )
+        session.commit()
+    return len(stale)
+
+
+def build_known_answers(
+    engine: Engine, encoder_model: SentenceTransformer, threshold: float
+) -> int:
+    """Добавляет в таблицу известных ответов ответы с оценкой 5 из истории
+    вопросов, начиная с самых новых. Ответ добавляется, если его страница-источник
+    есть в векторном индексе, а среди действующих известных ответов нет вопроса
+    с косинусным сходством не меньше `threshold`, иначе он сохраняется
+    как дубликат. Ответы, уже добавленные ранее, в том числе дубликаты и отмеченные
+    недействительными, повторно не рассматриваются. Вопросы кодируются
+    в нормализованном виде, как и вопросы пользователей (`CachedEncoder.normalize`)
+
+    Args:
+        engine (Engine): экземпляр подключения к БД
+        encoder_model (SentenceTransformer): модель получения векторных представлений SentenceTransformer
+        threshold (float): косинусное сходство, начиная с которого вопросы считаются одинаковыми
+
+    Returns:
+        int: количество добавленных ответов
+    """
+
+    with Session(engine) as session:
+        hashes = dict(session.execute(page_hashes_query()).all())
+        added_ids = set(session.scalars(select(KnownAnswer.question_answer_id)))
+        rows = [
+            row
+            for row in session.execute(
+                text(
+                    "SELECT id, question, answer, confluence_url FROM question_answer "
+                    "WHERE score = 5 AND answer <> '' AND confluence_url IS NOT NULL "
+                    "ORDER BY created_at DESC"
+                )
+            )
+            if row.id not in added_ids and row.confluence_url in hashes
+        ]
+        if len(rows) == 0:
+            return 0
+        existing = normalize_rows(
+            np.array(
+                session.scalars(
+                    select(KnownAnswer.embedding).where(
+                        KnownAnswer.invalidated_at.is_(None),
+                        KnownAnswer.is_duplicate.is_(False),
+                    )
+                ).all(),
+                dtype=np.float32,
+            ).reshape(-1, 1024)
+        )
+        embeddings = normalize_rows(
+            encoder_model.encode(
+                [CachedEncoder.normalize(row.question) for row in rows]
+            )
+        )
+        selected = set(deduplicate(existing, embeddings, threshold))
+        session.add_all(
+            [
+                KnownAnswer(
+                    question_answer_id=rows[i].id,
+                    question=rows[i].question,
+                    answer=rows[i].answer,
+                    confluence_url=rows[i].confluence_url,
+                    embedding=embeddings[i],
+                    content_hash=hashes[rows[i].confluence_url],
+                    is_duplicate=i not in selected,
+                )
+                for i in range(len(rows))
+            ]
+        )
+        session.commit()
+    return len(selected)
+
+
+class KnownAnswers:
+    """Действующие известные ответы в памяти процесса: ответ выдаётся на вопрос,
+    косинусное сходство которого с одним из вопросов известных ответов
+    не меньше порога `threshold`
+
+    Args:
+        threshold (float): минимальное косинусное сходство вопросов
+        dimension (int): размерность векторных представлений
+    """
+
+    def __init__(self, threshold: float, dimension: int = 1024):
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._embeddings = np.zeros((0, dimension), dtype=np.float32)
+        self._answers: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def replace(self, embeddings: np.ndarray, answers: list[tuple[str, str]]):
+        """Заменяет известные ответы
+
+        Args:
+            embeddings (np.ndarray): векторные представления вопросов, по строке на вопрос
+            answers (list[tuple[str, str]]): ответы и ссылки на источники в порядке вопросов
+        """
+
+        embeddings = normalize_rows(
+            np.asarray(embeddings, dtype=np.float32).reshape(
+                -1, self._embeddings.shape[1]
+            )
+        )
+        with self._lock:
+            self._embeddings, self._answers = embeddings, list(answers)
+
+    def load(self, engine: Engine):
+        """Загружает действующие известные ответы из БД
+
+        Args:
+            engine (Engine): экземпляр подключения к БД
+        """
+
+        with Session(engine) as session:
+            rows = session.execute(
+                select(
+                    KnownAnswer.embedding,
+                    KnownAnswer.answer,
+                    KnownAnswer.confluence_url,
+                ).where(
+                    KnownAnswer.invalidated_at.is_(None),
+                    KnownAnswer.is_duplicate.is_(False),
+                )
+            ).all()
+        self.replace(
+            np.array([row.embedding for row in rows], dtype=np.float32),
+            [(row.answer, row.confluence_url) for row in rows],
+        )
+
+    def get(self, embedding: np.ndarray) -> tuple[str, str] | None:
+        """Возвращает известный ответ на ближайший похожий вопрос
+
+        Args:
+            embedding (np.ndarray): векторное представление вопроса
+
+        Returns:
+            tuple[str, str] | None: ответ и ссылка на источник или None, если похожего вопроса нет
+        """
+
+        query = normalize_rows(np.asarray(embedding).reshape(1, -1))[0]
+        with self._lock:
+            embeddings, answers = self._embeddings, self._answers
+            if len(answers) > 0:
+                scores = embeddings @ query
+                i = int(np.argmax(scores))
+                if scores[i] >= self.threshold:
+                    self.hits += 1
+                    return answers[i]
+            self.misses += 1
+            return None
+
+    def stats(self) -> dict:
+        """Возвращает статистику использования известных ответов
+
+        Returns:
+            dict: количество попаданий, промахов и известных ответов
+        """
+
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._answers),
+            }
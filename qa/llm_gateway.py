@@ -0,0 +1,395 @@
+import asyncio
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import logging
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Callable
+import numpy as np
+
+
+class LLMUnavailableError(Exception):
+    """LLM не ответила: автомат защиты разомкнут, истёк срок ожидания
+    или исчерпаны повторные попытки"""
+
+
+def is_transient_error(e: Exception) -> bool:
+    """Проверяет, может ли повторный запрос к LLM завершиться успешно:
+    таймауты, сетевые ошибки и ответы со статусом 429 или 5xx
+
+    Args:
+        e (Exception): исключение, возникшее при запросе
+
+    Returns:
+        bool: True, если ошибка временная
+    """
+
+    # в Python 3.10 asyncio.TimeoutError не является подклассом TimeoutError
+    if isinstance(e, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    status_code = getattr(e, "status_code", None)
+    if status_code is None and len(e.args) > 1 and isinstance(e.args[1], int):
+        # gigachat.exceptions.ResponseError(url, status_code, content, headers)
+        status_code = e.args[1]
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return type(e).__module__.split(".")[0] in ("httpx", "httpcore")
+
+
+class CircuitBreaker:
+    """Автомат защиты: после `failures_threshold` неудачных запросов подряд
+    размыкается на `reset_timeout` секунд, в течение которых запросы отклоняются
+    без обращения к LLM, затем пропускает один пробный запрос, успех которого
+    замыкает автомат, а неудача снова размыкает
+
+    Args:
+        failures_threshold (int): количество неудачных запросов подряд до размыкания
+        reset_timeout (float): время в секундах до пробного запроса
+    """
+
+    def __init__(self, failures_threshold: int, reset_timeout: float):
+        self.failures_threshold = failures_threshold
+        self.reset_timeout = reset_timeout
+        self.opened = 0
+        self._failures = 0
+        self._open_until: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Проверяет, можно ли отправить запрос
+
+        Returns:
+            bool: True, если автомат замкнут или пора отправить пробный запрос
+        """
+
+        with self._lock:
+            if self._open_until is None:
+                return True
+            if time.monotonic() < self._open_until or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        """Отмечает успешный запрос и замыкает автомат"""
+
+        with self._lock:
+            self._failures = 0
+            self._open_until = None
+            self._probing = False
+
+    def release(self):
+        """Снимает отметку пробного запроса, прерванного без результата,
+        чтобы следующий запрос мог стать пробным"""
+
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        """Отмечает неудачный запрос и размыкает автомат при превышении порога"""
+
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failures_threshold:
+                if self._open_until is None or self._probing:
+                    self.opened += 1
+                self._open_until = time.monotonic() + self.reset_timeout
+                self._probing = False
+
+    @property
+    def state(self) -> str:
+        """Состояние автомата: closed, open или half-open"""
+
+        with self._lock:
+            if self._open_until is None:
+                return "closed"
+            if time.monotonic() < self._open_until and not self._probing:
+                return "open"
+            return "half-open"
+
+
+class LLMGateway:
+    """Обёртка над вызовами LLM, ограничивающая их количество в процессе,
+    длительность ожидания ответа и повторяющая запрос при временных ошибках
+    с экспоненциальной задержкой со случайным разбросом. Если включено
+    дублирование запросов, то при отсутствии ответа дольше 95-го процентиля
+    недавних задержек отправляется второй такой же запрос и используется
+    первый полученный ответ. Автомат защиты `CircuitBreaker` отклоняет запросы,
+    пока LLM недоступна
+
+    Args:
+        invoke (Callable[[Any], Any]): синхронный вызов LLM
+        max_concurrency (int): максимальное количество одновременных вызовов в процессе
+        timeout (float): срок ожидания ответа с учётом повторов в секундах
+        retries (int): количество повторных попыток при временных ошибках
+        backoff (float): базовая задержка перед повторной попыткой в секундах
+        hedging (bool): отправлять ли дублирующий запрос при долгом ожидании ответа
+        hedge_min_samples (int): минимальное количество измеренных задержек
+            для вычисления порога дублирования
+        breaker (CircuitBreaker): автомат защиты
+    """
+
+    def __init__(
+        self,
+        invoke: Callable[[Any], Any],
+        max_concurrency: int,
+        timeout: float,
+        retries: int,
+        backoff: float,
+        hedging: bool,
+        hedge_min_samples: int,
+        breaker: CircuitBreaker,
+    ):
+        self.invoke_function = invoke
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.hedging = hedging
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker
+        self.calls = 0
+        self.retried = 0
+        self.hedged = 0
+        self.rejected = 0
+        self._latencies: deque[float] = deque(maxlen=256)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        # ожидающие разрешения потоковые вызовы, которые будятся при его освобождении
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        # дублирующие и брошенные по таймауту запросы продолжают выполняться,
+        # поэтому потоков вдвое больше, чем одновременных вызовов
+        self._executor = ThreadPoolExecutor(
+            max_workers=2 * max_concurrency, thread_name_prefix="llm"
+        )
+        self._lock = threading.Lock()
+
+    def hedge_delay(self) -> float | None:
+        """Возвращает время ожидания ответа, после которого отправляется
+        дублирующий запрос
+
+        Returns:
+            float | None: 95-й процентиль недавних задержек в секундах или None,
+                если дублирование выключено или задержек измерено недостаточно
+        """
+
+        with self._lock:
+            if not self.hedging or len(self._latencies) < self.hedge_min_samples:
+                return None
+            return float(np.percentile(self._latencies, 95))
+
+    async def _acquire(self, deadline: float) -> bool:
+        loop = asyncio.get_running_loop()
+        while not self._semaphore.acquire(blocking=False):
+            waiter = (loop, loop.create_future())
+            with self._lock:
+                self._waiters.append(waiter)
+            try:
+                # разрешение могло освободиться до того, как ожидание было добавлено
+                if self._semaphore.acquire(blocking=False):
+                    return True
+                await asyncio.wait_for(
+                    waiter[1], timeout=max(deadline - time.monotonic(), 0)
+                )
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                with self._lock:
+                    if waiter in self._waiters:
+                        self._waiters.remove(waiter)
+        return True
+
+    def _release(self):
+        self._semaphore.release()
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(
+                lambda future=future: future.done() or future.set_result(None)
+            )
+
+    def _attempt(self, query: Any, deadline: float) -> Any:
+        start = time.monotonic()
+        futures: list[Future] = [self._executor.submit(self.invoke_function, query)]
+        delay = self.hedge_delay()
+        if delay is not None and delay < deadline - start:
+            done, _ = wait(futures, timeout=delay)
+            if len(done) == 0:
+                futures.append(self._executor.submit(self.invoke_function, query))
+                with self._lock:
+                    self.hedged += 1
+        while True:
+            done, _ = wait(
+                futures,
+                timeout=max(deadline - time.monotonic(), 0),
+                return_when=FIRST_COMPLETED,
+            )
+            if len(done) == 0:
+                raise TimeoutError("LLM response deadline exceeded")
+            for future in done:
+                if future.exception() is None:
+                    with self._lock:
+                        self._latencies.append(time.monotonic() - start)
+                    return future.result()
+            futures = [future for future in futures if not future.done()]
+            if len(futures) == 0:
+                raise next(iter(done)).exception()
+
+    def invoke(self, query: Any) -> Any:
+        """Вызывает LLM с учётом ограничений и повторяет вызов при временных ошибках
+
+        Args:
+            query (Any): аргумент вызова LLM
+
+        Raises:
+            LLMUnavailableError: автомат защиты разомкнут, истёк срок ожидания
+                или вызов завершился ошибкой
+
+        Returns:
+            Any: результат вызова LLM
+        """
+
+        deadline = time.monotonic() + self.timeout
+        if not self._semaphore.acquire(timeout=self.timeout):
+            with self._lock:
+                self.rejected += 1
+            raise LLMUnavailableError("LLM concurrency limit wait timed out")
+        # разрешение автомата защиты запрашивается после ожидания семафора,
+        # и пробный запрос всегда завершается отметкой результата или снятием отметки
+        permitted = False
+        try:
+            if not self.breaker.allow():
+                with self._lock:
+                    self.rejected += 1
+                raise LLMUnavailableError("LLM circuit breaker is open")
+            permitted = True
+            with self._lock:
+                self.calls += 1
+            attempt = 0
+            while True:
+                try:
+                    result = self._attempt(query, deadline)
+                except Exception as e:
+                    logging.error(e)
+                    self.breaker.record_failure()
+                    permitted = False
+                    pause = random.uniform(0, self.backoff * 2**attempt)
+                    if (
+                        attempt >= self.retries
+                        or not is_transient_error(e)
+                        or time.monotonic() + pause >= deadline
+                        or not self.breaker.allow()
+                    ):
+                        raise LLMUnavailableError(str(e)) from e
+                    permitted = True
+                    attempt += 1
+                    with self._lock:
+                        self.retried += 1
+                    time.sleep(pause)
+                    continue
+                self.breaker.record_success()
+                permitted = False
+                return result
+        finally:
+            if permitted:
+                self.breaker.release()
+            self._release()
+
+    async def astream(
+        self, stream: Callable[[Any], AsyncIterator], query: Any
+    ) -> AsyncIterator:
+        """Асинхронно возвращает части ответа потокового вызова LLM с теми же
+        ограничениями, что и `invoke`: количеством одновременных вызовов, сроком
+        ожидания ответа и автоматом защиты. Вызов повторяется при временной ошибке,
+        если ни одна часть ответа ещё не получена. Дублирование запросов не выполняется
+
+        Args:
+            stream (Callable[[Any], AsyncIterator]): потоковый вызов LLM
+            query (Any): аргумент вызова LLM
+
+        Raises:
+            LLMUnavailableError: автомат защиты разомкнут, истёк срок ожидания
+                или вызов завершился ошибкой
+
+        Yields:
+            Any: очередная часть ответа
+        """
+
+        deadline = time.monotonic() + self.timeout
+        if not await self._acquire(deadline):
+            with self._lock:
+                self.rejected += 1
+            raise LLMUnavailableError("LLM concurrency limit wait timed out")
+        permitted = False
+        try:
+            if not self.breaker.allow():
+                with self._lock:
+                    self.rejected += 1
+                raise LLMUnavailableError("LLM circuit breaker is open")
+            permitted = True
+            with self._lock:
+                self.calls += 1
+            attempt = 0
+            received = False
+            while True:
+                iterator = stream(query).__aiter__()
+                try:
+                    while True:
+                        try:
+                            part = await asyncio.wait_for(
+                                iterator.__anext__(),
+                                timeout=max(deadline - time.monotonic(), 0),
+                            )
+                        except StopAsyncIteration:
+                            break
+                        received = True
+                        yield part
+                except Exception as e:
+                    logging.error(e)
+                    self.breaker.record_failure()
+                    permitted = False
+                    pause = random.uniform(0, self.backoff * 2**attempt)
+                    if (
+                        received
+                        or attempt >= self.retries
+                        or not is_transient_error(e)
+                        or time.monotonic() + pause >= deadline
+                        or not self.breaker.allow()
+                    ):
+                        raise LLMUnavailableError(str(e)) from e
+                    permitted = True
+                    attempt += 1
+                    with self._lock:
+                        self.retried += 1
+                    await asyncio.sleep(pause)
+                    continue
+                finally:
+                    if hasattr(iterator, "aclose"):
+                        await iterator.aclose()
+                self.breaker.record_success()
+                permitted = False
+                return
+        finally:
+            if permitted:
+                self.breaker.release()
+            self._release()
+
+    def stats(self) -> dict:
+        """Возвращает статистику вызовов LLM
+
+        Returns:
+            dict: количество вызовов, повторов, дублирующих и отклонённых запросов,
+                состояние автомата защиты и порог дублирования
+        """
+
+        delay = self.hedge_delay()
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "retried": self.retried,
+                "hedged": self.hedged,
+                "rejected": self.rejected,
+                "breaker_state": self.breaker.state,
+                "breaker_opened": self.breaker.opened,
+                "hedge_delay": delay,
+            }
@@ -1,27 +1,450 @@
-from contextlib import redirect_stderr
-import io
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import gc
+import json
 import logging
+import os
+import time
+from typing import Any, Awaitable, Callable
 from aiohttp import web
+import numpy as np
+import torch
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from sentence_transformers import SentenceTransformer
-from sqlalchemy import create_engine, select
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import Session
 from config import Config
+from context_building import SentenceEmbeddingCache, build_context
+from answer_cache import SemanticAnswerCache
 from database import Chunk
-from llm_prompting import get_answer
-from confluence_retrieving import get_chunk, reindex_confluence
+from llm_gateway import LLMUnavailableError
+from llm_prompting import LLMAnswer, astream_answer, get_answer, get_gateway
+from metrics import (
+    ANSWER_OUTCOMES,
+    CONTEXT_SECONDS,
+    ENCODE_SECONDS,
+    IN_FLIGHT_REQUESTS,
+    LAST_REINDEX_SECONDS,
+    LEXICAL_SEARCH_SECONDS,
+    LLM_SECONDS,
+    REQUEST_SECONDS,
+    RESPONSES,
+    VECTOR_SEARCH_SECONDS,
+    clear_multiprocess_metrics,
+    mark_worker_dead,
+    render_metrics,
+)
+from confluence_retrieving import (
+    aget_chunk_by_embedding,
+    aget_chunk_lexical,
+    aget_chunks_by_embeddings,
+    aget_chunks_lexical,
+    get_chunk_by_embedding,
+    get_chunk_lexical,
+    get_chunks_by_embeddings,
+    get_chunks_lexical,
+    prepare_vector_search_index,
+    reindex_confluence,
+    warm_up_async_engine,
+)
+from embedding_snapshot import EmbeddingSnapshot, export_embedding_snapshot
+from encoding import BatchingEncoder, CachedEncoder, load_encoder_model
+from known_answers import KnownAnswers, build_known_answers, invalidate_known_answers
+from prefork import serve_prefork
+from startup import StartupProgress
 
 routes = web.RouteTableDef()
 engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
+async_engine = (
+    create_async_engine(
+        Config.SQLALCHEMY_ASYNC_DATABASE_URI,
+        pool_size=Config.ASYNC_POOL_SIZE,
+        pool_pre_ping=True,
+        connect_args={"prepared_statement_cache_size": 100},
+    )
+    if Config.ASYNC_RETRIEVAL
+    else None
+)
 text_splitter = RecursiveCharacterTextSplitter(
     chunk_size=4096,
     chunk_overlap=200,
     length_function=len,
     is_separator_regex=False,
 )
-encoder_model = SentenceTransformer(
-    "saved_models/multilingual-e5-large-wikiutmn", device="cpu"
+startup_progress = StartupProgress()
+prepare_task: asyncio.Task | None = None
+encoder_model: SentenceTransformer | None = None
+question_encoder: CachedEncoder | None = None
+embedding_snapshot = (
+    EmbeddingSnapshot(Config.EMBEDDING_SNAPSHOT_PATH)
+    if Config.RETRIEVAL_ENGINE == "numpy"
+    else None
+)
+answer_cache = SemanticAnswerCache(
+    Config.ANSWER_CACHE_THRESHOLD, Config.ANSWER_CACHE_MAX_SIZE, Config.ANSWER_CACHE_TTL
+)
+known_answers = KnownAnswers(Config.KNOWN_ANSWERS_THRESHOLD)
+sentence_cache = SentenceEmbeddingCache(Config.SENTENCE_CACHE_MAX_CHUNKS)
+cpu_executor = ThreadPoolExecutor(
+    max_workers=Config.QA_CPU_WORKERS, thread_name_prefix="qa-cpu"
 )
+io_executor = ThreadPoolExecutor(
+    max_workers=Config.QA_IO_WORKERS, thread_name_prefix="qa-io"
+)
+pending_requests = 0
+index_generation: int | None = None
+# -1 — известные ответы ещё не загружались
+known_answers_generation: int | None = -1
+# рекомендательная блокировка Postgres, под которой процессы микросервиса
+# создают, обновляют индекс и известные ответы
+INDEX_LOCK_ID = 7_340_001
+
+
+@web.middleware
+async def readiness_gate(
+    request: web.Request,
+    handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+) -> web.StreamResponse:
+    """Отклоняет запросы со статусом 503, пока модель и индекс загружаются
+    в фоне после запуска сервера, кроме запросов `/healthz`, `/readyz` и `/metrics`
+
+    Args:
+        request (web.Request): запрос
+        handler (Callable[[web.Request], Awaitable[web.StreamResponse]]): обработчик запроса
+
+    Returns:
+        web.StreamResponse: ответ
+    """
+
+    if startup_progress.ready or request.path in ("/healthz", "/readyz", "/metrics"):
+        return await handler(request)
+    return web.Response(
+        text="Service is starting", status=503, headers={"Retry-After": "5"}
+    )
+
+
+@web.middleware
+async def request_metrics(
+    request: web.Request,
+    handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+) -> web.StreamResponse:
+    """Учитывает в метриках время обработки вопросов, статусы ответов
+    и количество одновременно обрабатываемых вопросов
+
+    Args:
+        request (web.Request): запрос
+        handler (Callable[[web.Request], Awaitable[web.StreamResponse]]): обработчик запроса
+
+    Returns:
+        web.StreamResponse: ответ
+    """
+
+    if not request.path.startswith("/qa/"):
+        return await handler(request)
+    status = 500
+    IN_FLIGHT_REQUESTS.inc()
+    try:
+        with REQUEST_SECONDS.time():
+            response = await handler(request)
+        status = response.status
+        return response
+    finally:
+        IN_FLIGHT_REQUESTS.dec()
+        RESPONSES.labels(status=str(status)).inc()
+
+
+@web.middleware
+async def admission_control(
+    request: web.Request,
+    handler: Callable[[web.Request], Awaitable[web.StreamResponse]],
+) -> web.StreamResponse:
+    """Ограничивает количество одновременно обрабатываемых вопросов:
+    при превышении `Config.QA_MAX_PENDING_REQUESTS` вопрос отклоняется
+    со статусом 503, чтобы не накапливать очередь, которую сервис не успеет обработать
+
+    Args:
+        request (web.Request): запрос
+        handler (Callable[[web.Request], Awaitable[web.StreamResponse]]): обработчик запроса
+
+    Returns:
+        web.StreamResponse: ответ
+    """
+
+    global pending_requests
+    if not request.path.startswith("/qa/"):
+        return await handler(request)
+    if pending_requests >= Config.QA_MAX_PENDING_REQUESTS:
+        return web.Response(
+            text="Too many requests", status=503, headers={"Retry-After": "1"}
+        )
+    pending_requests += 1
+    try:
+        return await handler(request)
+    finally:
+        pending_requests -= 1
+
+
+async def encode_question(question: str) -> np.ndarray:
+    """Возвращает векторное представление вопроса, вычисленное в пуле потоков `cpu_executor`
+
+    Args:
+        question (str): вопрос пользователя
+
+    Returns:
+        np.ndarray: векторное представление вопроса
+    """
+
+    with ENCODE_SECONDS.time():
+        return await asyncio.get_running_loop().run_in_executor(
+            cpu_executor, question_encoder.encode, question
+        )
+
+
+async def encode_questions(questions: list[str]) -> np.ndarray:
+    """Возвращает векторные представления нескольких вопросов, вычисленные одним
+    вызовом модели в пуле потоков `cpu_executor` без кеша вопросов и пакетного
+    кодировщика. Вопросы нормализуются так же, как в `CachedEncoder`
+
+    Args:
+        questions (list[str]): вопросы пользователей
+
+    Returns:
+        np.ndarray: векторные представления вопросов, по строке на вопрос
+    """
+
+    with ENCODE_SECONDS.time():
+        return await asyncio.get_running_loop().run_in_executor(
+            cpu_executor,
+            encoder_model.encode,
+            [CachedEncoder.normalize(question) for question in questions],
+        )
+
+
+async def find_chunk(embedding: np.ndarray) -> Chunk | None:
+    """Возвращает ближайший к вопросу фрагмент документа через асинхронный пул
+    соединений или в пуле потоков `io_executor`
+
+    Args:
+        embedding (np.ndarray): векторное представление вопроса
+
+    Returns:
+        Chunk | None: экземпляр класса Chunk — фрагмент документа
+    """
+
+    with VECTOR_SEARCH_SECONDS.time():
+        if async_engine is not None:
+            return await aget_chunk_by_embedding(
+                async_engine, embedding, embedding_snapshot
+            )
+        return await asyncio.get_running_loop().run_in_executor(
+            io_executor, get_chunk_by_embedding, engine, embedding, embedding_snapshot
+        )
+
+
+async def find_chunks(embeddings: np.ndarray) -> list[Chunk | None]:
+    """Возвращает ближайшие к нескольким вопросам фрагменты документов одним
+    запросом к БД через асинхронный пул соединений или в пуле потоков `io_executor`
+
+    Args:
+        embeddings (np.ndarray): векторные представления вопросов, по строке на вопрос
+
+    Returns:
+        list[Chunk | None]: экземпляры класса Chunk — фрагменты документов в порядке вопросов
+    """
+
+    if async_engine is not None:
+        return await aget_chunks_by_embeddings(
+            async_engine, embeddings, embedding_snapshot
+        )
+    return await asyncio.get_running_loop().run_in_executor(
+        io_executor, get_chunks_by_embeddings, engine, embeddings, embedding_snapshot
+    )
+
+
+async def find_lexical_chunk(question: str) -> Chunk | None:
+    """Возвращает фрагмент документа, однозначно найденный по словам вопроса
+    полнотекстовым поиском, через асинхронный пул соединений или в пуле потоков `io_executor`
+
+    Args:
+        question (str): вопрос пользователя
+
+    Returns:
+        Chunk | None: экземпляр класса Chunk — фрагмент документа
+    """
+
+    with LEXICAL_SEARCH_SECONDS.time():
+        if async_engine is not None:
+            return await aget_chunk_lexical(async_engine, question)
+        return await asyncio.get_running_loop().run_in_executor(
+            io_executor, get_chunk_lexical, engine, question
+        )
+
+
+async def find_lexical_chunks(questions: list[str]) -> list[Chunk | None]:
+    """Возвращает фрагменты документов, однозначно найденные по словам нескольких
+    вопросов полнотекстовым поиском одним запросом к БД, через асинхронный пул
+    соединений или в пуле потоков `io_executor`
+
+    Args:
+        questions (list[str]): вопросы пользователей
+
+    Returns:
+        list[Chunk | None]: экземпляры класса Chunk — фрагменты документов в порядке вопросов
+    """
+
+    with LEXICAL_SEARCH_SECONDS.time():
+        if async_engine is not None:
+            return await aget_chunks_lexical(async_engine, questions)
+        return await asyncio.get_running_loop().run_in_executor(
+            io_executor, get_chunks_lexical, engine, questions
+        )
+
+
+async def retrieve_known_or_lexical(
+    question: str,
+) -> tuple[np.ndarray | None, tuple[str, str, str] | None, Chunk | None]:
+    """Ищет ответ на вопрос среди известных ответов, затем фрагмент документа
+    для генерации ответа полнотекстовым поиском (если включён `Config.LEXICAL_SEARCH`)
+
+    Args:
+        question (str): вопрос пользователя
+
+    Returns:
+        tuple[np.ndarray | None, tuple[str, str, str] | None, Chunk | None]: векторное
+            представление вопроса (None, если известных ответов нет), известный ответ,
+            ссылка на источник и исход known, фрагмент документа; ответ и фрагмент
+            равны None, если не найдены
+    """
+
+    embedding = None
+    await sync_known_answers()
+    if len(known_answers) > 0:
+        embedding = await encode_question(question)
+        known_answer = known_answers.get(embedding)
+        if known_answer is not None:
+            return embedding, (*known_answer, "known"), None
+    if Config.LEXICAL_SEARCH:
+        chunk = await find_lexical_chunk(question)
+        if chunk is not None:
+            return embedding, None, chunk
+    return embedding, None, None
+
+
+async def retrieve(
+    question: str,
+) -> tuple[np.ndarray | None, tuple[str, str, str] | None, Chunk | None]:
+    """Ищет ответ на вопрос среди известных ответов, затем фрагмент документа
+    для генерации ответа полнотекстовым поиском (если включён `Config.LEXICAL_SEARCH`),
+    затем ответ в кеше ответов и фрагмент документа по векторному представлению вопроса
+
+    Args:
+        question (str): вопрос пользователя
+
+    Returns:
+        tuple[np.ndarray | None, tuple[str, str, str] | None, Chunk | None]: векторное
+            представление вопроса (None, если фрагмент найден полнотекстовым поиском
+            без вычисления векторного представления), готовый ответ, ссылка на источник
+            и исход (known — известный ответ, cached — ответ из кеша), фрагмент документа
+    """
+
+    embedding, known_answer, chunk = await retrieve_known_or_lexical(question)
+    if known_answer is not None or chunk is not None:
+        return embedding, known_answer, chunk
+    if embedding is None:
+        embedding = await encode_question(question)
+    sync_answer_cache()
+    cached_answer = answer_cache.get(embedding)
+    if cached_answer is not None:
+        return embedding, (*cached_answer, "cached"), None
+    return embedding, None, await find_chunk(embedding)
+
+
+async def prepare_context(
+    chunk: Chunk, question: str, embedding: np.ndarray | None
+) -> str:
+    """Возвращает контекст для промта: предложения фрагмента документа, отобранные
+    в пределах `Config.CONTEXT_TOKEN_BUDGET` токенов, или весь фрагмент, если бюджет равен 0.
+    Векторные представления предложений кешируются в `sentence_cache`, а если
+    фрагмент найден без векторного представления вопроса, предложения отбираются
+    по общим с вопросом словам
+
+    Args:
+        chunk (Chunk): фрагмент документа
+        question (str): вопрос пользователя
+        embedding (np.ndarray | None): векторное представление вопроса, None —
+            если оно не вычислялось при поиске фрагмента
+
+    Returns:
+        str: контекст для промта
+    """
+
+    if Config.CONTEXT_TOKEN_BUDGET <= 0:
+        return chunk.text
+    with CONTEXT_SECONDS.time():
+        return await asyncio.get_running_loop().run_in_executor(
+            cpu_executor,
+            build_context,
+            chunk.text,
+            question,
+            embedding,
+            encoder_model,
+            Config.CONTEXT_TOKEN_BUDGET,
+            sentence_cache,
+            chunk.id,
+        )
+
+
+def answer_outcome(answer: LLMAnswer) -> str:
+    """Определяет исход генерации ответа LLM и учитывает его в метриках
+
+    Args:
+        answer (LLMAnswer): ответ LLM
+
+    Returns:
+        str: исход генерации: stopped — генерация прервана, not_found — ответ
+            не найден, answered — ответ получен
+    """
+
+    if not answer.complete:
+        logging.warning(f"LLM generation stopped with reason: {answer.finish_reason}")
+        outcome = "stopped"
+    elif len(answer.text) == 0 or "ответ не найден" in answer.text.lower():
+        outcome = "not_found"
+    else:
+        outcome = "answered"
+    ANSWER_OUTCOMES.labels(outcome=outcome).inc()
+    return outcome
+
+
+async def answer_from_chunk(
+    chunk: Chunk, question: str, embedding: np.ndarray | None
+) -> tuple[str, str]:
+    """Генерирует ответ LLM на вопрос по фрагменту документа и учитывает
+    исход генерации в метриках
+
+    Args:
+        chunk (Chunk): фрагмент документа
+        question (str): вопрос пользователя
+        embedding (np.ndarray | None): векторное представление вопроса, None —
+            если оно не вычислялось при поиске фрагмента
+
+    Raises:
+        LLMUnavailableError: LLM не ответила (см. `LLMGateway.invoke`)
+
+    Returns:
+        tuple[str, str]: исход генерации (answered, not_found или stopped)
+            и ответ, пустой, если ответ не найден
+    """
+
+    context = await prepare_context(chunk, question, embedding)
+    with LLM_SECONDS.time():
+        answer = await asyncio.get_running_loop().run_in_executor(
+            io_executor, get_answer, context, question
+        )
+    outcome = answer_outcome(answer)
+    return outcome, answer.text if outcome == "answered" else ""
 
 
 @routes.post("/qa/")
@@ -36,47 +459,588 @@ async def qa(request: web.Request) -> web.Response:
     """
 
     question = (await request.json())["question"]
-    chunk = get_chunk(engine=engine, encoder_model=encoder_model, question=question)
+    embedding, cached_answer, chunk = await retrieve(question)
+    if cached_answer is not None:
+        answer, confluence_url, outcome = cached_answer
+        ANSWER_OUTCOMES.labels(outcome=outcome).inc()
+        return web.json_response({"answer": answer, "confluence_url": confluence_url})
     if chunk is None:
+        ANSWER_OUTCOMES.labels(outcome="no_chunk").inc()
         return web.Response(text="Chunk not found", status=404)
-    alt_stream = io.StringIO()
-    with redirect_stderr(alt_stream):
-        answer = get_answer(chunk.text, question)
-    warnings = alt_stream.getvalue()
-    if len(warnings) > 0:
-        logging.warning(warnings)
-    if "stopped" in warnings or "ответ не найден" in answer.lower():
+    try:
+        outcome, answer = await answer_from_chunk(chunk, question, embedding)
+    except LLMUnavailableError:
+        return web.Response(
+            text="LLM is unavailable", status=503, headers={"Retry-After": "5"}
+        )
+    if outcome != "answered":
         return web.Response(text="Answer not found", status=404)
+    if embedding is not None:
+        answer_cache.put(embedding, answer, chunk.confluence_url)
     return web.json_response({"answer": answer, "confluence_url": chunk.confluence_url})
 
 
+@routes.post("/qa/batch/")
+async def qa_batch(request: web.Request) -> web.Response:
+    """Возвращает ответы на список вопросов в исходном порядке, например,
+    для повторной оценки ответов на вопросы из истории после переиндексации
+    или изменения промта. Вопросы обрабатываются так же, как в `/qa/`, кроме кеша
+    ответов, который не используется, чтобы ответы соответствовали текущим векторному
+    индексу и промту. Чтобы список вопросов не занимал общие пулы потоков наравне
+    с отдельными запросами, векторные представления вопросов вычисляются одним
+    вызовом модели, полнотекстовый поиск и поиск ближайших фрагментов для вопросов
+    без известного ответа выполняются одним запросом к БД каждый, а ответы
+    генерируются не более чем `Config.QA_BATCH_LLM_CONCURRENCY` одновременными
+    вызовами LLM
+
+    Args:
+        request (web.Request): запрос, содержащий список вопросов `questions`
+            длиной не больше `Config.QA_BATCH_MAX_SIZE`
+
+    Returns:
+        web.Response: ответ, содержащий `results` — список объектов `answer`,
+            `confluence_url` и `status` (known, answered, not_found, stopped,
+            no_chunk или llm_unavailable) в порядке вопросов
+    """
+
+    questions = (await request.json())["questions"]
+    if (
+        not isinstance(questions, list)
+        or len(questions) > Config.QA_BATCH_MAX_SIZE
+        or not all(isinstance(question, str) for question in questions)
+    ):
+        return web.Response(
+            text=f"Expected a list of at most {Config.QA_BATCH_MAX_SIZE} questions",
+            status=400,
+        )
+    if len(questions) == 0:
+        return web.json_response({"results": []})
+    embeddings = [None] * len(questions)
+    known = [None] * len(questions)
+    chunks = [None] * len(questions)
+    await sync_known_answers()
+    if len(known_answers) > 0:
+        embeddings = list(await encode_questions(questions))
+        for i, embedding in enumerate(embeddings):
+            known_answer = known_answers.get(embedding)
+            if known_answer is not None:
+                known[i] = (*known_answer, "known")
+    unanswered = [i for i in range(len(questions)) if known[i] is None]
+    if Config.LEXICAL_SEARCH and len(unanswered) > 0:
+        found = await find_lexical_chunks([questions[i] for i in unanswered])
+        for i, chunk in zip(unanswered, found):
+            chunks[i] = chunk
+    # вопросы без известного ответа и фрагмента, найденного полнотекстовым поиском
+    missing = [i for i in unanswered if chunks[i] is None]
+    unencoded = [i for i in missing if embeddings[i] is None]
+    if len(unencoded) > 0:
+        encoded = await encode_questions([questions[i] for i in unencoded])
+        for i, embedding in zip(unencoded, encoded):
+            embeddings[i] = embedding
+    if len(missing) > 0:
+        nearest = await find_chunks(np.stack([embeddings[i] for i in missing]))
+        for i, chunk in zip(missing, nearest):
+            chunks[i] = chunk
+    semaphore = asyncio.Semaphore(Config.QA_BATCH_LLM_CONCURRENCY)
+
+    async def answer_item(
+        question: str,
+        embedding: np.ndarray | None,
+        known_answer: tuple[str, str, str] | None,
+        chunk: Chunk | None,
+    ):
+        if known_answer is not None:
+            answer, confluence_url, outcome = known_answer
+            ANSWER_OUTCOMES.labels(outcome=outcome).inc()
+            return {
+                "answer": answer,
+                "confluence_url": confluence_url,
+                "status": outcome,
+            }
+        if chunk is None:
+            ANSWER_OUTCOMES.labels(outcome="no_chunk").inc()
+            return {"answer": "", "confluence_url": None, "status": "no_chunk"}
+        async with semaphore:
+            try:
+                outcome, answer = await answer_from_chunk(chunk, question, embedding)
+            except LLMUnavailableError:
+                outcome, answer = "llm_unavailable", ""
+        return {
+            "answer": answer,
+            "confluence_url": chunk.confluence_url if outcome == "answered" else None,
+            "status": outcome,
+        }
+
+    results = await asyncio.gather(
+        *[answer_item(*item) for item in zip(questions, embeddings, known, chunks)]
+    )
+    return web.json_response({"results": results})
+
+
+@routes.post("/qa/stream/")
+async def qa_stream(request: web.Request) -> web.StreamResponse:
+    """Возвращает ответ на вопрос пользователя по мере его генерации LLM
+    в формате NDJSON: строки `{"delta": ...}` с очередными частями ответа
+    и завершающая строка `{"answer": ..., "confluence_url": ...}`, в которой
+    при отсутствии ответа или прерванной генерации `answer` пуст,
+    а `confluence_url` равен null
+
+    Args:
+        request (web.Request): запрос, содержащий `question`
+
+    Returns:
+        web.StreamResponse: потоковый ответ
+    """
+
+    question = (await request.json())["question"]
+    embedding, cached_answer, chunk = await retrieve(question)
+    if cached_answer is None and chunk is None:
+        ANSWER_OUTCOMES.labels(outcome="no_chunk").inc()
+        return web.Response(text="Chunk not found", status=404)
+    if cached_answer is None and get_gateway().breaker.state == "open":
+        return web.Response(
+            text="LLM is unavailable", status=503, headers={"Retry-After": "5"}
+        )
+    if cached_answer is None:
+        context = await prepare_context(chunk, question, embedding)
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    await response.prepare(request)
+    if cached_answer is not None:
+        answer, confluence_url, outcome = cached_answer
+        ANSWER_OUTCOMES.labels(outcome=outcome).inc()
+    else:
+        parts, finish_reason = [], None
+        failed = False
+        try:
+            with LLM_SECONDS.time():
+                async for part in astream_answer(context, question):
+                    finish_reason = part.finish_reason
+                    if len(part.text) == 0:
+                        continue
+                    parts.append(part.text)
+                    await response.write(
+                        json.dumps({"delta": part.text}, ensure_ascii=False).encode()
+                        + b"\n"
+                    )
+        except LLMUnavailableError as e:
+            logging.error(e)
+            failed = True
+        answer, confluence_url = "".join(parts).strip(), chunk.confluence_url
+        # генерация прервана ошибкой, лимитом токенов или фильтром:
+        # полученные части не являются ответом и не кешируются
+        if failed or answer_outcome(LLMAnswer(answer, finish_reason)) != "answered":
+            answer, confluence_url = "", None
+        elif embedding is not None:
+            answer_cache.put(embedding, answer, confluence_url)
+    await response.write(
+        json.dumps(
+            {"answer": answer, "confluence_url": confluence_url}, ensure_ascii=False
+        ).encode()
+        + b"\n"
+    )
+    await response.write_eof()
+    return response
+
+
+@routes.get("/healthz")
+async def healthz(request: web.Request) -> web.Response:
+    """Проверка работоспособности: сервер принимает запросы,
+    в ответе — время выполнения этапов загрузки
+
+    Args:
+        request (web.Request): запрос
+
+    Returns:
+        web.Response: ответ
+    """
+
+    return web.json_response(startup_progress.report())
+
+
+@routes.get("/readyz")
+async def readyz(request: web.Request) -> web.Response:
+    """Проверка готовности: статус 200, если модель и индекс загружены
+    и микросервис готов отвечать на вопросы, иначе 503
+
+    Args:
+        request (web.Request): запрос
+
+    Returns:
+        web.Response: ответ
+    """
+
+    return web.json_response(
+        startup_progress.report(), status=200 if startup_progress.ready else 503
+    )
+
+
+@routes.get("/metrics")
+async def metrics(request: web.Request) -> web.Response:
+    """Возвращает метрики микросервиса в текстовом формате Prometheus
+
+    Args:
+        request (web.Request): запрос
+
+    Returns:
+        web.Response: ответ
+    """
+
+    body, content_type = render_metrics()
+    return web.Response(body=body, headers={"Content-Type": content_type})
+
+
+@routes.get("/stats/")
+async def stats(request: web.Request) -> web.Response:
+    """Возвращает статистику использования кешей микросервиса
+
+    Args:
+        request (web.Request): запрос
+
+    Returns:
+        web.Response: ответ
+    """
+
+    return web.json_response(
+        {
+            "question_cache": question_encoder.stats(),
+            "answer_cache": answer_cache.stats(),
+            "known_answers": known_answers.stats(),
+            "sentence_cache": sentence_cache.stats(),
+            "llm": get_gateway().stats(),
+        }
+    )
+
+
+def run_exclusively(function: Callable[[], Any]) -> tuple[bool, Any]:
+    """Выполняет функцию под сессионной рекомендательной блокировкой Postgres
+    `INDEX_LOCK_ID`, если её не удерживает другой процесс или запрос, не ожидая
+    освобождения блокировки
+
+    Args:
+        function (Callable[[], Any]): функция, обновляющая индекс или известные ответы
+
+    Returns:
+        tuple[bool, Any]: признак захвата блокировки и результат функции
+            (None, если блокировка не захвачена)
+    """
+
+    with engine.connect() as connection:
+        if not connection.scalar(select(func.pg_try_advisory_lock(INDEX_LOCK_ID))):
+            return False, None
+        try:
+            return True, function()
+        finally:
+            connection.scalar(select(func.pg_advisory_unlock(INDEX_LOCK_ID)))
+
+
 @routes.post("/reindex/")
 async def reindex(request: web.Request) -> web.Response:
-    """Пересоздаёт векторный индекс текстов для ответов на вопросы
+    """Обновляет векторный индекс текстов для ответов на вопросы в режиме,
+    заданном параметром запроса `mode` (`incremental` или `full`),
+    по умолчанию — в режиме `Config.REINDEX_MODE`. Если индекс или известные ответы
+    уже обновляются в одном из процессов микросервиса, отвечает 409 Conflict
 
     Args:
         request (web.Request): запрос
 
     Returns:
-        web.Response: ответ
+        web.Response: ответ с количеством обработанных страниц и фрагментов
     """
 
+    mode = request.query.get("mode", Config.REINDEX_MODE)
+    if mode not in ("incremental", "full"):
+        return web.Response(text=f"Unknown reindex mode {mode}", status=400)
+
+    def update_index() -> dict:
+        with LAST_REINDEX_SECONDS.time():
+            result = reindex_confluence(
+                engine=engine,
+                text_splitter=text_splitter,
+                encoder_model=encoder_model,
+                incremental=mode == "incremental",
+            )
+            refresh_known_answers()
+        return result
+
     try:
-        reindex_confluence(
-            engine=engine, text_splitter=text_splitter, encoder_model=encoder_model
+        locked, result = await asyncio.get_running_loop().run_in_executor(
+            None, run_exclusively, update_index
         )
-        return web.Response(status=200)
+        if not locked:
+            return web.Response(text="Reindex is already running", status=409)
+        mark_index_generation()
+        sync_answer_cache()
+        return web.json_response(result)
     except Exception as e:
         return web.Response(text=str(e), status=500)
 
 
-if __name__ == "__main__":
+@routes.post("/known-answers/")
+async def update_known_answers(request: web.Request) -> web.Response:
+    """Пополняет известные ответы ответами с оценкой 5 из истории вопросов.
+    Если индекс или известные ответы уже обновляются в одном из процессов
+    микросервиса, отвечает 409 Conflict
+
+    Args:
+        request (web.Request): запрос
+
+    Returns:
+        web.Response: ответ, содержащий количество отключённых `invalidated`
+            и добавленных `added` известных ответов
+    """
+
+    try:
+        locked, result = await asyncio.get_running_loop().run_in_executor(
+            None, run_exclusively, refresh_known_answers
+        )
+        if not locked:
+            return web.Response(text="Reindex is already running", status=409)
+        mark_index_generation()
+        return web.json_response(result)
+    except Exception as e:
+        return web.Response(text=str(e), status=500)
+
+
+def mark_index_generation():
+    """Отмечает пересоздание векторного индекса или обновление известных ответов
+    для всех процессов микросервиса, записывая время в файл `Config.INDEX_GENERATION_PATH`
+    """
+
+    with open(Config.INDEX_GENERATION_PATH, "w") as file:
+        file.write(str(time.time_ns()))
+
+
+def read_index_generation() -> int | None:
+    """Возвращает время последнего пересоздания векторного индекса
+    или обновления известных ответов любым процессом микросервиса
+
+    Returns:
+        int | None: время изменения файла `Config.INDEX_GENERATION_PATH`
+            в наносекундах или None, если файла нет
+    """
+
+    try:
+        return os.stat(Config.INDEX_GENERATION_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def sync_answer_cache():
+    """Сбрасывает кеш ответов процесса, если векторный индекс был пересоздан
+    после предыдущей проверки, в том числе другим процессом микросервиса"""
+
+    global index_generation
+    generation = read_index_generation()
+    if generation is None:
+        return
+    if generation != index_generation:
+        if index_generation is not None:
+            answer_cache.clear()
+        index_generation = generation
+
+
+async def sync_known_answers():
+    """Перезагружает из БД в пуле потоков `io_executor` известные ответы процесса,
+    если после предыдущей загрузки векторный индекс был пересоздан или известные
+    ответы обновлены, в том числе другим процессом микросервиса"""
+
+    global known_answers_generation
+    generation = read_index_generation()
+    if not Config.KNOWN_ANSWERS or generation == known_answers_generation:
+        return
+    known_answers_generation = generation
+    await asyncio.get_running_loop().run_in_executor(
+        io_executor, known_answers.load, engine
+    )
+
+
+def refresh_known_answers() -> dict:
+    """Отключает известные ответы, страницы-источники которых изменились
+    при переиндексации, и добавляет новые ответы с оценкой 5 из истории вопросов,
+    если включены `Config.KNOWN_ANSWERS`
+
+    Returns:
+        dict: количество отключённых `invalidated` и добавленных `added` известных ответов
+    """
+
+    if not Config.KNOWN_ANSWERS:
+        return {"invalidated": 0, "added": 0}
+    result = {
+        "invalidated": invalidate_known_answers(engine),
+        "added": build_known_answers(
+            engine, encoder_model, Config.KNOWN_ANSWERS_THRESHOLD
+        ),
+    }
+    logging.warning(f"KNOWN ANSWERS UPDATED: {result}")
+    return result
+
+
+def load_encoder():
+    """Загружает модель получения векторных представлений, если она не была
+    загружена до создания процессов, и создаёт кеширующий пакетный кодировщик вопросов
+    """
+
+    global encoder_model, question_encoder
+    if encoder_model is None:
+        encoder_model = load_encoder_model(Config.ENCODER_BACKEND)
+    question_encoder = CachedEncoder(
+        BatchingEncoder(
+            encoder_model, Config.ENCODER_BATCH_WINDOW, Config.ENCODER_MAX_BATCH_SIZE
+        ),
+        Config.QUESTION_CACHE_MAX_BYTES,
+        Config.QUESTION_CACHE_TTL,
+    )
+
+
+def build_initial_index():
+    """Создаёт векторный индекс текстов, если таблица фрагментов пуста,
+    HNSW-индекс режима поиска `Config.VECTOR_SEARCH_MODE` и снимок векторных
+    представлений, если он используется и ещё не записан.
+    Процессы микросервиса выполняют проверку по очереди под рекомендательной
+    блокировкой Postgres, поэтому индекс создаётся только одним из них"""
+
     with Session(engine) as session:
+        session.execute(select(func.pg_advisory_xact_lock(INDEX_LOCK_ID)))
         questions = session.scalars(select(Chunk)).first()
         if questions is None:
-            reindex_confluence(
-                engine=engine, text_splitter=text_splitter, encoder_model=encoder_model
+            with LAST_REINDEX_SECONDS.time():
+                reindex_confluence(
+                    engine=engine,
+                    text_splitter=text_splitter,
+                    encoder_model=encoder_model,
+                )
+                refresh_known_answers()
+        prepare_vector_search_index(engine)
+        if embedding_snapshot is not None and not embedding_snapshot.exists():
+            export_embedding_snapshot(
+                engine, Config.EMBEDDING_SNAPSHOT_PATH, Config.EMBEDDING_SNAPSHOT_DTYPE
             )
-    app = web.Application()
+        session.commit()
+
+
+async def run_startup_stage(name: str, stage: Callable[[], Awaitable]):
+    """Выполняет этап загрузки микросервиса, отмечая его в `startup_progress`,
+    и повторяет его при ошибке до `Config.STARTUP_RETRIES` раз
+    с экспоненциальной задержкой
+
+    Args:
+        name (str): название этапа
+        stage (Callable[[], Awaitable]): этап загрузки
+
+    Raises:
+        Exception: ошибка последней попытки
+    """
+
+    for attempt in range(Config.STARTUP_RETRIES + 1):
+        try:
+            with startup_progress.stage(name):
+                await stage()
+            return
+        except Exception as e:
+            if attempt == Config.STARTUP_RETRIES:
+                raise
+            pause = Config.STARTUP_RETRY_BACKOFF * 2**attempt
+            logging.error(
+                f"STARTUP STAGE {name} FAILED ({e}), RETRYING IN {pause:.2f}s"
+            )
+            await asyncio.sleep(pause)
+
+
+async def prepare_service():
+    """Выполняет в фоне этапы загрузки микросервиса, отмечая их в `startup_progress`:
+    загрузку модели, создание клиента LLM, создание индекса при первом запуске
+    и подготовку пула асинхронного подключения к БД. Если этап не удаётся выполнить
+    и после повторов, процесс завершается, чтобы его перезапустили, а не оставался
+    неготовым"""
+
+    loop = asyncio.get_running_loop()
+    try:
+        await run_startup_stage(
+            "encoder_model", partial(loop.run_in_executor, None, load_encoder)
+        )
+        await run_startup_stage(
+            "llm_client", partial(loop.run_in_executor, None, get_gateway)
+        )
+        await run_startup_stage(
+            "initial_index", partial(loop.run_in_executor, None, build_initial_index)
+        )
+        await run_startup_stage("known_answers", sync_known_answers)
+        if async_engine is not None:
+            await run_startup_stage(
+                "async_pool",
+                partial(warm_up_async_engine, async_engine, Config.ASYNC_POOL_SIZE),
+            )
+    except Exception as e:
+        logging.critical(f"STARTUP FAILED: {e}")
+        # SystemExit в фоновой задаче не остановил бы сервер: процесс завершается
+        # сразу, и его перезапускает оркестратор или родительский процесс
+        logging.shutdown()
+        os._exit(1)
+    startup_progress.finish()
+
+
+async def on_startup(app: web.Application):
+    """Запускает фоновую подготовку микросервиса, не задерживая запуск сервера
+
+    Args:
+        app (web.Application): приложение aiohttp
+    """
+
+    global prepare_task
+    prepare_task = asyncio.create_task(prepare_service())
+
+
+async def on_cleanup(app: web.Application):
+    """Прерывает незавершённую подготовку микросервиса и закрывает соединения
+    асинхронного подключения к БД при остановке сервера
+
+    Args:
+        app (web.Application): приложение aiohttp
+    """
+
+    if prepare_task is not None and not prepare_task.done():
+        prepare_task.cancel()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
+def run_server(worker_id: int = 0):
+    """Запускает сервер aiohttp в текущем процессе. При нескольких процессах
+    все они принимают соединения на одном порту (SO_REUSEPORT)
+
+    Args:
+        worker_id (int): номер процесса
+    """
+
+    if Config.TORCH_NUM_THREADS > 0:
+        torch.set_num_threads(Config.TORCH_NUM_THREADS)
+    app = web.Application(
+        middlewares=[request_metrics, readiness_gate, admission_control]
+    )
     app.add_routes(routes)
-    web.run_app(app)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    web.run_app(app, reuse_port=Config.QA_WORKERS > 1)
+
+
+if __name__ == "__main__":
+    if Config.QA_WORKERS > 1:
+        # модель PyTorch загружается до fork, и её веса разделяются процессами
+        # в режиме копирования при записи; gc.freeze исключает уже созданные
+        # объекты из сборки мусора, чтобы она не копировала их страницы.
+        # Сессия ONNX Runtime не переживает fork (процессы зависают на её потоках),
+        # поэтому модель ONNX загружается в каждом процессе в `prepare_service`
+        if Config.ENCODER_BACKEND == "torch":
+            with startup_progress.stage("encoder_model_preload"):
+                encoder_model = load_encoder_model(Config.ENCODER_BACKEND)
+        gc.freeze()
+        clear_multiprocess_metrics()
+        serve_prefork(
+            run_server,
+            Config.QA_WORKERS,
+            on_worker_exit=mark_worker_dead,
+            restart_delay=Config.QA_WORKER_RESTART_DELAY,
+            max_restarts=Config.QA_WORKER_MAX_RESTARTS,
+        )
+    else:
+        run_server()
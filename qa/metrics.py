@@ -0,0 +1,82 @@
+import os
+import shutil
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client import multiprocess
+
+STAGE_SECONDS = Histogram(
+    "qa_stage_seconds",
+    "Длительность этапов обработки вопроса",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+ENCODE_SECONDS = STAGE_SECONDS.labels(stage="encode")
+LEXICAL_SEARCH_SECONDS = STAGE_SECONDS.labels(stage="lexical_search")
+VECTOR_SEARCH_SECONDS = STAGE_SECONDS.labels(stage="vector_search")
+CONTEXT_SECONDS = STAGE_SECONDS.labels(stage="context")
+LLM_SECONDS = STAGE_SECONDS.labels(stage="llm")
+REQUEST_SECONDS = STAGE_SECONDS.labels(stage="total")
+RESPONSES = Counter(
+    "qa_responses_total", "Ответы на запросы вопросов по статусу", ["status"]
+)
+ANSWER_OUTCOMES = Counter(
+    "qa_answer_outcomes_total",
+    "Исходы генерации ответов: answered, known, cached, not_found, stopped, no_chunk",
+    ["outcome"],
+)
+IN_FLIGHT_REQUESTS = Gauge(
+    "qa_in_flight_requests",
+    "Количество обрабатываемых вопросов",
+    multiprocess_mode="livesum",
+)
+LAST_REINDEX_SECONDS = Gauge(
+    "qa_last_reindex_duration_seconds",
+    "Длительность последней переиндексации",
+    multiprocess_mode="mostrecent",
+)
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Возвращает значения метрик в текстовом формате Prometheus. Если задана
+    переменная окружения PROMETHEUS_MULTIPROC_DIR, значения собираются
+    из файлов всех процессов микросервиса
+
+    Returns:
+        tuple[bytes, str]: значения метрик, тип содержимого ответа
+    """
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def clear_multiprocess_metrics():
+    """Удаляет файлы метрик процессов предыдущего запуска микросервиса
+    из каталога PROMETHEUS_MULTIPROC_DIR, если он задан"""
+
+    path = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if path is None:
+        return
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def mark_worker_dead(pid: int):
+    """Исключает из метрик значения gauge завершившегося процесса микросервиса
+
+    Args:
+        pid (int): ID процесса
+    """
+
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,111 @@
+import logging
+import os
+import signal
+import time
+from typing import Callable
+
+# процесс, проработавший дольше, считается запущенным успешно,
+# и счётчик его перезапусков сбрасывается
+STABLE_WORKER_SECONDS = 60
+
+
+def serve_prefork(
+    run_worker: Callable[[int], None],
+    workers: int,
+    on_worker_exit: Callable[[int], None] | None = None,
+    restart_delay: float = 1,
+    max_restarts: int = 5,
+):
+    """Запускает `workers` дочерних процессов, созданных с помощью fork,
+    и следит за ними: завершившийся процесс перезапускается, а сигналы SIGINT
+    и SIGTERM передаются всем процессам. Всё загруженное до вызова (например,
+    веса модели) разделяется процессами в режиме копирования при записи.
+    Перед перезапуском выдерживается задержка `restart_delay * 2^перезапуск`,
+    а если процесс завершается быстрее чем за `STABLE_WORKER_SECONDS` секунд
+    после запуска больше `max_restarts` раз подряд, все процессы останавливаются
+
+    Args:
+        run_worker (Callable[[int], None]): функция, выполняемая в дочернем процессе,
+            принимает номер процесса
+        workers (int): количество дочерних процессов
+        on_worker_exit (Callable[[int], None] | None): функция, вызываемая
+            с ID завершившегося дочернего процесса
+        restart_delay (float): базовая задержка перед перезапуском процесса в секундах
+        max_restarts (int): максимальное количество перезапусков процесса подряд
+
+    Raises:
+        RuntimeError: процесс перезапускался больше `max_restarts` раз подряд
+    """
+
+    children: dict[int, tuple[int, float]] = {}
+    restarts = [0] * workers
+    stopping = False
+    failed_worker: int | None = None
+
+    def spawn(worker_id: int):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(worker_id)
+            except BaseException as e:
+                logging.error(e)
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = (worker_id, time.monotonic())
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def pause(seconds: float):
+        deadline = time.monotonic() + seconds
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(min(0.1, deadline - time.monotonic()))
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for worker_id in range(workers):
+        spawn(worker_id)
+    while len(children) > 0:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        worker_id, started_at = children.pop(pid)
+        if on_worker_exit is not None:
+            on_worker_exit(pid)
+        if stopping:
+            continue
+        if time.monotonic() - started_at > STABLE_WORKER_SECONDS:
+            restarts[worker_id] = 0
+        if restarts[worker_id] >= max_restarts:
+            logging.error(
+                f"WORKER {worker_id} EXITED WITH STATUS {status} "
+                f"AFTER {restarts[worker_id]} RESTARTS, STOPPING"
+            )
+            failed_worker = worker_id
+            stop(signal.SIGTERM, None)
+            continue
+        delay = restart_delay * 2 ** restarts[worker_id]
+        restarts[worker_id] += 1
+        logging.warning(
+            f"WORKER {worker_id} EXITED WITH STATUS {status}, RESTARTING IN {delay:.1f}s"
+        )
+        pause(delay)
+        if not stopping:
+            spawn(worker_id)
+    if failed_worker is not None:
+        raise RuntimeError(
+            f"Worker {failed_worker} restarted {max_restarts} times in a row"
+        )
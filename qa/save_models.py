@@ -1,7 +1,16 @@
-from sentence_transformers import SentenceTransformer
+from sentence_transformers import (
+    SentenceTransformer,
+    export_dynamic_quantized_onnx_model,
+)
 
 model_checkpoint = "nizamovtimur/multilingual-e5-large-wikiutmn"
 save_path = "saved_models/multilingual-e5-large-wikiutmn"
 
 model = SentenceTransformer(model_checkpoint)
 model.save(save_path)
+
+# экспорт в ONNX (onnx/model.onnx) и динамическая квантизация весов в int8
+# (onnx/model_qint8_avx2.onnx) для Config.ENCODER_BACKEND = onnx / onnx-int8
+onnx_model = SentenceTransformer(save_path, backend="onnx")
+onnx_model.save(save_path)
+export_dynamic_quantized_onnx_model(onnx_model, "avx2", save_path)
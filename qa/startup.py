@@ -0,0 +1,64 @@
+from contextlib import contextmanager
+import logging
+import time
+from typing import Iterator
+
+
+class StartupProgress:
+    """Ход фоновой подготовки микросервиса к ответам на вопросы:
+    время выполнения этапов загрузки (модели, клиента LLM, индекса)
+    и признак готовности, устанавливаемый после завершения всех этапов
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.ready = False
+        self.failed = False
+        self._stages: dict[str, dict] = {}
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Отмечает выполнение этапа загрузки: его начало, длительность
+        и ошибку, если этап завершился исключением (исключение пробрасывается дальше)
+
+        Args:
+            name (str): название этапа
+        """
+
+        started_at = time.monotonic()
+        self._stages[name] = {"status": "running", "seconds": None}
+        try:
+            yield
+        except Exception as e:
+            self.failed = True
+            self._stages[name] = {
+                "status": "failed",
+                "seconds": round(time.monotonic() - started_at, 3),
+                "error": str(e),
+            }
+            raise
+        self._stages[name] = {
+            "status": "done",
+            "seconds": round(time.monotonic() - started_at, 3),
+        }
+        logging.warning(f"STARTUP STAGE {name} DONE")
+
+    def finish(self):
+        """Отмечает готовность микросервиса к ответам на вопросы"""
+
+        self.ready = True
+
+    def report(self) -> dict:
+        """Возвращает состояние подготовки микросервиса
+
+        Returns:
+            dict: признаки готовности и ошибки, время с момента запуска
+                и состояние каждого этапа загрузки в порядке их начала
+        """
+
+        return {
+            "ready": self.ready,
+            "failed": self.failed,
+            "uptime": round(time.monotonic() - self.started_at, 3),
+            "stages": dict(self._stages),
+        }
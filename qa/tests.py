@@ -1,7 +1,64 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import asyncio
+import io
+import json
+import signal
+import struct
+import threading
+import time
+from unittest.mock import patch
+from aiohttp.test_utils import TestClient, TestServer
 from atlassian import Confluence
+import numpy as np
+from gigachat.models import ChatCompletionChunk
+import requests
+from sqlalchemy import (
+    Column,
+    Index,
+    Integer,
+    MetaData,
+    Table,
+    Text,
+    create_engine,
+    inspect,
+)
 from config import Config
-from llm_prompting import get_answer
-from confluence_retrieving import get_document_content_by_id
+from context_building import SentenceEmbeddingCache, build_context, split_sentences
+from llm_prompting import LLMAnswer, astream_generation, get_answer, get_gateway
+from confluence_crawling import ConfluenceCrawler, RateLimiter
+from confluence_retrieving import (
+    COPY_HEADER,
+    copy_payload,
+    get_document_content_by_id,
+    get_leaf_page_versions,
+    plan_reindex,
+    prepare_vector_search_index,
+)
+from answer_cache import SemanticAnswerCache
+from benchmarks import (
+    InMemoryChunks,
+    StubEncoder,
+    compare_results,
+    pipeline,
+    pipeline_app,
+    stub_llm_gateway,
+)
+from database import Chunk
+from embedding_snapshot import EmbeddingSnapshot, write_embedding_snapshot
+from encoding import BatchingEncoder, CachedEncoder, encode_documents
+from known_answers import KnownAnswers, deduplicate, normalize_rows
+import main
+from prefork import serve_prefork
+from metrics import ANSWER_OUTCOMES, ENCODE_SECONDS, render_metrics
+from llm_gateway import (
+    CircuitBreaker,
+    LLMGateway,
+    LLMUnavailableError,
+    is_transient_error,
+)
+from startup import StartupProgress
 
 
 def test_llm():
@@ -11,8 +68,10 @@ def test_llm():
     частного фитнес-клуба, необходимо заполнить заявление и обратиться
     к курирующему преподавателю"""
     question = "Что нужно сделать, чтобы заменить физру на частный клуб?"
-    assert "препод" in get_answer(context, question).lower()
-    assert "не найден" in get_answer(context, "Когда наступит лето?").lower()
+    answer = get_answer(context, question)
+    assert "препод" in answer.text.lower()
+    assert answer.finish_reason == "stop" and answer.latency > 0
+    assert "не найден" in get_answer(context, "Когда наступит лето?").text.lower()
 
 
 def test_confluence():
@@ -22,8 +81,9 @@ def test_confluence():
     main_space = confluence.get_space(
         Config.CONFLUENCE_SPACES[0], expand="description.plain,homepage"
     )
+    crawler = ConfluenceCrawler(concurrency=1, rate=0, retries=0, backoff=0)
     page_content, page_link = get_document_content_by_id(
-        confluence, str(main_space["homepage"]["id"])
+        confluence, crawler, str(main_space["homepage"]["id"])
     )
     assert page_content is not None
     assert len(page_content) > 10
@@ -31,3 +91,715 @@ def test_confluence():
         page_link
         == main_space["_links"]["base"] + main_space["homepage"]["_links"]["webui"]
     )
+
+
+def test_embedding_snapshot(tmp_path):
+    """тест поиска ближайших фрагментов по снимку векторных представлений"""
+
+    snapshot = EmbeddingSnapshot(str(tmp_path))
+    assert snapshot.search(np.ones(8)) == []
+    embeddings = np.random.default_rng(0).normal(size=(100, 8))
+    write_embedding_snapshot(str(tmp_path), np.arange(100) + 10, embeddings)
+    assert snapshot.search(embeddings[7] * 3, k=2)[0] == 17
+    write_embedding_snapshot(str(tmp_path), np.arange(5), embeddings[:5], "float16")
+    assert snapshot.search(embeddings[3]) == [3]
+
+
+class FakeEncoder:
+    """Модель получения векторных представлений, подсчитывающая вызовы"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, sentences, **kwargs):
+        self.calls += 1
+        if isinstance(sentences, str):
+            return np.full(4, float(len(sentences)), dtype=np.float32)
+        return np.stack([np.full(4, float(len(s)), np.float32) for s in sentences])
+
+
+def test_cached_encoder():
+    """тест кеша векторных представлений вопросов"""
+
+    encoder = FakeEncoder()
+    entry_size = CachedEncoder._entry_size("вопрос один", np.zeros(4, np.float32))
+    cache = CachedEncoder(encoder, max_bytes=entry_size * 2, ttl=60)
+    first = cache.encode("Вопрос  один ")
+    assert cache.encode("вопрос один") is first
+    cache.encode("вопрос два")
+    cache.encode("вопрос три")
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (1, 3, 1)
+    assert stats["bytes"] <= stats["max_bytes"]
+    cache.encode("вопрос один")
+    assert encoder.calls == 4
+
+
+def test_batching_encoder():
+    """тест объединения одновременных вызовов модели в пакеты"""
+
+    encoder = FakeEncoder()
+    batching_encoder = BatchingEncoder(encoder, window=0.05, max_batch_size=8)
+    questions = ["?" * i for i in range(16)]
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        embeddings = list(executor.map(batching_encoder.encode, questions))
+    batching_encoder.close()
+    assert [embedding[0] for embedding in embeddings] == list(range(16))
+    assert all(embedding.base is None for embedding in embeddings)
+    assert encoder.calls < len(questions)
+
+
+def test_encode_documents():
+    """тест пакетного кодирования фрагментов документов, упорядоченных по длине"""
+
+    class RecordingEncoder(FakeEncoder):
+        def __init__(self):
+            super().__init__()
+            self.batches = []
+
+        def encode(self, sentences, **kwargs):
+            self.batches.append([len(s) for s in sentences])
+            return super().encode(sentences, **kwargs)
+
+    encoder = RecordingEncoder()
+    texts = ["?" * length for length in [3, 9, 1, 7, 5, 2, 8]]
+    embeddings = encode_documents(encoder, texts, batch_size=3)
+    assert embeddings[:, 0].tolist() == [3, 9, 1, 7, 5, 2, 8]
+    assert encoder.batches == [[9, 8, 7], [5, 3, 2], [1]]
+    assert encode_documents(encoder, [], batch_size=3).shape[0] == 0
+
+
+def test_semantic_answer_cache():
+    """тест кеша ответов на похожие вопросы"""
+
+    cache = SemanticAnswerCache(threshold=0.9, max_size=2, ttl=60, dimension=3)
+    cache.put(np.array([1.0, 0.0, 0.0]), "ответ 1", "url 1")
+    cache.put(np.array([0.0, 1.0, 0.0]), "ответ 2", "url 2")
+    assert cache.get(np.array([2.0, 0.1, 0.0])) == ("ответ 1", "url 1")
+    assert cache.get(np.array([1.0, 1.0, 0.0])) is None
+    cache.put(np.array([0.0, 0.0, 1.0]), "ответ 3", "url 3")
+    assert cache.get(np.array([0.0, 1.0, 0.0])) is None
+    assert cache.get(np.array([1.0, 0.0, 0.0])) == ("ответ 1", "url 1")
+    cache.clear()
+    assert cache.get(np.array([1.0, 0.0, 0.0])) is None
+
+
+def test_startup_progress():
+    """тест отметки этапов загрузки микросервиса"""
+
+    progress = StartupProgress()
+    with progress.stage("encoder_model"):
+        pass
+    try:
+        with progress.stage("initial_index"):
+            raise RuntimeError("нет соединения с Confluence")
+    except RuntimeError:
+        pass
+    report = progress.report()
+    assert report["stages"]["encoder_model"]["status"] == "done"
+    assert report["stages"]["initial_index"]["status"] == "failed"
+    assert report["failed"] and not report["ready"]
+    progress.finish()
+    assert progress.report()["ready"]
+
+
+def test_llm_gateway():
+    """тест повторов, дублирования запросов и автомата защиты при вызовах LLM,
+    в том числе потоковых, и создания клиента GigaChat вместе с обёрткой"""
+
+    calls = []
+
+    def flaky_invoke(query: str) -> str:
+        calls.append(query)
+        if query == "timeout" and len(calls) == 1:
+            raise TimeoutError()
+        if query == "invalid":
+            raise ValueError()
+        if query == "slow" and len(calls) == 1:
+            time.sleep(1)
+        return query
+
+    def gateway(**kwargs) -> LLMGateway:
+        calls.clear()
+        options = dict(
+            max_concurrency=2,
+            timeout=5,
+            retries=1,
+            backoff=0.01,
+            hedging=False,
+            hedge_min_samples=1,
+            breaker=CircuitBreaker(failures_threshold=2, reset_timeout=60),
+        )
+        options.update(kwargs)
+        return LLMGateway(flaky_invoke, **options)
+
+    assert is_transient_error(asyncio.TimeoutError())
+    assert not is_transient_error(ValueError())
+    llm = gateway()
+    assert llm.invoke("timeout") == "timeout"
+    assert llm.stats()["retried"] == 1
+    llm = gateway()
+    for _ in range(2):
+        try:
+            llm.invoke("invalid")
+        except LLMUnavailableError:
+            pass
+    assert len(calls) == 2
+    assert llm.stats()["breaker_state"] == "open"
+    try:
+        llm.invoke("ok")
+        assert False
+    except LLMUnavailableError:
+        assert len(calls) == 2
+    llm = gateway(hedging=True)
+    llm._latencies.append(0.05)
+    start = time.monotonic()
+    assert llm.invoke("slow") == "slow"
+    assert time.monotonic() - start < 0.5
+    assert llm.stats()["hedged"] == 1
+    breaker = CircuitBreaker(failures_threshold=1, reset_timeout=0.05)
+    llm = gateway(max_concurrency=1, timeout=0.1, retries=0, breaker=breaker)
+    try:
+        llm.invoke("invalid")
+    except LLMUnavailableError:
+        pass
+    time.sleep(0.06)
+    llm._semaphore.acquire()
+    try:
+        llm.invoke("ok")
+        assert False
+    except LLMUnavailableError:
+        llm._semaphore.release()
+    assert llm.invoke("ok") == "ok" and breaker.state == "closed"
+
+    async def stream(query: str):
+        for part in query.split():
+            if part == "invalid":
+                raise ValueError()
+            yield part
+
+    async def consume(query: str, limit: int) -> list[str]:
+        parts = []
+        generator = llm.astream(stream, query)
+        async for part in generator:
+            parts.append(part)
+            if len(parts) == limit:
+                break
+        await generator.aclose()
+        return parts
+
+    try:
+        llm.invoke("invalid")
+    except LLMUnavailableError:
+        pass
+    time.sleep(0.06)
+    assert asyncio.run(consume("a b c", 1)) == ["a"]
+    assert breaker.state == "half-open" and llm.invoke("ok") == "ok"
+    try:
+        asyncio.run(consume("a invalid", 5))
+        assert False
+    except LLMUnavailableError:
+        assert breaker.state == "open"
+    llm = gateway(max_concurrency=1, timeout=0.2)
+    llm._semaphore.acquire()
+    try:
+        asyncio.run(consume("a", 5))
+        assert False
+    except LLMUnavailableError:
+        assert llm.stats()["rejected"] == 1
+    threading.Timer(0.1, llm._release).start()
+    start = time.monotonic()
+    with patch.object(
+        llm._semaphore, "acquire", wraps=llm._semaphore.acquire
+    ) as acquire:
+        assert asyncio.run(consume("a b", 5)) == ["a", "b"]
+    assert 0.1 <= time.monotonic() - start < 0.2
+    assert acquire.call_count <= 3
+    get_gateway.cache_clear()
+    with patch("llm_prompting.get_llm") as get_llm:
+        get_gateway()
+    get_gateway.cache_clear()
+    assert get_llm.call_count == 1
+
+
+def test_build_context():
+    """тест отбора предложений фрагмента документа в контекст промта
+    по векторным представлениям и по общим с вопросом словам"""
+
+    text = """Единый деканат находится по адресу: г. Тюмень, ул. Ленина, д. 6, каб. 101.
+    Телефон: +7 (3452) 59-74-00. Справки выдаются через 3 дня.
+    Физическую культуру можно заменить посещением фитнес-клуба."""
+    sentences = split_sentences(text)
+    assert len(sentences) == 4
+    assert sentences[0].endswith("д. 6, каб. 101.")
+    assert split_sentences("Часы работы: пн.-пт. 9:00-18:00. Обед с 13:00.") == [
+        "Часы работы: пн.-пт. 9:00-18:00.",
+        "Обед с 13:00.",
+    ]
+
+    class KeywordEncoder:
+        keywords = ["деканат", "справк", "физическ"]
+
+        def encode(self, sentences, **kwargs):
+            return np.array(
+                [[float(k in s.lower()) for k in self.keywords] for s in sentences]
+            )
+
+    question, question_embedding = "Где деканат?", np.array([1.0, 0.0, 0.0])
+    cache = SentenceEmbeddingCache(max_chunks=1)
+    for _ in range(2):
+        context = build_context(
+            text, question, question_embedding, KeywordEncoder(), 40, cache, 0
+        )
+        assert context == "\n".join(sentences[:2])
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    context = build_context(
+        text, "Через сколько дней выдаются справки?", None, None, 10
+    )
+    assert context == sentences[2]
+    assert build_context(text, question, question_embedding, None, 1000) == text
+
+
+def test_metrics():
+    """тест вывода метрик в формате Prometheus"""
+
+    ENCODE_SECONDS.observe(0.02)
+    ANSWER_OUTCOMES.labels(outcome="answered").inc()
+    body, content_type = render_metrics()
+    assert content_type.startswith("text/plain")
+    assert 'qa_stage_seconds_bucket{le="0.025",stage="encode"}' in body.decode()
+    assert 'qa_answer_outcomes_total{outcome="answered"}' in body.decode()
+
+
+def test_pipeline_benchmark(tmp_path):
+    """тест офлайн-бенчмарка этапов ответа на вопрос с заглушками модели и LLM"""
+
+    output_path = tmp_path / "results.json"
+    assert pipeline(StubEncoder(0), None, 300, 20, 4, 0.01, 0, str(output_path))
+    results = json.loads(output_path.read_text())["results"]
+    assert results["qa_handler"]["statuses"] == {"200": 20}
+    assert results["encode"]["count"] == results["get_chunk"]["count"] == 20
+    slower = dict(results["qa_handler"], p99_ms=results["qa_handler"]["p99_ms"] * 2)
+    rows = compare_results(results, {"qa_handler": slower}, 0.2)
+    assert [row[1] for row in rows if row[-1]] == ["p99_ms"]
+
+
+def test_qa_batch(tmp_path):
+    """тест ответов на список вопросов запросом /qa/batch/, в том числе
+    на вопросы в другом регистре и вопрос, на который есть известный ответ,
+    с вычислением векторных представлений всех вопросов одним вызовом модели"""
+
+    encoder = StubEncoder(0)
+    texts = ["Справка об обучении готовится три дня.", "Сессия начинается в июне."]
+    chunks = InMemoryChunks(
+        [
+            Chunk(id=i, confluence_url=f"url{i}", text=text)
+            for i, text in enumerate(texts)
+        ],
+        encoder.encode([CachedEncoder.normalize(text) for text in texts]),
+        str(tmp_path),
+    )
+    known_question = "Где находится  деканат?"
+    known_answers = KnownAnswers(0.99)
+    known_answers.replace(
+        encoder.encode([CachedEncoder.normalize(known_question)]),
+        [("Деканат находится в корпусе 1", "url9")],
+    )
+
+    async def ask(batches: list) -> list[tuple[int, dict | None]]:
+        responses = []
+        async with TestClient(TestServer(app)) as client:
+            for questions in batches:
+                async with client.post(
+                    "/qa/batch/", json={"questions": questions}
+                ) as response:
+                    body = await response.json() if response.status == 200 else None
+                    responses.append((response.status, body))
+        return responses
+
+    main_encoder = main.encoder_model
+    questions = [texts[1].upper(), texts[0], known_question.lower(), texts[1]]
+    with pipeline_app(encoder, stub_llm_gateway(0, 0), chunks=chunks) as app:
+        with patch.object(main, "known_answers", known_answers), patch.object(
+            encoder, "encode", wraps=encoder.encode
+        ) as encode:
+            answered, invalid, empty = asyncio.run(ask([questions, "вопрос", []]))
+            question_cache = main.question_encoder.stats()
+    assert main.encoder_model is main_encoder
+    assert encode.call_count == 1 and question_cache["misses"] == 0
+    assert answered[0] == 200 and invalid[0] == 400 and empty == (200, {"results": []})
+    results = answered[1]["results"]
+    assert [r["confluence_url"] for r in results] == ["url1", "url0", "url9", "url1"]
+    assert [r["status"] for r in results] == [
+        "answered",
+        "answered",
+        "known",
+        "answered",
+    ]
+    assert results[2]["answer"] == "Деканат находится в корпусе 1"
+
+
+def test_known_answers():
+    """тест отбора и выдачи известных ответов на похожие вопросы"""
+
+    rng = np.random.default_rng(0)
+    base = normalize_rows(rng.normal(size=(3, 1024)))
+    near = normalize_rows(base[0] + rng.normal(scale=0.005, size=1024).reshape(1, -1))
+    candidates = np.vstack([base[1], near, base[1], base[2]])
+    assert deduplicate(base[:1], candidates, 0.95) == [0, 3]
+    known_answers = KnownAnswers(0.95)
+    assert len(known_answers) == 0 and known_answers.get(base[0]) is None
+    known_answers.replace(base[:2] * 3, [("ответ 0", "url0"), ("ответ 1", "url1")])
+    assert known_answers.get(near[0]) == ("ответ 0", "url0")
+    assert known_answers.get(base[2]) is None
+    assert known_answers.stats() == {"hits": 1, "misses": 2, "size": 2}
+
+
+def test_plan_reindex():
+    """тест выбора страниц для инкрементальной переиндексации по номерам версий"""
+
+    class FakeConfluence:
+        def cql(self, query, start=0, limit=None, expand=None):
+            pages = [
+                {"content": {"id": "1", "version": {"number": 3}, "ancestors": []}},
+                {
+                    "content": {
+                        "id": "2",
+                        "version": {"number": 1},
+                        "ancestors": [{"id": "1"}],
+                    }
+                },
+                {
+                    "content": {
+                        "id": "3",
+                        "version": {"number": 5},
+                        "ancestors": [{"id": "1"}],
+                    }
+                },
+                {"content": {"id": "4", "version": {"number": 2}, "ancestors": []}},
+            ]
+            return {"results": pages[start : start + limit]}
+
+    versions = get_leaf_page_versions(FakeConfluence(), ConfluenceCrawler(1, 0, 0, 0))
+    assert versions == {"2": 1, "3": 5, "4": 2}
+    indexed = {"2": (1, "hash2"), "3": (4, "hash3"), "5": (1, "hash5")}
+    assert plan_reindex(versions, indexed) == (["3", "4"], ["5"])
+    # страница без текста с прежним номером версии повторно не загружается
+    assert plan_reindex(versions, indexed | {"4": (2, None)}) == (["3"], ["5"])
+    assert plan_reindex(versions, {}) == (["2", "3", "4"], [])
+
+
+def test_copy_payload():
+    """тест записи строк таблицы chunk в двоичном формате COPY"""
+
+    embedding = np.array([0.5, -1.0, 2.0], dtype=np.float32)
+    payload = copy_payload([("url", None, 3, "текст", embedding)])
+    assert payload.startswith(COPY_HEADER) and payload.endswith(b"\xff\xff")
+    data = io.BytesIO(payload[len(COPY_HEADER) : -2])
+    assert struct.unpack(">h", data.read(2))[0] == 5
+    fields = []
+    for _ in range(5):
+        length = struct.unpack(">i", data.read(4))[0]
+        fields.append(None if length == -1 else data.read(length))
+    assert data.read() == b""
+    assert fields[0] == b"url" and fields[1] is None
+    assert struct.unpack(">i", fields[2])[0] == 3
+    assert fields[3].decode() == "текст"
+    assert struct.unpack(">HH", fields[4][:4]) == (3, 0)
+    assert np.frombuffer(fields[4][4:], dtype=">f4").tolist() == [0.5, -1.0, 2.0]
+
+
+def test_page_crawling():
+    """тест параллельного обхода страниц локального заменителя Confluence
+    с ограничением частоты запросов и повторными попытками при ответах 429 и 503,
+    в том числе при загрузке PDF-файла страницы"""
+
+    lock = threading.Lock()
+    state = {"in_flight": 0, "max_in_flight": 0, "failed": set(), "downloads": 0}
+    pdf = (
+        b"%PDF-1.4\n1 0 obj<</Type/Catalog/Pages 2 0 R>>endobj\n"
+        b"2 0 obj<</Type/Pages/Kids[3 0 R]/Count 1>>endobj\n"
+        b"3 0 obj<</Type/Page/Parent 2 0 R/MediaBox[0 0 200 50]/Contents 4 0 R"
+        b"/Resources<</Font<</F1<</Type/Font/Subtype/Type1/BaseFont/Helvetica>>>>>>>>"
+        b"endobj\n4 0 obj<</Length 36>>stream\n"
+        b"BT /F1 12 Tf 10 20 Td (pdf 7) Tj ET\nendstream endobj\n"
+        b"trailer<</Root 1 0 R>>\nstartxref\n0\n%%EOF"
+    )
+    pages = [
+        {"content": {"id": str(i), "version": {"number": i}, "ancestors": []}}
+        for i in range(1, 13)
+    ]
+
+    class FakeConfluenceHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                state["in_flight"] += 1
+                state["max_in_flight"] = max(state["max_in_flight"], state["in_flight"])
+                first = self.path not in state["failed"]
+                state["failed"].add(self.path)
+                state["downloads"] += self.path.startswith("/download/")
+            time.sleep(0.02)
+            retried = ("start=0", "/content/3?", "/download/")
+            if first and any(part in self.path for part in retried):
+                status, body = (429 if "search" in self.path else 503), {}
+            elif self.path.startswith("/download/"):
+                status, body = 200, pdf
+            elif self.path.startswith("/rest/api/search"):
+                start = int(self.path.split("start=")[1].split("&")[0])
+                status, body = 200, {"results": pages[start : start + 5]}
+            else:
+                page_id = self.path.split("/content/")[1].split("?")[0]
+                text = (
+                    "" if page_id in ("5", "7") else f"<p>{'текст ' * 20}{page_id}</p>"
+                )
+                base = f"http://127.0.0.1:{self.server.server_port}"
+                links = {"base": base, "webui": f"/pages/{page_id}"}
+                if page_id == "7":
+                    links["download"] = "/download/attachments/7/doc.pdf?version=1"
+                status, body = 200, {
+                    "_links": links,
+                    "body": {"export_view": {"value": text}},
+                }
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.end_headers()
+            self.wfile.write(
+                body if isinstance(body, bytes) else json.dumps(body).encode()
+            )
+            with lock:
+                state["in_flight"] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeConfluenceHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        confluence = Confluence(url=f"http://127.0.0.1:{server.server_port}", token="t")
+        crawler = ConfluenceCrawler(concurrency=4, rate=0, retries=2, backoff=0.01)
+        versions = get_leaf_page_versions(confluence, crawler)
+        assert versions == {str(i): i for i in range(1, 13)}
+        contents = crawler.map(
+            partial(get_document_content_by_id, confluence, crawler), list(versions)
+        )
+    finally:
+        server.shutdown()
+    assert [link for _, link in contents] == [
+        f"http://127.0.0.1:{server.server_port}/pages/{i}" for i in range(1, 13)
+    ]
+    assert contents[2][0].strip().endswith("3") and contents[4][0] == ""
+    assert contents[6][0] == "pdf 7" and state["downloads"] == 2
+    assert crawler.retried >= 1 and 1 < state["max_in_flight"] <= 4
+    calls = []
+
+    def flaky(status_code: int) -> str:
+        calls.append(status_code)
+        if len(calls) < 3:
+            response = requests.Response()
+            response.status_code = status_code
+            raise requests.HTTPError(response=response)
+        return "ok"
+
+    assert crawler.call(flaky, 503) == "ok" and calls == [503, 503, 503]
+    calls.clear()
+    try:
+        crawler.call(flaky, 404)
+        assert False
+    except requests.HTTPError:
+        assert calls == [404]
+    limiter = RateLimiter(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.09
+
+
+def test_qa_stream(tmp_path):
+    """тест завершающей строки потокового ответа /qa/stream/ при полной,
+    обрезанной по лимиту токенов и прерванной ошибкой генерации"""
+
+    encoder = StubEncoder(0)
+    texts = ["Справка об обучении готовится три дня."]
+    chunks = InMemoryChunks(
+        [Chunk(id=0, confluence_url="url0", text=texts[0])],
+        encoder.encode(texts),
+        str(tmp_path),
+    )
+
+    async def stream(context: str, question: str, finish_reason: str | None):
+        yield LLMAnswer("Справка готовится")
+        if finish_reason is None:
+            raise LLMUnavailableError("LLM response deadline exceeded")
+        yield LLMAnswer(" три дня", finish_reason=finish_reason)
+
+    async def ask(finish_reasons: list) -> list[tuple[list[dict], int]]:
+        responses = []
+        async with TestClient(TestServer(app)) as client:
+            for finish_reason in finish_reasons:
+                streamed = partial(stream, finish_reason=finish_reason)
+                with patch.object(main, "astream_answer", streamed):
+                    async with client.post(
+                        "/qa/stream/", json={"question": texts[0]}
+                    ) as response:
+                        text = await response.text()
+                lines = [json.loads(line) for line in text.splitlines()]
+                responses.append((lines, cache.stats()["entries"]))
+        return responses
+
+    cache = SemanticAnswerCache(threshold=0.95, max_size=8, ttl=60)
+    with pipeline_app(encoder, stub_llm_gateway(0, 0), chunks=chunks) as app:
+        with patch.object(main, "answer_cache", cache):
+            failed, stopped, complete = asyncio.run(ask([None, "length", "stop"]))
+    assert failed == (
+        [{"delta": "Справка готовится"}, {"answer": "", "confluence_url": None}],
+        0,
+    )
+    assert stopped[0][-1] == {"answer": "", "confluence_url": None} and stopped[1] == 0
+    assert [line.get("delta") for line in complete[0][:-1]] == [
+        "Справка готовится",
+        " три дня",
+    ]
+    assert complete[1] == 1
+    assert complete[0][-1] == {
+        "answer": "Справка готовится три дня",
+        "confluence_url": "url0",
+    }
+
+
+def test_startup_retries():
+    """тест повторов этапа загрузки микросервиса при ошибке"""
+
+    attempts = []
+
+    async def flaky_stage():
+        attempts.append(time.monotonic())
+        if len(attempts) < 3:
+            raise ConnectionError("database is starting up")
+
+    async def failing_stage():
+        raise ConnectionError("database is unavailable")
+
+    async def run_stages() -> Exception | None:
+        await main.run_startup_stage("flaky", flaky_stage)
+        try:
+            await main.run_startup_stage("failing", failing_stage)
+        except ConnectionError as e:
+            return e
+
+    progress = StartupProgress()
+    with patch.object(main, "startup_progress", progress), patch.multiple(
+        Config, STARTUP_RETRIES=2, STARTUP_RETRY_BACKOFF=0.01
+    ):
+        error = asyncio.run(run_stages())
+    assert len(attempts) == 3 and attempts[2] - attempts[1] >= 0.02
+    stages = progress.report()["stages"]
+    assert stages["flaky"]["status"] == "done"
+    assert stages["failing"]["status"] == "failed" and error is not None
+
+
+def test_prefork_restarts():
+    """тест перезапуска завершающихся процессов с задержкой и ограничением
+    количества перезапусков подряд"""
+
+    def crash(worker_id: int):
+        raise RuntimeError(f"worker {worker_id} failed to start")
+
+    exited = []
+    handlers = signal.getsignal(signal.SIGINT), signal.getsignal(signal.SIGTERM)
+    start = time.monotonic()
+    try:
+        serve_prefork(
+            crash, 2, on_worker_exit=exited.append, restart_delay=0.02, max_restarts=2
+        )
+        assert False
+    except RuntimeError:
+        pass
+    finally:
+        signal.signal(signal.SIGINT, handlers[0])
+        signal.signal(signal.SIGTERM, handlers[1])
+    # первый процесс: запуск и 2 перезапуска; второй останавливается вместе с ним
+    assert 4 <= len(exited) <= 6
+    assert time.monotonic() - start >= 0.02 + 0.04
+
+
+def test_stream_generation():
+    """тест причины завершения потоковой генерации по частям ответа клиента GigaChat"""
+
+    payloads = []
+
+    class FakeClient:
+        async def astream(self, payload: dict):
+            payloads.append(payload)
+            for content, finish_reason in [
+                ("Справка", None),
+                (" готовится", None),
+                ("", finish_reason_last),
+            ]:
+                yield ChatCompletionChunk.model_validate(
+                    {
+                        "choices": [
+                            {
+                                "delta": {"role": "assistant", "content": content},
+                                "index": 0,
+                                "finish_reason": finish_reason,
+                            }
+                        ],
+                        "created": 0,
+                        "model": "GigaChat",
+                        "object": "chat.completion",
+                    }
+                )
+
+    class FakeLLM:
+        _client = FakeClient()
+
+        def _build_payload(self, messages: list[str]) -> dict:
+            return {"messages": [{"role": "user", "content": m} for m in messages]}
+
+    async def collect() -> list[LLMAnswer]:
+        query = {"context": "Справка готовится три дня.", "question": "Когда?"}
+        return [part async for part in astream_generation(query)]
+
+    with patch("llm_prompting.get_llm", FakeLLM):
+        finish_reason_last = "length"
+        stopped = asyncio.run(collect())
+        finish_reason_last = "stop"
+        complete = asyncio.run(collect())
+    assert "Когда?" in payloads[0]["messages"][0]["content"]
+    assert "".join(part.text for part in stopped) == "Справка готовится"
+    assert stopped[-1].finish_reason == "length" and not stopped[-1].complete
+    assert complete[-1].finish_reason == "stop" and complete[-1].complete
+
+
+def test_vector_search_index():
+    """тест создания дополнительного HNSW-индекса только для используемого
+    режима поиска и удаления индексов других режимов"""
+
+    metadata = MetaData()
+    table = Table(
+        "chunk",
+        metadata,
+        Column("id", Integer, primary_key=True),
+        Column("embedding", Text),
+    )
+    indexes = {
+        "half": Index("ix_chunk_half", table.c.embedding),
+        "binary": Index("ix_chunk_binary", table.c.id, table.c.embedding),
+    }
+    engine = create_engine("sqlite://")
+    metadata.create_all(engine)
+    built = {}
+    with patch("confluence_retrieving.VECTOR_SEARCH_INDEXES", indexes):
+        for mode in ["binary", "binary", "half", "full"]:
+            with patch.object(Config, "VECTOR_SEARCH_MODE", mode):
+                prepare_vector_search_index(engine)
+            built[mode] = {
+                index["name"] for index in inspect(engine).get_indexes("chunk")
+            }
+    assert built == {
+        "binary": {"ix_chunk_binary"},
+        "half": {"ix_chunk_half"},
+        "full": set(),
+    }